@@ -6,14 +6,23 @@ import logging
 import argparse
 import yaml
 import re
-from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
-from azure.mgmt.subscription import SubscriptionClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.managementgroups import ManagementGroupsAPI
-from pynetbox import api
-from pynetbox.core.query import RequestError
-import requests
+import importlib.util
+
+# Les SDK Azure, pynetbox et requests sont importés dans les fonctions qui les
+# utilisent : leur chargement coûte plusieurs secondes, inutile pour --help
+# ou --check-config.
+
+# Modules partagés avec config/azure-sync.py (armid, ...)
+SHARED_MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+def load_shared_module(name):
+    """Charge config/<name>.py (une seule fois) sans modifier sys.path"""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SHARED_MODULES_DIR, f'{name}.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
 
 class AzureNetboxConfig:
     """Classe pour gérer la configuration depuis un fichier YAML"""
@@ -119,17 +128,22 @@ class AzureNetboxConfig:
     def should_process_resource(self, resource_name, resource_group, region):
         """Vérifie si une ressource doit être traitée selon les filtres"""
         filters = self.get_filters_config()
+        # Régions et groupes de ressources Azure ne tiennent pas compte de la casse
+        region = (region or '').casefold()
+        resource_group = (resource_group or '').casefold()
         
         # Filtre par région
-        if filters['regions']['include'] and region not in filters['regions']['include']:
+        if filters['regions']['include'] and region not in {r.casefold() for r in filters['regions']['include']}:
             return False
-        if filters['regions']['exclude'] and region in filters['regions']['exclude']:
+        if filters['regions']['exclude'] and region in {r.casefold() for r in filters['regions']['exclude']}:
             return False
         
         # Filtre par groupe de ressources
-        if filters['resource_groups']['include'] and resource_group not in filters['resource_groups']['include']:
+        if filters['resource_groups']['include'] and \
+                resource_group not in {rg.casefold() for rg in filters['resource_groups']['include']}:
             return False
-        if filters['resource_groups']['exclude'] and resource_group in filters['resource_groups']['exclude']:
+        if filters['resource_groups']['exclude'] and \
+                resource_group in {rg.casefold() for rg in filters['resource_groups']['exclude']}:
             return False
         
         # Filtre par nom de ressource (regex)
@@ -142,6 +156,42 @@ class AzureNetboxConfig:
                 return False
         
         return True
+    
+    def validate(self):
+        """Vérifie la configuration sans appeler Azure ni Netbox, retourne la liste des erreurs"""
+        errors = []
+        for section in ('netbox', 'azure', 'mapping', 'tags', 'custom_fields',
+                        'logging', 'filters', 'ssl'):
+            if not isinstance(self.config.get(section), dict):
+                errors.append(f"Section '{section}' manquante")
+        if errors:
+            return errors
+        
+        if not self.config['netbox'].get('url') or not self.config['netbox'].get('token'):
+            errors.append("URL et token Netbox requis")
+        
+        method = self.config['azure'].get('authentication', {}).get('method', 'default')
+        if method not in ('default', 'interactive'):
+            errors.append(f"Méthode d'authentification inconnue : {method}")
+        
+        if not hasattr(logging, str(self.config['logging'].get('level', '')).upper()):
+            errors.append(f"Niveau de log inconnu : {self.config['logging'].get('level')}")
+        
+        if 'max_name_length' not in self.config['mapping']:
+            errors.append("Clé 'mapping.max_name_length' manquante")
+        
+        if 'sync_tag' not in self.config['tags']:
+            errors.append("Clé 'tags.sync_tag' manquante")
+        
+        names = self.config['filters'].get('resource_names', {})
+        for key in ('include_patterns', 'exclude_patterns'):
+            for pattern in names.get(key) or []:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    errors.append(f"Regex invalide dans filters.resource_names.{key} '{pattern}' : {e}")
+        
+        return errors
 
 def truncate_name(name, config):
     """Tronque un nom selon la configuration"""
@@ -159,6 +209,8 @@ def truncate_name(name, config):
 
 def get_azure_credentials(config):
     """Obtient les credentials Azure selon la configuration"""
+    from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
+    
     auth_method = config.get_azure_config()['authentication']['method']
     
     if auth_method == 'interactive':
@@ -193,6 +245,7 @@ def get_subscriptions_to_process(credential, config):
 def get_management_group_subscriptions(credential, management_group_id=None, management_group_name=None):
     """Obtient tous les abonnements d'un groupe de gestion"""
     logger.info("Récupération des abonnements du groupe de gestion")
+    from azure.mgmt.managementgroups import ManagementGroupsAPI
     
     try:
         mg_client = ManagementGroupsAPI(credential)
@@ -243,6 +296,8 @@ def get_management_group_subscriptions(credential, management_group_id=None, man
 def get_azure_subscriptions(credential):
     """Obtient tous les abonnements Azure accessibles"""
     logger.info("Récupération des abonnements Azure")
+    from azure.mgmt.subscription import SubscriptionClient
+    
     subscription_client = SubscriptionClient(credential)
     subscriptions = list(subscription_client.subscriptions.list())
     logger.info(f"{len(subscriptions)} abonnements trouvés")
@@ -251,6 +306,10 @@ def get_azure_subscriptions(credential):
 def get_vnets_and_subnets(subscription_id, credential, config):
     """Obtient tous les VNets et sous-réseaux d'un abonnement"""
     logger.info(f"Récupération des VNets pour l'abonnement {subscription_id}")
+    from azure.mgmt.network import NetworkManagementClient
+    
+    armid = load_shared_module('armid')
+    
     network_client = NetworkManagementClient(credential, subscription_id)
     
     vnets = list(network_client.virtual_networks.list_all())
@@ -259,14 +318,14 @@ def get_vnets_and_subnets(subscription_id, credential, config):
     vnet_data = []
     for vnet in vnets:
         # Appliquer les filtres
-        if not config.should_process_resource(vnet.name, vnet.id.split('/')[4], vnet.location):
+        if not config.should_process_resource(vnet.name, armid.resource_group(vnet.id), vnet.location):
             logger.info(f"VNet {vnet.name} ignoré par les filtres")
             continue
             
         vnet_info = {
             'name': vnet.name,
             'id': vnet.id,
-            'resource_group': vnet.id.split('/')[4],
+            'resource_group': armid.resource_group(vnet.id),
             'location': vnet.location,
             'address_space': [prefix for prefix in vnet.address_space.address_prefixes],
             'subnets': []
@@ -287,6 +346,9 @@ def get_vnets_and_subnets(subscription_id, credential, config):
 
 def sync_to_netbox(all_network_data, config):
     """Synchronise les données réseau Azure vers Netbox"""
+    import requests
+    from pynetbox import api
+    
     netbox_config = config.get_netbox_config()
     mapping_config = config.get_mapping_config()
     
@@ -414,6 +476,8 @@ def parse_arguments():
     parser.add_argument('--netbox-token', help='Token API Netbox (override config)')
     parser.add_argument('--interactive', action='store_true', 
                        help='Authentification interactive Azure (override config)')
+    parser.add_argument('--check-config', action='store_true',
+                       help='Valide la configuration et quitte (sans charger les SDK Azure/Netbox)')
     return parser.parse_args()
 
 def main():
@@ -431,10 +495,16 @@ def main():
     if args.interactive:
         config.config['azure']['authentication']['method'] = 'interactive'
     
-    # Validation des paramètres Netbox
-    netbox_config = config.get_netbox_config()
-    if not netbox_config['url'] or not netbox_config['token']:
-        logger.error("URL et token Netbox requis")
+    # Validation de la configuration
+    errors = config.validate()
+    if args.check_config:
+        for error in errors:
+            print(f"[ERR] {error}", file=sys.stderr)
+        print(f"{args.config} : {'OK' if not errors else f'{len(errors)} erreur(s)'}")
+        sys.exit(1 if errors else 0)
+    if errors:
+        for error in errors:
+            logger.error(error)
         sys.exit(1)
     
     try:
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Free address block finder over the discovered VNets.
+
+Every VNet address space (and subnet) of an inventory snapshot is turned into
+an integer interval; overlapping intervals are merged into a sorted index per
+IP version, so free blocks inside a container are the gaps between two
+neighbours and an allocation is a walk over those gaps, aligned on the
+requested prefix length.
+
+CLI:
+    python allocator.py snap.ndjson.gz 10.0.0.0/8 --prefixlen 24 --count 4
+    python allocator.py snap.ndjson.gz 10.0.0.0/8 --largest
+    python allocator.py snap.ndjson.gz 10.0.0.0/8 --prefixlen 24 --netbox --reserve --description "Team X"
+        (--netbox also avoids the prefixes already in Netbox; NETBOX_URL / NETBOX_TOKEN)
+"""
+
+import argparse
+import bisect
+import ipaddress
+import json
+import os
+import sys
+import time
+
+class IntervalIndex:
+    """Merged, sorted [start, end] integer ranges of used networks, one list per IP version"""
+
+    def __init__(self, networks=()):
+        self._raw = {4: [], 6: []}
+        for network in networks:
+            self.add(network)
+        self._build()
+
+    def add(self, network):
+        network = ipaddress.ip_network(network, strict=False)
+        self._raw[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        self._built = False
+
+    def _build(self):
+        self.starts, self.ends = {}, {}
+        for version, ranges in self._raw.items():
+            merged = []
+            for start, end in sorted(ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    if end > merged[-1][1]:
+                        merged[-1][1] = end
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, _ in merged]
+            self.ends[version] = [end for _, end in merged]
+        self._built = True
+
+    def gaps(self, container):
+        """Yield the free (start, end) integer ranges inside a container network"""
+        if not self._built:
+            self._build()
+        container = ipaddress.ip_network(container, strict=False)
+        version = container.version
+        starts, ends = self.starts[version], self.ends[version]
+        low, high = int(container.network_address), int(container.broadcast_address)
+        # First used range that may touch the container
+        index = max(bisect.bisect_right(starts, low) - 1, 0)
+        cursor = low
+        while index < len(starts) and starts[index] <= high:
+            if ends[index] >= cursor:
+                if starts[index] > cursor:
+                    yield cursor, starts[index] - 1
+                cursor = ends[index] + 1
+            index += 1
+        if cursor <= high:
+            yield cursor, high
+
+    def allocate(self, container, prefixlen, count=1):
+        """Up to `count` free networks of /prefixlen inside the container, lowest first"""
+        container = ipaddress.ip_network(container, strict=False)
+        network_class = ipaddress.IPv4Network if container.version == 4 else ipaddress.IPv6Network
+        size = 1 << (container.max_prefixlen - prefixlen)
+        result = []
+        for start, end in self.gaps(container):
+            candidate = -(-start // size) * size  # align up
+            while candidate + size - 1 <= end and len(result) < count:
+                result.append(network_class((candidate, prefixlen)))
+                candidate += size
+            if len(result) >= count:
+                break
+        return result
+
+    def largest(self, container):
+        """Largest aligned free network inside the container (None if full)"""
+        container = ipaddress.ip_network(container, strict=False)
+        network_class = ipaddress.IPv4Network if container.version == 4 else ipaddress.IPv6Network
+        best_start, best_size = None, 0
+        for start, end in self.gaps(container):
+            # Biggest power of two fitting the gap; alignment may require halving it
+            size = 1 << ((end - start + 1).bit_length() - 1)
+            while size > best_size:
+                aligned = -(-start // size) * size
+                if aligned + size - 1 <= end:
+                    best_start, best_size = aligned, size
+                    break
+                size >>= 1
+        if best_start is None:
+            return None
+        return network_class((best_start, container.max_prefixlen - best_size.bit_length() + 1))
+
+def used_networks(all_network_data):
+    """Address spaces and subnet prefixes of discovered subscriptions"""
+    for subscription_data in all_network_data:
+        for vnet in subscription_data['vnets']:
+            yield from vnet['address_space']
+            for subnet in vnet['subnets']:
+                if subnet.get('address_prefix'):
+                    yield subnet['address_prefix']
+
+def index_from_snapshot(path):
+    """Interval index of a snapshot, reading only its VNet and subnet records"""
+    from snapshot import SnapshotReader
+
+    index = IntervalIndex()
+    for kind, record in SnapshotReader(path).records():
+        if kind == 'V':
+            for address_space in record['address_space']:
+                index.add(address_space)
+        elif kind == 'N' and record['address_prefix']:
+            index.add(record['address_prefix'])
+    return index
+
+def add_netbox_prefixes(index, nb, container):
+    """Also treat the Netbox prefixes inside the container (reserved ones included) as used"""
+    for prefix in nb.ipam.prefixes.filter(within=str(container), brief=True):
+        index.add(str(prefix.prefix))
+
+def reserve(nb, networks, description, tags=None):
+    """Create the allocated networks in Netbox with status 'reserved' (one bulk call)"""
+    return nb.ipam.prefixes.create([
+        {'prefix': str(network), 'status': 'reserved', 'description': description, 'tags': tags or []}
+        for network in networks
+    ])
+
+def main():
+    parser = argparse.ArgumentParser(description='Find free subnets not overlapping any discovered VNet')
+    parser.add_argument('snapshot', help='Inventory snapshot written by azure-sync.py (snapshot.path)')
+    parser.add_argument('container', help='Address space to allocate from, e.g. 10.0.0.0/8')
+    parser.add_argument('--prefixlen', type=int, default=24, help='Size of the wanted blocks (default: 24)')
+    parser.add_argument('--count', type=int, default=1, help='Number of blocks (default: 1)')
+    parser.add_argument('--largest', action='store_true', help='Print the largest free block instead')
+    parser.add_argument('--netbox', action='store_true',
+                        help='Also avoid the prefixes already in Netbox (NETBOX_URL/NETBOX_TOKEN)')
+    parser.add_argument('--reserve', action='store_true', help='Create the blocks in Netbox as reserved prefixes')
+    parser.add_argument('--description', default='Reserved by allocator.py', help='Description of reserved prefixes')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = index_from_snapshot(args.snapshot)
+    loaded = time.perf_counter()
+
+    nb = None
+    if args.netbox or args.reserve:
+        import pynetbox
+
+        url, token = os.environ.get('NETBOX_URL'), os.environ.get('NETBOX_TOKEN')
+        if not url or not token:
+            print("NETBOX_URL and NETBOX_TOKEN must be set", file=sys.stderr)
+            sys.exit(2)
+        nb = pynetbox.api(url, token=token)
+        add_netbox_prefixes(index, nb, args.container)
+
+    query = time.perf_counter()
+    if args.largest:
+        block = index.largest(args.container)
+        networks = [block] if block else []
+    else:
+        networks = index.allocate(args.container, args.prefixlen, args.count)
+    elapsed_ms = (time.perf_counter() - query) * 1000
+
+    print(json.dumps([str(network) for network in networks], indent=2))
+    print(f"(index {loaded - start:.2f}s, query {elapsed_ms:.2f}ms)", file=sys.stderr)
+    if not networks or (not args.largest and len(networks) < args.count):
+        print(f"Only {len(networks)} free block(s) found in {args.container}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.reserve:
+        reserve(nb, networks, args.description)
+        print(f"Reserved {len(networks)} prefix(es) in Netbox", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Parsed Azure Resource Manager IDs.
+
+ARM IDs are case-insensitive ("resourceGroups" vs "resourcegroups", VM ids
+returned upper-cased by one API and not the other), so a ResourceId compares
+and hashes on its interned, case-folded form. parse() caches the parsed
+objects, so matching NICs to subnets and VMs splits each distinct id once.
+
+    /subscriptions/<sub>/resourceGroups/<rg>/providers/<namespace>/<type>/<name>[/<child type>/<child name>...]
+"""
+
+import sys
+from functools import lru_cache
+
+class ResourceId:
+    """One ARM resource ID; original spelling kept in `id`, case-folded in `key`"""
+
+    __slots__ = ('id', 'key', 'subscription_id', 'resource_group', 'provider', 'types', 'names')
+
+    def __init__(self, resource_id):
+        self.id = resource_id
+        self.key = sys.intern(resource_id.rstrip('/').casefold())
+        segments = resource_id.strip('/').split('/')
+        self.subscription_id = segments[1] if len(segments) > 1 else None
+        self.resource_group = segments[3] if len(segments) > 3 else None
+        self.provider = None
+        self.types = []
+        self.names = []
+        if len(segments) > 5 and segments[4].casefold() == 'providers':
+            self.provider = segments[5]
+            rest = segments[6:]
+            self.types = rest[0::2]
+            self.names = rest[1::2]
+
+    @property
+    def type(self):
+        """Full resource type, e.g. 'Microsoft.Network/virtualNetworks/subnets'"""
+        return '/'.join([self.provider] + self.types) if self.provider else None
+
+    @property
+    def name(self):
+        """Name of the resource itself (last segment)"""
+        return self.names[-1] if self.names else None
+
+    @property
+    def parent(self):
+        """ResourceId of the parent resource (VNet of a subnet), None for top-level resources"""
+        if len(self.names) < 2:
+            return None
+        return parse(self.id.rstrip('/').rsplit('/', 2)[0])
+
+    def __eq__(self, other):
+        if isinstance(other, ResourceId):
+            return self.key == other.key
+        if isinstance(other, str):
+            return self.key == other.rstrip('/').casefold()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return self.id
+
+    def __repr__(self):
+        return f"ResourceId({self.id!r})"
+
+@lru_cache(maxsize=65536)
+def parse(resource_id):
+    """Cached ResourceId of an ARM ID string"""
+    return ResourceId(resource_id)
+
+def resource_group(resource_id):
+    """Resource group of an ARM ID string"""
+    return parse(resource_id).resource_group
@@ -19,6 +19,7 @@
 - **Usage**: Run as `python azure-sync.py --config /path/to/config.yaml`. If `--config` is omitted, it defaults to `./config.yaml`.
 - **Dependencies**: Add `pyyaml` (install via `pip install pyyaml`).
 - **Filters Application**: Added a new function `apply_filters` to filter `vnets_data` based on config before processing devices and syncing.
+- **Lazy Imports**: `azure.*`, `pynetbox` and `requests` are imported inside the functions that use them, so `--help` and `--check-config` start in well under a second.
 - **Other**: The script is economical and mirrors the original structure. I've ensured it's complete and runnable.
 
 ### Full Updated Script
@@ -32,14 +33,19 @@ import logging
 import argparse
 import yaml
 import re
-import requests
-from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
-from azure.mgmt.subscription import SubscriptionClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.managementgroups import ManagementGroupsAPI
-from pynetbox import api
-from pynetbox.core.query import RequestError
+import time
+import inspect
+import functools
+import contextlib
+import threading
+from types import SimpleNamespace
+
+from lease import LeaseHeld, LeaseLost
+from runreport import RunReport
+
+# The Azure SDKs, pynetbox and requests are imported inside the functions that
+# use them: together they take seconds to load, which --help, --check-config
+# and short cron/Job invocations should not have to pay for.
 
 def load_config(config_path):
     """Load configuration from YAML file"""
@@ -57,6 +63,78 @@ def setup_logging(config):
     logging.basicConfig(level=level, format=log_format)
     return logging.getLogger(__name__)
 
+# Azure SDK clients per (kind, credential, subscription) and Netbox objects
+# that rarely change (tags, sites, device types/roles, custom fields) per Netbox
+# instance. Both live for the whole process, so daemon cycles and tenants of the
+# same target reuse HTTP pools and skip the bootstrap lookups; the Netbox cache
+# is cleared when a cycle fails.
+_azure_clients = {}
+_netbox_cache = {}
+_netbox_cache_lock = threading.RLock()  # concurrent tenants must not create the same object twice
+
+# Netbox objects prefetched through GraphQL for the current run (nbgraphql.py),
+# per thread since --tenants syncs several runs at once
+_netbox_state = threading.local()
+
+def get_network_client(credential, subscription_id):
+    """Return the (cached) NetworkManagementClient of a subscription"""
+    from azure.mgmt.network import NetworkManagementClient
+
+    key = ('network', id(credential), subscription_id)
+    if key not in _azure_clients:
+        _azure_clients[key] = NetworkManagementClient(credential, subscription_id)
+    return _azure_clients[key]
+
+def get_compute_client(credential, subscription_id):
+    """Return the (cached) ComputeManagementClient of a subscription"""
+    from azure.mgmt.compute import ComputeManagementClient
+
+    key = ('compute', id(credential), subscription_id)
+    if key not in _azure_clients:
+        _azure_clients[key] = ComputeManagementClient(credential, subscription_id)
+    return _azure_clients[key]
+
+def prefetched(kind, key):
+    """Object from the GraphQL prefetch, None when not prefetched or not found (then ask REST)"""
+    state = getattr(_netbox_state, 'state', None)
+    if state is None:
+        return None
+    return getattr(state, kind).get(key)
+
+def prefetch_netbox_state(nb, config):
+    """Load the Netbox objects the sync compares in bulk through GraphQL (netbox.graphql_prefetch)"""
+    import nbgraphql
+
+    netbox_config = config['netbox']
+    if not netbox_config.get('graphql_prefetch'):
+        return
+    try:
+        _netbox_state.state, _ = nbgraphql.prefetch(nb, netbox_config['url'], netbox_config['token'],
+                                                    netbox_config.get('graphql_page_size', 1000))
+    except Exception as e:
+        logger.warning(f"GraphQL prefetch failed, using REST lookups: {str(e)}")
+        _netbox_state.state = None
+
+def clear_netbox_state():
+    _netbox_state.state = None
+
+def netbox_cached(kind, key_arg):
+    """Memoize a get_or_create_* helper in _netbox_cache, keyed by its Netbox instance and one of its arguments"""
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            key = (kind, arguments['nb'].base_url, arguments[key_arg])
+            if key not in _netbox_cache:
+                with _netbox_cache_lock:
+                    if key not in _netbox_cache:
+                        _netbox_cache[key] = func(*args, **kwargs)
+            return _netbox_cache[key]
+        return wrapper
+    return decorator
+
 def truncate_name(name, max_length):
     """
     Truncate a name by:
@@ -73,57 +151,46 @@ def truncate_name(name, max_length):
     
     return name
 
-def get_azure_credentials(method):
-    """Get Azure credentials based on method"""
-    if method == 'interactive':
-        logger.info("Using interactive browser authentication for Azure")
-        return InteractiveBrowserCredential()
-    else:
-        logger.info("Using default Azure credential chain")
-        return DefaultAzureCredential()
+def get_azure_credentials(method, authentication=None):
+    """
+    Azure credential of azure.authentication: the sources of `chain` (else
+    `method` alone) in order, behind the shared token cache (credentials.py)
+    """
+    import credentials
+
+    return credentials.from_config(method, authentication or {})
+
+def get_management_group_tree(credential, config):
+    """Management group hierarchy, from the local cache when fresh (see mgcache.py)"""
+    import mgcache
 
-def get_management_group_subscriptions(credential, management_group_id=None, management_group_name=None):
+    cache_config = config['azure'].get('management_group_cache', {})
+    return mgcache.get_tree(
+        credential,
+        cache_path=cache_config.get('path', '.azure-sync-mg-cache.json'),
+        ttl=cache_config.get('ttl', 86400),
+        max_workers=cache_config.get('max_workers', 8)
+    )
+
+def get_management_group_subscriptions(credential, management_group_id=None, management_group_name=None, config=None):
     """Get all subscriptions from a management group"""
     logger.info("Getting subscriptions from management group")
     
     try:
-        mg_client = ManagementGroupsAPI(credential)
-        
-        if management_group_name and not management_group_id:
-            logger.info(f"Looking for management group with name: {management_group_name}")
-            management_groups = mg_client.management_groups.list()
-            for mg in management_groups:
-                if mg.display_name == management_group_name:
-                    management_group_id = mg.name
-                    logger.info(f"Found management group ID: {management_group_id}")
-                    break
-            
-            if not management_group_id:
-                logger.error(f"Management group with name '{management_group_name}' not found")
-                return []
-        
-        mg_details = mg_client.management_groups.get(
-            group_id=management_group_id,
-            expand="children",
-            recurse=True
-        )
+        tree = get_management_group_tree(credential, config or {'azure': {}})
+        group_id = tree.resolve(management_group_id, management_group_name)
+        if not group_id:
+            logger.error(f"Management group '{management_group_id or management_group_name}' not found")
+            return []
+        logger.info(f"Found management group ID: {group_id}")
         
         subscriptions = []
-        
-        def extract_subscriptions(mg_node):
-            if hasattr(mg_node, 'children') and mg_node.children:
-                for child in mg_node.children:
-                    if child.type == "/subscriptions":
-                        subscription_info = type('obj', (object,), {
-                            'subscription_id': child.name,
-                            'display_name': child.display_name
-                        })
-                        subscriptions.append(subscription_info)
-                        logger.info(f"Found subscription: {child.display_name} ({child.name})")
-                    elif child.type == "/providers/Microsoft.Management/managementGroups":
-                        extract_subscriptions(child)
-        
-        extract_subscriptions(mg_details)
+        for subscription_id, display_name in tree.subscriptions_under(group_id):
+            subscriptions.append(type('obj', (object,), {
+                'subscription_id': subscription_id,
+                'display_name': display_name
+            }))
+            logger.info(f"Found subscription: {display_name} ({subscription_id})")
         
         logger.info(f"Found {len(subscriptions)} subscriptions in management group")
         return subscriptions
@@ -135,6 +202,8 @@ def get_management_group_subscriptions(credential, management_group_id=None, man
 def get_azure_subscriptions(credential):
     """Get all Azure subscriptions accessible by the credentials"""
     logger.info("Getting Azure subscriptions")
+    from azure.mgmt.subscription import SubscriptionClient
+
     subscription_client = SubscriptionClient(credential)
     subscriptions = list(subscription_client.subscriptions.list())
     logger.info(f"Found {len(subscriptions)} subscriptions")
@@ -143,56 +212,63 @@ def get_azure_subscriptions(credential):
 def get_vnets_and_subnets(subscription_id, credential):
     """Get all VNets and subnets in a subscription"""
     logger.info(f"Getting VNets and subnets for subscription {subscription_id}")
-    network_client = NetworkManagementClient(credential, subscription_id)
+    network_client = get_network_client(credential, subscription_id)
     
     vnets = list(network_client.virtual_networks.list_all())
     logger.info(f"Found {len(vnets)} VNets in subscription {subscription_id}")
     
-    vnet_data = []
-    for vnet in vnets:
-        vnet_info = {
-            'name': vnet.name,
-            'id': vnet.id,
-            'resource_group': vnet.id.split('/')[4],
-            'location': vnet.location,
-            'address_space': [prefix for prefix in vnet.address_space.address_prefixes],
-            'subnets': []
+    return [vnet_to_dict(vnet) for vnet in vnets]
+
+def vnet_to_dict(vnet):
+    """Convert an Azure VirtualNetwork into the vnet_info dict used by the sync"""
+    import armid
+    from peering import peerings_of
+
+    vnet_info = {
+        'name': vnet.name,
+        'id': vnet.id,
+        'resource_group': armid.resource_group(vnet.id),
+        'location': vnet.location,
+        'address_space': [prefix for prefix in vnet.address_space.address_prefixes],
+        'peerings': peerings_of(vnet),
+        'subnets': []
+    }
+    
+    for subnet in vnet.subnets or []:
+        subnet_info = {
+            'name': subnet.name,
+            'id': subnet.id,
+            'address_prefix': subnet.address_prefix,
+            'devices': []
         }
-        
-        for subnet in vnet.subnets:
-            subnet_info = {
-                'name': subnet.name,
-                'id': subnet.id,
-                'address_prefix': subnet.address_prefix,
-                'devices': []
-            }
-            vnet_info['subnets'].append(subnet_info)
-        
-        vnet_data.append(vnet_info)
+        vnet_info['subnets'].append(subnet_info)
     
-    return vnet_data
+    return vnet_info
 
 def apply_filters(vnets_data, config):
     """Apply filters from config to vnets_data"""
     filtered_vnets = []
-    regions_include = config['filters']['regions']['include']
-    regions_exclude = config['filters']['regions']['exclude']
-    rg_include = config['filters']['resource_groups']['include']
-    rg_exclude = config['filters']['resource_groups']['exclude']
+    # Azure regions and resource groups are case-insensitive: compare them case-folded
+    regions_include = {region.casefold() for region in config['filters']['regions']['include']}
+    regions_exclude = {region.casefold() for region in config['filters']['regions']['exclude']}
+    rg_include = {rg.casefold() for rg in config['filters']['resource_groups']['include']}
+    rg_exclude = {rg.casefold() for rg in config['filters']['resource_groups']['exclude']}
     name_include_patterns = [re.compile(p) for p in config['filters']['resource_names']['include_patterns']]
     name_exclude_patterns = [re.compile(p) for p in config['filters']['resource_names']['exclude_patterns']]
 
     for vnet in vnets_data:
         # Filter by region
-        if regions_include and vnet['location'] not in regions_include:
+        location = (vnet['location'] or '').casefold()
+        if regions_include and location not in regions_include:
             continue
-        if vnet['location'] in regions_exclude:
+        if location in regions_exclude:
             continue
         
         # Filter by resource group
-        if rg_include and vnet['resource_group'] not in rg_include:
+        resource_group = (vnet['resource_group'] or '').casefold()
+        if rg_include and resource_group not in rg_include:
             continue
-        if vnet['resource_group'] in rg_exclude:
+        if resource_group in rg_exclude:
             continue
         
         # Filter by name (VNet level)
@@ -217,11 +293,16 @@ def apply_filters(vnets_data, config):
     logger.info(f"After filtering: {len(filtered_vnets)} VNets remaining")
     return filtered_vnets
 
-def get_devices_in_subnet(subscription_id, credential, vnets_data):
-    """Get all devices connected to each subnet"""
+def get_devices_in_subnet(subscription_id, credential, vnets_data, config=None):
+    """Get all devices connected to each subnet (VMs, NICs, and the resource types of netresources.py)"""
+    import armid
+    import netresources
+
+    types = netresources.enabled_types(config or {})
+
     logger.info(f"Getting devices for subscription {subscription_id}")
-    network_client = NetworkManagementClient(credential, subscription_id)
-    compute_client = ComputeManagementClient(credential, subscription_id)
+    network_client = get_network_client(credential, subscription_id)
+    compute_client = get_compute_client(credential, subscription_id)
     
     nics = list(network_client.network_interfaces.list_all())
     logger.info(f"Found {len(nics)} network interfaces in subscription {subscription_id}")
@@ -229,38 +310,50 @@ def get_devices_in_subnet(subscription_id, credential, vnets_data):
     vms = list(compute_client.virtual_machines.list_all())
     logger.info(f"Found {len(vms)} virtual machines in subscription {subscription_id}")
 
-    vm_dict = {vm.id: vm for vm in vms}
+    # ARM IDs are case-insensitive: key VMs and subnets by their parsed ID
+    vm_dict = {armid.parse(vm.id): vm for vm in vms}
+    subnet_index = {armid.parse(subnet['id']): subnet for vnet in vnets_data for subnet in vnet['subnets']}
     
     for nic in nics:
         logger.debug(f"Processing NIC: {nic.name} (ID: {nic.id})")
-        if nic.ip_configurations:
-            for ip_config in nic.ip_configurations:
-                if ip_config.subnet:
-                    subnet_id = ip_config.subnet.id
-                    
-                    for vnet in vnets_data:
-                        for subnet in vnet['subnets']:
-                            if subnet['id'] == subnet_id:
-                                vm = None
-                                if nic.virtual_machine:
-                                    vm_id = nic.virtual_machine.id
-                                    vm = vm_dict.get(vm_id)
-                                
-                                device_info = {
-                                    'name': vm.name if vm else nic.name,
-                                    'id': vm.id if vm else nic.id,
-                                    'type': 'vm' if vm else 'network_interface',
-                                    'ip_address': ip_config.private_ip_address,
-                                    'mac_address': nic.mac_address,
-                                    'resource_group': nic.id.split('/')[4],
-                                    'location': nic.location,
-                                    'os_type': vm.storage_profile.os_disk.os_type if vm else None
-                                }
-                                logger.debug(f"Device info: {device_info}")
-                                subnet['devices'].append(device_info)
+        vm = vm_dict.get(armid.parse(nic.virtual_machine.id)) if nic.virtual_machine else None
+        for subnet_id, device_info in nic_to_devices(nic, vm, types):
+            subnet = subnet_index.get(armid.parse(subnet_id))
+            if subnet is not None:
+                subnet['devices'].append(device_info)
+
+    # Load balancer, application gateway and firewall frontends have no NIC
+    for subnet_id, device_info in netresources.list_devices(network_client, types):
+        subnet = subnet_index.get(armid.parse(subnet_id))
+        if subnet is not None:
+            subnet['devices'].append(device_info)
     
     return vnets_data
 
+def nic_to_devices(nic, vm=None, types=None):
+    """Yield (subnet_id, device_info) for each IP configuration of a NIC"""
+    import armid
+    import netresources
+
+    device_type, device_name, device_id = netresources.nic_owner(
+        nic, vm, netresources.RESOURCE_TYPES if types is None else types)
+    for ip_config in nic.ip_configurations or []:
+        if not ip_config.subnet:
+            continue
+        device_info = {
+            'name': device_name,
+            'id': device_id,
+            'type': device_type,
+            'ip_address': ip_config.private_ip_address,
+            'mac_address': nic.mac_address,
+            'resource_group': armid.resource_group(nic.id),
+            'location': nic.location,
+            'os_type': vm.storage_profile.os_disk.os_type if vm else None
+        }
+        logger.debug(f"Device info: {device_info}")
+        yield ip_config.subnet.id, device_info
+
+@netbox_cached('tag', 'tag_slug')
 def get_or_create_tag(nb, tag_name, tag_slug, tag_description):
     """Get or create a tag in Netbox"""
     try:
@@ -272,12 +365,20 @@ def get_or_create_tag(nb, tag_name, tag_slug, tag_description):
         logger.debug(f"Error getting tag {tag_slug}: {str(e)}")
     
     logger.info(f"Creating new tag: {tag_slug}")
-    return nb.extras.tags.create(
-        name=tag_name,
-        slug=tag_slug,
-        description=tag_description
-    )
+    try:
+        return nb.extras.tags.create(
+            name=tag_name,
+            slug=tag_slug,
+            description=tag_description
+        )
+    except Exception:
+        # Another shard/process may have created it in the meantime
+        tag = nb.extras.tags.get(slug=tag_slug)
+        if tag:
+            return tag
+        raise
 
+@netbox_cached('custom_field', 'field_name')
 def get_or_create_custom_field(nb, field_name, field_type, field_description, object_types, field_choices=None):
     """
     Get or create a custom field in NetBox 4.x.
@@ -306,36 +407,36 @@ def get_or_create_custom_field(nb, field_name, field_type, field_description, ob
 
     return nb.extras.custom_fields.create(**field_data)
 
-def get_or_create_prefix(nb, prefix_value, defaults, subscription_name=None, subscription_id=None):
+def get_or_create_prefix(nb, prefix_value, defaults, subscription_name=None, subscription_id=None,
+                         extra_custom_fields=None, report=None):
     """Get or create a prefix in Netbox"""
+    import canonical
+    from pynetbox.core.query import RequestError
+
     try:
-        existing_prefixes = nb.ipam.prefixes.filter(prefix=prefix_value)
+        existing_prefixes = prefetched('prefixes', prefix_value) or nb.ipam.prefixes.filter(prefix=prefix_value)
         
         if existing_prefixes:
             logger.info(f"Found existing prefix: {prefix_value}")
             prefix = list(existing_prefixes)[0]
             
-            needs_update = False
-            for key, value in defaults.items():
-                if getattr(prefix, key) != value:
-                    setattr(prefix, key, value)
-                    needs_update = True
-            
+            desired = dict(defaults)
+            desired_custom_fields = dict(extra_custom_fields or {})
             if subscription_name and subscription_id:
-                custom_fields = getattr(prefix, 'custom_fields', {}) or {}
-                azure_subscription_value = f"{subscription_name} - {subscription_id}"
-                azure_subscription_url = f"https://portal.azure.com/#@/subscription/{subscription_id}/overview"
-                
-                if (custom_fields.get('azure_subscription') != azure_subscription_value or
-                    custom_fields.get('azure_subscription_url') != azure_subscription_url):
-                    custom_fields['azure_subscription'] = azure_subscription_value
-                    custom_fields['azure_subscription_url'] = azure_subscription_url
-                    prefix.custom_fields = custom_fields
-                    needs_update = True
+                desired_custom_fields['azure_subscription'] = f"{subscription_name} - {subscription_id}"
+                desired_custom_fields['azure_subscription_url'] = f"https://portal.azure.com/#@/subscription/{subscription_id}/overview"
+            if desired_custom_fields:
+                desired['custom_fields'] = desired_custom_fields
             
-            if needs_update:
-                prefix.save()
-                logger.info(f"Updated prefix: {prefix_value}")
+            # Compare canonical forms: a Record vs {'id': n} or a choice vs its value is not a change
+            changes = canonical.plan_update(prefix, desired)
+            if changes:
+                prefix.update(changes)
+                logger.info(f"Updated prefix {prefix_value}: {', '.join(changes)}")
+                if report:
+                    report.count('prefixes_updated')
+            elif report:
+                report.count('prefixes_unchanged')
                 
             return prefix, False
     except Exception as e:
@@ -344,6 +445,8 @@ def get_or_create_prefix(nb, prefix_value, defaults, subscription_name=None, sub
     try:
         logger.info(f"Creating new prefix: {prefix_value}")
         
+        if extra_custom_fields:
+            defaults.setdefault('custom_fields', {}).update(extra_custom_fields)
         if subscription_name and subscription_id:
             if 'custom_fields' not in defaults:
                 defaults['custom_fields'] = {}
@@ -367,8 +470,11 @@ def get_or_create_prefix(nb, prefix_value, defaults, subscription_name=None, sub
                 logger.error(f"Error retrieving duplicate prefix {prefix_value}: {str(inner_e)}")
         raise
 
+@netbox_cached('device_type', 'model')
 def get_or_create_device_type(nb, model, manufacturer_name, tags):
     """Get or create a device type in Netbox"""
+    from pynetbox.core.query import RequestError
+
     try:
         device_type = nb.dcim.device_types.get(model=model)
         if device_type:
@@ -408,8 +514,11 @@ def get_or_create_device_type(nb, model, manufacturer_name, tags):
         logger.error(f"Failed to create device type {model}: {str(e)}")
         raise
 
+@netbox_cached('device_role', 'name')
 def get_or_create_device_role(nb, name, vm_role, tags):
     """Get or create a device role in Netbox"""
+    from pynetbox.core.query import RequestError
+
     try:
         role = nb.dcim.device_roles.get(name=name)
         if role:
@@ -431,6 +540,7 @@ def get_or_create_device_role(nb, name, vm_role, tags):
         logger.error(f"Failed to create device role {name}: {str(e)}")
         raise
 
+@netbox_cached('site', 'name')
 def get_or_create_site(nb, name, description, tags):
     """Get or create a site in Netbox"""
     try:
@@ -440,42 +550,96 @@ def get_or_create_site(nb, name, description, tags):
     except Exception as e:
         logger.debug(f"Error getting site {name}: {str(e)}")
     
-    return nb.dcim.sites.create(
-        name=name,
-        status='active',
-        slug=name.lower().replace(" ", "-"),
-        description=description,
-        tags=tags
-    )
+    try:
+        return nb.dcim.sites.create(
+            name=name,
+            status='active',
+            slug=name.lower().replace(" ", "-"),
+            description=description,
+            tags=tags
+        )
+    except Exception:
+        # Another shard/process may have created it in the meantime
+        site = nb.dcim.sites.get(name=name)
+        if site:
+            return site
+        raise
 
 def setup_custom_fields(nb, config):
-    """Setup custom fields for Azure integration (NetBox 4.x) based on config"""
+    """
+    Bootstrap the custom fields and base tags (NetBox 4.x) from config. Skipped
+    when the schema fingerprint matches the cached one, otherwise only the
+    differences are applied in bulk; falls back to one get_or_create_* per object.
+    """
+    import schema
+
+    schema_config = config.get('schema', {})
+    try:
+        ids, _ = schema.ensure_schema(nb, config, config['netbox']['url'],
+                                      schema_config.get('cache_path'), schema_config.get('ttl', 86400))
+        # Seed the get_or_create_* cache so later lookups need no request either
+        for field_name, field_id in ids['custom_fields'].items():
+            _netbox_cache[('custom_field', nb.base_url, field_name)] = SimpleNamespace(id=field_id, name=field_name)
+        for tag_slug, tag_id in ids['tags'].items():
+            _netbox_cache[('tag', nb.base_url, tag_slug)] = SimpleNamespace(id=tag_id, slug=tag_slug)
+        return
+    except Exception as e:
+        logger.warning(f"Bulk schema bootstrap failed ({str(e)}), falling back to per-object setup")
+        schema.invalidate(schema_config.get('cache_path'))
+
     logger.info("Setting up custom fields for Azure integration")
     try:
-        cf = config['custom_fields']
-        if cf['azure_subscription']['enabled']:
-            get_or_create_custom_field(
-                nb,
-                field_name="azure_subscription",
-                field_type=cf['azure_subscription']['field_type'],
-                field_description=cf['azure_subscription']['description'],
-                object_types=["ipam.prefix"]
-            )
-        if cf['azure_subscription_url']['enabled']:
+        for field_name, field in config['custom_fields'].items():
+            if not field.get('enabled'):
+                continue
             get_or_create_custom_field(
                 nb,
-                field_name="azure_subscription_url",
-                field_type=cf['azure_subscription_url']['field_type'],
-                field_description=cf['azure_subscription_url']['description'],
-                object_types=["ipam.prefix"]
+                field_name=field_name,
+                field_type=field['field_type'],
+                field_description=field.get('description', ''),
+                object_types=field.get('object_types', ["ipam.prefix"])
             )
         logger.info("Custom fields setup completed")
     except Exception as e:
         logger.error(f"Error setting up custom fields: {str(e)}")
 
-def sync_to_netbox(all_network_data, config, nb):
-    """Sync Azure network data to Netbox"""
-    mapping = config['mapping']
+def invalidate_netbox_cache(config):
+    """Forget cached Netbox objects and the schema fingerprint (objects may have been deleted)"""
+    import schema
+
+    _netbox_cache.clear()
+    schema.invalidate(config.get('schema', {}).get('cache_path'))
+
+def custom_field_enabled(config, field_name):
+    """True if a custom field is enabled in the config"""
+    return bool(config['custom_fields'].get(field_name, {}).get('enabled'))
+
+def subscription_prefix_fields(config, subscription_data):
+    """Extra custom fields written on every prefix of a subscription"""
+    fields = {}
+    if custom_field_enabled(config, 'azure_management_group') and subscription_data.get('management_group'):
+        fields['azure_management_group'] = subscription_data['management_group']
+    return fields
+
+CAPACITY_FIELDS = ('list_available_ips', 'ips_used', 'ips_available')
+
+def capacity_prefix_fields(config, prefix, usage):
+    """Enabled capacity custom fields of a prefix from its capacity.py usage"""
+    from capacity import make_summary
+
+    values = {
+        'list_available_ips': make_summary(prefix, usage['subnets'], usage['used'], usage['available']),
+        'ips_used': usage['used'],
+        'ips_available': usage['available'],
+    }
+    return {name: value for name, value in values.items() if custom_field_enabled(config, name)}
+
+def peering_status_enabled(config):
+    """True if the VNet peering status is computed and written on VNet prefixes"""
+    return config.get('peering', {}).get('enabled', False) and custom_field_enabled(config, 'peering_status')
+
+def get_base_tags(nb, config):
+    """Get/create the sync tag and the additional tags, returned as Netbox tag dicts"""
     tags_config = config['tags']
     
     # Get/create sync tag
@@ -498,302 +662,1612 @@ def sync_to_netbox(all_network_data, config, nb):
         )
         additional_tag_dicts.append({'id': tag.id})
     
-    for subscription_data in all_network_data:
+    return sync_tag_dict, additional_tag_dicts
+
+def detect_environment(subscription_name):
+    """Detect environment from subscription name (e.g., 'dev', 'hml', 'uat', 'prd')"""
+    sub_name_lower = subscription_name.lower()
+    for env_slug in ('dev', 'hml', 'uat', 'prd'):
+        if env_slug in sub_name_lower:
+            return env_slug
+    return None
+
+def get_subscription_tags(nb, config, subscription_name):
+    """Base tags for a subscription (sync + additional + environment)"""
+    sync_tag_dict, additional_tag_dicts = get_base_tags(nb, config)
+    
+    env_slug = detect_environment(subscription_name)
+    env_tag_dict = []
+    if env_slug:
+        env_tag = get_or_create_tag(
+            nb,
+            tag_name=env_slug.upper(),  # e.g., 'DEV'
+            tag_slug=env_slug,
+            tag_description=f"Environment: {env_slug.upper()}"
+        )
+        env_tag_dict = [{'id': env_tag.id}]
+        logger.info(f"Detected environment '{env_slug}' for subscription '{subscription_name}'")
+    else:
+        logger.warning(f"No environment detected in subscription name '{subscription_name}'; skipping environment tag")
+    
+    return sync_tag_dict + additional_tag_dicts + env_tag_dict
+
+def sync_to_netbox(all_network_data, config, nb, report=None, checkpoint=None, deadletter=None, schedule=None,
+                   lease=None):
+    """
+    Sync Azure network data to Netbox (recording each written VNet in the
+    checkpoint, if any). With a dead-letter queue, a failed VNet or device is
+    recorded there and the sync goes on. With a schedule, no subscription is
+    started once its budget has elapsed: the rest is carried over. With a
+    lease, the run stops (LeaseLost) before any VNet once it was taken over.
+    """
+    from deadletter import TooManyFailures
+
+    report = report or RunReport()
+    if peering_status_enabled(config):
+        import peering
+        peering.annotate(all_network_data, config['peering'], report)
+    
+    for index, subscription_data in enumerate(all_network_data):
         subscription_id = subscription_data['subscription_id']
         subscription_name = subscription_data['subscription_name']
+        if schedule and schedule.expired():
+            deferred = [data['subscription_id'] for data in all_network_data[index:]]
+            logger.warning(f"Schedule budget elapsed, carrying {len(deferred)} subscriptions over to the next run")
+            report.count('subscriptions_deferred', len(deferred))
+            schedule.defer(deferred)
+            break
+        sync_start = time.time()
+        sub_tags = get_subscription_tags(nb, config, subscription_name)
+        prefix_fields = subscription_prefix_fields(config, subscription_data)
         
-        # Detect environment from subscription name (e.g., 'dev', 'hml', 'uat', 'prd')
-        env_slug = None
-        sub_name_lower = subscription_name.lower()
-        if 'dev' in sub_name_lower:
-            env_slug = 'dev'
-        elif 'hml' in sub_name_lower:
-            env_slug = 'hml'
-        elif 'uat' in sub_name_lower:
-            env_slug = 'uat'
-        elif 'prd' in sub_name_lower:
-            env_slug = 'prd'
+        for vnet in subscription_data['vnets']:
+            if checkpoint and checkpoint.vnet_is_done(subscription_id, vnet['id']):
+                report.count('vnets_resumed')
+                continue
+            if lease:
+                lease.check()
+            try:
+                sync_vnet(nb, config, vnet, subscription_id, subscription_name, sub_tags, report, prefix_fields,
+                          deadletter)
+            except Exception as e:
+                if deadletter is None or isinstance(e, TooManyFailures):
+                    raise
+                report.count('writes_failed')
+                deadletter.add('vnet', {'subscription_id': subscription_id, 'subscription_name': subscription_name,
+                                        'prefix_fields': prefix_fields, 'vnet': vnet}, e)
+            if checkpoint:
+                checkpoint.vnet_done(subscription_id, vnet['id'])
+        if checkpoint:
+            checkpoint.subscription_done(subscription_id)
+        report.subscriptions.setdefault(subscription_id, {'name': subscription_name})['sync_duration'] = \
+            round(time.time() - sync_start, 3)
+
+def sync_vnet(nb, config, vnet, subscription_id, subscription_name, sub_tags, report, prefix_fields=None,
+              deadletter=None):
+    """Sync the prefixes of a VNet and its subnets, then the devices of each subnet"""
+    # Dynamic location tag (e.g., 'northeurope', 'westeurope')
+    location_slug = vnet['location'].lower().replace(' ', '')
+    location_tag = get_or_create_tag(
+        nb,
+        tag_name=location_slug.capitalize(),  # e.g., 'Northeurope'
+        tag_slug=location_slug,
+        tag_description=f"Azure region: {vnet['location']}"
+    )
+    location_tag_dict = [{'id': location_tag.id}]
+    
+    # Combined tags for this VNet (sub_tags + location)
+    vnet_tags = sub_tags + location_tag_dict
+    
+    # Peering status only applies to the VNet address spaces, not to subnets
+    vnet_fields = dict(prefix_fields or {})
+    if 'peering_status' in vnet:
+        vnet_fields['peering_status'] = vnet['peering_status']
+    
+    # Used/available IPs from the discovered NIC addresses (no second scan)
+    spaces_usage, subnets_usage = {}, {}
+    if any(custom_field_enabled(config, name) for name in CAPACITY_FIELDS):
+        from capacity import vnet_usage
+        spaces_usage, subnets_usage = vnet_usage(vnet)
+    
+    for address_space in vnet['address_space']:
+        space_fields = dict(vnet_fields)
+        if address_space in spaces_usage:
+            usage = spaces_usage[address_space]
+            space_fields.update(capacity_prefix_fields(config, address_space, usage))
         
-        env_tag_dict = []
-        if env_slug:
-            env_tag = get_or_create_tag(
-                nb,
-                tag_name=env_slug.upper(),  # e.g., 'DEV'
-                tag_slug=env_slug,
-                tag_description=f"Environment: {env_slug.upper()}"
-            )
-            env_tag_dict = [{'id': env_tag.id}]
-            logger.info(f"Detected environment '{env_slug}' for subscription '{subscription_name}'")
-        else:
-            logger.warning(f"No environment detected in subscription name '{subscription_name}'; skipping environment tag")
+        vnet_prefix, created = get_or_create_prefix(
+            nb,
+            address_space,
+            {
+                'description': f"Azure VNet: {vnet['name']} (Subscription: {subscription_id})",
+                'status': 'active',
+                'tags': vnet_tags
+            },
+            subscription_name=subscription_name,
+            subscription_id=subscription_id,
+            extra_custom_fields=space_fields,
+            report=report
+        )
         
-        # Base tags for this subscription (sync + additional + environment)
-        sub_tags = sync_tag_dict + additional_tag_dicts + env_tag_dict
+        action = "Created" if created else "Updated"
+        report.count('prefixes_created' if created else 'prefixes_existing')
+        logger.info(f"{action} prefix for VNet {vnet['name']}: {address_space}")
         
-        for vnet in subscription_data['vnets']:
-            # Dynamic location tag (e.g., 'northeurope', 'westeurope')
-            location_slug = vnet['location'].lower().replace(' ', '')
-            location_tag = get_or_create_tag(
+        for subnet in vnet['subnets']:
+            if not subnet.get('address_prefix'):
+                logger.warning(f"Skipping subnet '{subnet.get('name')}' in VNet '{vnet['name']}' (no address_prefix)")
+                continue
+            
+            subnet_fields = dict(prefix_fields or {})
+            if subnet['address_prefix'] in subnets_usage:
+                subnet_fields.update(capacity_prefix_fields(config, subnet['address_prefix'],
+                                                            subnets_usage[subnet['address_prefix']]))
+
+            subnet_prefix, created = get_or_create_prefix(
                 nb,
-                tag_name=location_slug.capitalize(),  # e.g., 'Northeurope'
-                tag_slug=location_slug,
-                tag_description=f"Azure region: {vnet['location']}"
+                subnet['address_prefix'],
+                {
+                    'description': f"Azure Subnet: {subnet['name']} (VNet: {vnet['name']})",
+                    'status': 'active',
+                    'tags': vnet_tags,
+                    'parent': vnet_prefix.id
+                },
+                subscription_name=subscription_name,
+                subscription_id=subscription_id,
+                extra_custom_fields=subnet_fields,
+                report=report
             )
-            location_tag_dict = [{'id': location_tag.id}]
             
-            # Combined tags for this VNet (sub_tags + location)
-            vnet_tags = sub_tags + location_tag_dict
+            action = "Created" if created else "Updated"
+            report.count('prefixes_created' if created else 'prefixes_existing')
+            logger.info(f"{action} prefix for subnet {subnet['name']}: {subnet['address_prefix']}")
+    
+    # The devices of all subnets in one batch, so the writers are not drained at every subnet
+    sync_devices(nb, config, [device for subnet in vnet['subnets'] if subnet.get('address_prefix')
+                              for device in subnet['devices']], report, deadletter)
+
+def writer_threads(config):
+    """
+    Threads writing devices: netbox.concurrency.max with the adaptive limiter,
+    which then decides how many of their requests are in flight; otherwise the
+    fixed netbox.write_workers (default 1, sequential)
+    """
+    concurrency_config = config['netbox'].get('concurrency')
+    if concurrency_config:
+        return concurrency_config.get('max', 16)
+    return config['netbox'].get('write_workers', 1)
+
+def sync_devices(nb, config, devices, report, deadletter=None):
+    """
+    Sync the devices of a VNet with writer_threads() threads. Entries of the
+    same device (a multi-IP NIC, a load balancer with several frontends)
+    share one task, so its get-then-create never races with itself.
+    """
+    def sync_group(group):
+        for device in group:
+            if deadletter is None:
+                sync_device(nb, config, device, report)
+                continue
+            try:
+                sync_device(nb, config, device, report)
+            except Exception as e:
+                report.count('writes_failed')
+                deadletter.add('device', device, e)
+
+    # Same Netbox device = same truncated name in the same site (Azure location)
+    mapping = config['mapping']
+    groups = {}
+    for device in devices:
+        key = (truncate_name(device['name'], mapping['max_name_length']), device['location'])
+        groups.setdefault(key, []).append(device)
+
+    workers = min(writer_threads(config), len(groups))
+    if workers < 2:
+        for group in groups.values():
+            sync_group(group)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrency import current_meter, set_meter
+
+    state = getattr(_netbox_state, 'state', None)
+    meter = current_meter()
+
+    def work(group):
+        _netbox_state.state = state  # prefetched objects of the calling thread
+        set_meter(meter)  # and its run's request count
+        sync_group(group)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='netbox') as executor:
+        futures = [executor.submit(work, group) for group in groups.values()]
+    for future in futures:
+        future.result()  # first failure (no dead-letter queue, or too many failures) is raised
+
+def apply_changes(record, desired, kind, report, merge=()):
+    """Update an existing Netbox object only if its canonical state differs; counts <kind>_updated/_unchanged"""
+    import canonical
+
+    changes = canonical.plan_update(record, desired, merge)
+    if not changes:
+        report.count(f'{kind}_unchanged')
+        return False
+    record.update(changes)
+    logger.info(f"Updated {kind[:-1]} {record}: {', '.join(changes)}")
+    report.count(f'{kind}_updated')
+    return True
+
+def sync_device(nb, config, device, report):
+    """Sync one device: device, default interface and its IP address"""
+    from pynetbox.core.query import RequestError
+
+    mapping = config['mapping']
+    sync_tag_dict, _ = get_base_tags(nb, config)
+    
+    device_type_model = f"{mapping['device_type_prefix']} {device['type'].title()}"
+    device_type = get_or_create_device_type(
+        nb,
+        model=device_type_model,
+        manufacturer_name=mapping['manufacturer'],
+        tags=sync_tag_dict
+    )
+    
+    device_role_name = f"{mapping['device_role_prefix']} {device['type'].title()}"
+    device_role = get_or_create_device_role(
+        nb,
+        name=device_role_name,
+        vm_role=device['type'] == 'vm',
+        tags=sync_tag_dict
+    )
+    
+    site_name = f"{mapping['site_prefix']}{device['location']}"
+    site = get_or_create_site(
+        nb,
+        name=site_name,
+        description=f"Azure Region: {device['location']}",
+        tags=sync_tag_dict
+    )
+    
+    device_name = truncate_name(device['name'], mapping['max_name_length'])
+    nb_device = prefetched('devices', (device_name, site.id)) or nb.dcim.devices.get(name=device_name, site_id=site.id)
+    
+    if nb_device:
+        logger.info(f"Found existing device: {device_name}")
+        report.count('devices_existing')
+        # Type, role and status are set at creation only (operator edits and 'offline' stay);
+        # tags are added to the device's own tags, never removed
+        apply_changes(nb_device, {'tags': sync_tag_dict}, 'devices', report, merge=('tags',))
+    else:
+        try:
+            nb_device = nb.dcim.devices.create(
+                name=device_name,
+                device_type=device_type.id,
+                role=device_role.id,
+                site=site.id,
+                status='active',
+                tags=sync_tag_dict
+            )
+            logger.info(f"Created new device: {device_name}")
+            report.count('devices_created')
+        except RequestError as e:
+            if "Device name must be unique per site" in str(e):
+                suffix = 1
+                while True:
+                    unique_name = f"{device_name}-{suffix}"
+                    if len(unique_name) > mapping['max_name_length']:
+                        unique_name = f"{device_name[:mapping['max_name_length']-len(str(suffix))-1]}-{suffix}"
+                    
+                    try:
+                        nb_device = nb.dcim.devices.create(
+                            name=unique_name,
+                            device_type=device_type.id,
+                            role=device_role.id,
+                            site=site.id,
+                            status='active',
+                            tags=sync_tag_dict
+                        )
+                        logger.info(f"Created new device with unique name: {unique_name}")
+                        report.count('devices_created')
+                        break
+                    except RequestError as inner_e:
+                        if "Device name must be unique per site" in str(inner_e):
+                            suffix += 1
+                        else:
+                            raise
+            else:
+                raise
+
+    interface_name = mapping['default_interface']
+    interface = (prefetched('interfaces', (nb_device.id, interface_name))
+                 or nb.dcim.interfaces.get(device_id=nb_device.id, name=interface_name))
+    if interface:
+        logger.info(f"Found existing interface {interface_name} for device {device_name}")
+        apply_changes(interface, {'tags': sync_tag_dict}, 'interfaces', report, merge=('tags',))
+    else:
+        interface = nb.dcim.interfaces.create(
+            device=nb_device.id,
+            name=interface_name,
+            type="virtual",
+            mac_address=device['mac_address'] if device['mac_address'] else None,
+            tags=sync_tag_dict
+        )
+        logger.info(f"Created interface {interface_name} for device {device_name}")
+
+    ip_address = (prefetched('ip_addresses', f"{device['ip_address']}/32")
+                  or nb.ipam.ip_addresses.get(address=f"{device['ip_address']}/32"))
+    if ip_address:
+        logger.info(f"Found existing IP address for {device_name}: {device['ip_address']}")
+        apply_changes(ip_address, {
+            'assigned_object_type': 'dcim.interface',
+            'assigned_object_id': interface.id,
+            'tags': sync_tag_dict
+        }, 'ips', report, merge=('tags',))
+    else:
+        ip_address = nb.ipam.ip_addresses.create(
+            address=f"{device['ip_address']}/32",
+            description=f"IP for {device_name}",
+            status='active',
+            tags=sync_tag_dict,
+            assigned_object_type='dcim.interface',
+            assigned_object_id=interface.id
+        )
+        logger.info(f"Created new IP address for {device_name}: {device['ip_address']}")
+        report.count('ips_created')
+    
+    return nb_device
+
+def plan_netbox(all_network_data, config, nb, prune=False):
+    """
+    Read side of `plan`: the writes sync_to_netbox would make for this
+    inventory, computed against Netbox objects read in bulk (plan.py).
+    With prune, synced prefixes of the planned subscriptions that are no
+    longer in Azure are planned for deletion.
+    """
+    import plan as planning
+    import schema
+    from capacity import vnet_usage
+
+    start = time.time()
+    plan = planning.Plan(config['netbox']['url'], planning.read_lookups(nb))
+    state = planning.read_state(nb, config['netbox'])
+    logger.info(f"Read {len(state)} Netbox objects in {time.time() - start:.1f}s")
+    
+    wanted = schema.desired_schema(config)
+    for field_name, spec in wanted['custom_fields'].items():
+        if field_name not in plan.lookups['custom_fields']:
+            plan.create('custom_fields', field_name, schema._custom_field_data(field_name, spec))
+    tag_ids = {slug: plan.ensure('tags', slug, dict(spec, slug=slug)) for slug, spec in wanted['tags'].items()}
+    
+    mapping = config['mapping']
+    sync_slug = config['tags']['sync_tag']['name'].lower().replace(" ", "-")
+    sync_tag_dict = [{'id': tag_ids[sync_slug]}]
+    base_tag_dicts = sync_tag_dict + [{'id': tag_ids[slug]} for slug in config['tags']['additional_tags']]
+    manufacturer_id = plan.ensure('manufacturers', mapping['manufacturer'], {
+        'name': mapping['manufacturer'],
+        'slug': mapping['manufacturer'].lower().replace(" ", "-"),
+        'description': 'Created by Azure sync script',
+    })
+    
+    if peering_status_enabled(config):
+        import peering
+        peering.annotate(all_network_data, config['peering'], RunReport())
+    
+    planned_prefixes = set()
+    for subscription_data in all_network_data:
+        subscription_id = subscription_data['subscription_id']
+        subscription_name = subscription_data['subscription_name']
+        env_slug = detect_environment(subscription_name)
+        sub_tags = base_tag_dicts + ([{'id': tag_ids[env_slug]}] if env_slug else [])
+        prefix_fields = dict(subscription_prefix_fields(config, subscription_data))
+        prefix_fields['azure_subscription'] = f"{subscription_name} - {subscription_id}"
+        prefix_fields['azure_subscription_url'] = f"https://portal.azure.com/#@/subscription/{subscription_id}/overview"
+        
+        for vnet in subscription_data['vnets']:
+            location_slug = vnet['location'].lower().replace(' ', '')
+            location_tag = plan.ensure('tags', location_slug, {
+                'name': location_slug.capitalize(),
+                'slug': location_slug,
+                'description': f"Azure region: {vnet['location']}",
+            })
+            vnet_tags = sub_tags + [{'id': location_tag}]
+            vnet_fields = dict(prefix_fields)
+            if 'peering_status' in vnet:
+                vnet_fields['peering_status'] = vnet['peering_status']
+            spaces_usage, subnets_usage = {}, {}
+            if any(custom_field_enabled(config, name) for name in CAPACITY_FIELDS):
+                spaces_usage, subnets_usage = vnet_usage(vnet)
             
             for address_space in vnet['address_space']:
-                vnet_prefix, created = get_or_create_prefix(
-                    nb,
-                    address_space,
-                    {
-                        'description': f"Azure VNet: {vnet['name']} (Subscription: {subscription_id})",
-                        'status': 'active',
-                        'tags': vnet_tags
-                    },
-                    subscription_name=subscription_name,
-                    subscription_id=subscription_id
-                )
-                
-                action = "Created" if created else "Updated"
-                logger.info(f"{action} prefix for VNet {vnet['name']}: {address_space}")
+                space_fields = dict(vnet_fields)
+                if address_space in spaces_usage:
+                    usage = spaces_usage[address_space]
+                    space_fields.update(capacity_prefix_fields(config, address_space, usage))
+                vnet_prefix = plan_prefix(plan, state, address_space, {
+                    'description': f"Azure VNet: {vnet['name']} (Subscription: {subscription_id})",
+                    'status': 'active',
+                    'tags': vnet_tags,
+                    'custom_fields': space_fields,
+                })
+                planned_prefixes.add(address_space)
                 
                 for subnet in vnet['subnets']:
                     if not subnet.get('address_prefix'):
-                        logger.warning(f"Skipping subnet '{subnet.get('name')}' in VNet '{vnet['name']}' (no address_prefix)")
                         continue
-
-                    subnet_prefix, created = get_or_create_prefix(
-                        nb,
-                        subnet['address_prefix'],
-                        {
-                            'description': f"Azure Subnet: {subnet['name']} (VNet: {vnet['name']})",
-                            'status': 'active',
-                            'tags': vnet_tags,
-                            'parent': vnet_prefix.id
-                        },
-                        subscription_name=subscription_name,
-                        subscription_id=subscription_id
-                    )
-                    
-                    action = "Created" if created else "Updated"
-                    logger.info(f"{action} prefix for subnet {subnet['name']}: {subnet['address_prefix']}")
+                    subnet_fields = dict(prefix_fields)
+                    if subnet['address_prefix'] in subnets_usage:
+                        subnet_fields.update(capacity_prefix_fields(config, subnet['address_prefix'],
+                                                                    subnets_usage[subnet['address_prefix']]))
+                    plan_prefix(plan, state, subnet['address_prefix'], {
+                        'description': f"Azure Subnet: {subnet['name']} (VNet: {vnet['name']})",
+                        'status': 'active',
+                        'tags': vnet_tags,
+                        'parent': vnet_prefix,
+                        'custom_fields': subnet_fields,
+                    })
+                    planned_prefixes.add(subnet['address_prefix'])
                     
                     for device in subnet['devices']:
-                        device_type_model = f"{mapping['device_type_prefix']} {device['type'].title()}"
-                        device_type = get_or_create_device_type(
-                            nb,
-                            model=device_type_model,
-                            manufacturer_name=mapping['manufacturer'],
-                            tags=sync_tag_dict
-                        )
-                        
-                        device_role_name = f"{mapping['device_role_prefix']} {device['type'].title()}"
-                        device_role = get_or_create_device_role(
-                            nb,
-                            name=device_role_name,
-                            vm_role=device['type'] == 'vm',
-                            tags=sync_tag_dict
-                        )
-                        
-                        site_name = f"{mapping['site_prefix']}{device['location']}"
-                        site = get_or_create_site(
-                            nb,
-                            name=site_name,
-                            description=f"Azure Region: {device['location']}",
-                            tags=sync_tag_dict
-                        )
-                        
-                        device_name = truncate_name(device['name'], mapping['max_name_length'])
-                        nb_device = nb.dcim.devices.get(name=device_name, site_id=site.id)
-                        
-                        if nb_device:
-                            logger.info(f"Found existing device: {device_name}")
-                        else:
-                            try:
-                                nb_device = nb.dcim.devices.create(
-                                    name=device_name,
-                                    device_type=device_type.id,
-                                    role=device_role.id,
-                                    site=site.id,
-                                    status='active',
-                                    tags=sync_tag_dict
-                                )
-                                logger.info(f"Created new device: {device_name}")
-                            except RequestError as e:
-                                if "Device name must be unique per site" in str(e):
-                                    suffix = 1
-                                    while True:
-                                        unique_name = f"{device_name}-{suffix}"
-                                        if len(unique_name) > mapping['max_name_length']:
-                                            unique_name = f"{device_name[:mapping['max_name_length']-len(str(suffix))-1]}-{suffix}"
-                                        
-                                        try:
-                                            nb_device = nb.dcim.devices.create(
-                                                name=unique_name,
-                                                device_type=device_type.id,
-                                                role=device_role.id,
-                                                site=site.id,
-                                                status='active',
-                                                tags=sync_tag_dict
-                                            )
-                                            logger.info(f"Created new device with unique name: {unique_name}")
-                                            break
-                                        except RequestError as inner_e:
-                                            if "Device name must be unique per site" in str(inner_e):
-                                                suffix += 1
-                                            else:
-                                                raise
-                                else:
-                                    raise
-
-                        interface_name = mapping['default_interface']
-                        interface = nb.dcim.interfaces.get(device_id=nb_device.id, name=interface_name)
-                        if interface:
-                            logger.info(f"Found existing interface {interface_name} for device {device_name}")
-                        else:
-                            interface = nb.dcim.interfaces.create(
-                                device=nb_device.id,
-                                name=interface_name,
-                                type="virtual",
-                                mac_address=device['mac_address'] if device['mac_address'] else None,
-                                tags=sync_tag_dict
-                            )
-                            logger.info(f"Created interface {interface_name} for device {device_name}")
-
-                        ip_address = nb.ipam.ip_addresses.get(address=f"{device['ip_address']}/32")
-                        if ip_address:
-                            logger.info(f"Found existing IP address for {device_name}: {device['ip_address']}")
-                            if ip_address.assigned_object_id != interface.id or ip_address.assigned_object_type != 'dcim.interface':
-                                ip_address.assigned_object_id = interface.id
-                                ip_address.assigned_object_type = 'dcim.interface'
-                                ip_address.save()
-                                logger.info(f"Updated IP address assignment for {device_name}")
-                        else:
-                            ip_address = nb.ipam.ip_addresses.create(
-                                address=f"{device['ip_address']}/32",
-                                description=f"IP for {device_name}",
-                                status='active',
-                                tags=sync_tag_dict,
-                                assigned_object_type='dcim.interface',
-                                assigned_object_id=interface.id
-                            )
-                            logger.info(f"Created new IP address for {device_name}: {device['ip_address']}")
+                        plan_device(plan, state, config, device, sync_tag_dict, manufacturer_id)
+    
+    if prune:
+        subscriptions = {data['subscription_id'] for data in all_network_data}
+        sync_tag_id = tag_ids[sync_slug]
+        for prefix, records in state.prefixes.items():
+            if prefix in planned_prefixes:
+                continue
+            for record in records:
+                serialized = record.serialize()
+                subscription = (serialized.get('custom_fields') or {}).get('azure_subscription') or ''
+                if (sync_tag_id in [tag['id'] if isinstance(tag, dict) else tag for tag in serialized.get('tags') or []]
+                        and subscription.rsplit(' - ', 1)[-1] in subscriptions):
+                    plan.delete('prefixes', record.id)
+    return plan
+
+def plan_prefix(plan, state, prefix_value, desired):
+    """Plan the create or update of one prefix (get_or_create_prefix); returns its id or placeholder"""
+    import plan as planning
+
+    existing = state.prefixes.get(prefix_value)
+    if existing:
+        return plan.update('prefixes', existing[0], desired)
+    if plan.planned('prefixes', prefix_value) is not None:
+        # Already planned (e.g. a subnet spanning its whole VNet): keep the first parent
+        desired = {key: value for key, value in desired.items() if key != 'parent'}
+    # A subnet of a VNet prefix created by the same plan waits for its parent
+    stage = None
+    if isinstance(desired.get('parent'), int) and desired['parent'] < 0:
+        stage = planning.STAGES['prefixes'] + 1
+    return plan.create('prefixes', prefix_value, dict(desired, prefix=prefix_value), stage)
+
+def plan_device(plan, state, config, device, sync_tag_dict, manufacturer_id):
+    """Plan one device, its default interface and its IP address (sync_device)"""
+    mapping = config['mapping']
+    device_kind = device['type'].title()
+    device_type_model = f"{mapping['device_type_prefix']} {device_kind}"
+    device_type = plan.ensure('device_types', device_type_model, {
+        'model': device_type_model,
+        'manufacturer': manufacturer_id,
+        'slug': device_type_model.lower().replace(" ", "-"),
+        'tags': sync_tag_dict,
+    })
+    device_role_name = f"{mapping['device_role_prefix']} {device_kind}"
+    device_role = plan.ensure('device_roles', device_role_name, {
+        'name': device_role_name,
+        'slug': device_role_name.lower().replace(" ", "-"),
+        'vm_role': device['type'] == 'vm',
+        'tags': sync_tag_dict,
+    })
+    site_name = f"{mapping['site_prefix']}{device['location']}"
+    site = plan.ensure('sites', site_name, {
+        'name': site_name,
+        'status': 'active',
+        'slug': site_name.lower().replace(" ", "-"),
+        'description': f"Azure Region: {device['location']}",
+        'tags': sync_tag_dict,
+    })
+    
+    device_name = truncate_name(device['name'], mapping['max_name_length'])
+    nb_device = state.devices.get((device_name, site))
+    if nb_device:
+        device_id = plan.update('devices', nb_device, {'tags': sync_tag_dict}, merge=('tags',))
+    else:
+        # Same name and site as a device already planned: the same Netbox device, as in sync_device
+        device_id = plan.create('devices', (device_name, site), {
+            'name': device_name,
+            'device_type': device_type,
+            'role': device_role,
+            'site': site,
+            'status': 'active',
+            'tags': sync_tag_dict,
+        })
+    
+    interface_name = mapping['default_interface']
+    interface = state.interfaces.get((device_id, interface_name))
+    if interface:
+        interface_id = plan.update('interfaces', interface, {'tags': sync_tag_dict}, merge=('tags',))
+    else:
+        interface_id = plan.create('interfaces', (device_id, interface_name), {
+            'device': device_id,
+            'name': interface_name,
+            'type': 'virtual',
+            'mac_address': device['mac_address'] or None,
+            'tags': sync_tag_dict,
+        })
+    
+    address = f"{device['ip_address']}/32"
+    ip_address = state.ip_addresses.get(address)
+    if ip_address:
+        plan.update('ip_addresses', ip_address, {
+            'assigned_object_type': 'dcim.interface',
+            'assigned_object_id': interface_id,
+            'tags': sync_tag_dict,
+        }, merge=('tags',))
+    else:
+        plan.create('ip_addresses', address, {
+            'address': address,
+            'description': f"IP for {device_name}",
+            'status': 'active',
+            'tags': sync_tag_dict,
+            'assigned_object_type': 'dcim.interface',
+            'assigned_object_id': interface_id,
+        })
+
+def validate_config(config):
+    """
+    Check the configuration without touching Azure or Netbox.
+    Returns a list of error messages (empty when the config is usable).
+    """
+    errors = []
+    if not isinstance(config, dict):
+        return ["Config file is empty or not a YAML mapping"]
+
+    required = {
+        'netbox': ['url', 'token'],
+        'azure': ['authentication', 'subscriptions'],
+        'logging': ['level', 'format'],
+        'mapping': ['site_prefix', 'device_type_prefix', 'device_role_prefix',
+                    'manufacturer', 'default_interface', 'max_name_length'],
+        'tags': ['sync_tag', 'additional_tags'],
+        'custom_fields': ['azure_subscription', 'azure_subscription_url'],
+        'filters': ['regions', 'resource_groups', 'resource_names'],
+        'ssl': ['verify'],
+        'timeouts': ['netbox_api'],
+    }
+    for section, keys in required.items():
+        if not isinstance(config.get(section), dict):
+            errors.append(f"Missing section '{section}'")
+            continue
+        for key in keys:
+            if key not in config[section]:
+                errors.append(f"Missing key '{section}.{key}'")
+    if errors:
+        return errors
+
+    if not config['netbox']['url'] or not config['netbox']['token']:
+        errors.append("Netbox URL and token must be provided in config")
+
+    import credentials
+    import netresources
+
+    authentication = config['azure']['authentication']
+    errors.extend(credentials.validate(authentication.get('method', 'default'), authentication))
+    errors.extend(netresources.validate(config))
+
+    azure_subs = config['azure']['subscriptions'] or {}
+    mg = azure_subs.get('management_group') or {}
+    selectors = [
+        bool(azure_subs.get('process_all')),
+        bool(azure_subs.get('specific_id')),
+        bool(mg.get('id') or mg.get('name')),
+    ]
+    if not any(selectors):
+        errors.append("No valid subscription configuration provided")
+    elif sum(selectors) > 1:
+        logging.warning("Several subscription selectors set; process_all > specific_id > management_group")
+
+    if not hasattr(logging, str(config['logging']['level']).upper()):
+        errors.append(f"Unknown logging level '{config['logging']['level']}'")
+
+    for section in ('include_patterns', 'exclude_patterns'):
+        for pattern in config['filters']['resource_names'].get(section) or []:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                errors.append(f"Invalid regex in filters.resource_names.{section} '{pattern}': {e}")
+
+    for name, cf in config['custom_fields'].items():
+        if cf.get('enabled') and not cf.get('field_type'):
+            errors.append(f"Missing key 'custom_fields.{name}.field_type'")
+
+    return errors
+
+def get_subscriptions_to_process(credential, config):
+    """Resolve the subscriptions to sync from the config (process_all, specific_id or management_group)"""
+    azure_subs = config['azure']['subscriptions']
+    if azure_subs.get('process_all', False):
+        return get_azure_subscriptions(credential)
+    elif 'specific_id' in azure_subs and azure_subs['specific_id']:
+        from azure.mgmt.subscription import SubscriptionClient
+
+        logger.info(f"Fetching details for specific subscription {azure_subs['specific_id']}")
+        subscription_client = SubscriptionClient(credential)
+        try:
+            sub = subscription_client.subscriptions.get(azure_subs['specific_id'])
+            logger.info(f"Found subscription: {sub.display_name} ({sub.subscription_id})")
+            return [type('obj', (object,), {
+                'subscription_id': sub.subscription_id,
+                'display_name': sub.display_name
+            })]
+        except Exception as e:
+            raise RuntimeError(f"Failed to fetch subscription {azure_subs['specific_id']}: {str(e)}") from e
+    elif 'management_group' in azure_subs:
+        mg = azure_subs['management_group']
+        subscriptions = get_management_group_subscriptions(
+            credential, 
+            mg.get('id'), 
+            mg.get('name'),
+            config
+        )
+        if not subscriptions:
+            raise RuntimeError("No subscriptions found in the specified management group")
+        return subscriptions
+    else:
+        raise RuntimeError("No valid subscription configuration provided")
+
+def connect_netbox(config):
+    """Build the pynetbox API client with SSL, timeout and connection pool settings from config"""
+    import requests
+    from pynetbox import api
+    from requests.adapters import HTTPAdapter
+
+    nb = api(config['netbox']['url'], token=config['netbox']['token'])
+    session = requests.Session()
+    concurrency_config = config['netbox'].get('concurrency')
+    pool_size = config['netbox'].get('pool_size')
+    if writer_threads(config) > 1:
+        # One connection per writer thread (the most requests the limiter can let through)
+        pool_size = max(pool_size or 0, writer_threads(config))
+    if pool_size:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    session.verify = config['ssl']['verify']
+    session.timeout = config['timeouts']['netbox_api']
+    if concurrency_config:
+        import concurrency
+        session = concurrency.LimitedSession(session, concurrency.from_config(concurrency_config),
+                                             concurrency_config.get('max_retries', 3))
+    nb.http_session = session
+    return nb
+
+def discover_subscription(subscription, credential, config):
+    """Collect VNets, subnets and devices of one subscription"""
+    subscription_id = subscription.subscription_id
+    subscription_data = {
+        'subscription_id': subscription_id,
+        'subscription_name': subscription.display_name,
+        'vnets': []
+    }
+    
+    vnets_data = get_vnets_and_subnets(subscription_id, credential)
+    vnets_data = apply_filters(vnets_data, config)  # Apply filters
+    vnets_with_devices = get_devices_in_subnet(subscription_id, credential, vnets_data, config)
+
+    # Temporary fake device for testing (configurable? For now, keep as is)
+    if not any(subnet['devices'] for vnet in vnets_with_devices for subnet in vnet['subnets']):
+        logger.warning("No devices found; adding fake one for testing")
+        if vnets_with_devices and vnets_with_devices[0]['subnets']:
+            fake_device = {
+                'name': 'test-vm',
+                'id': '/fake/id',
+                'type': 'vm',
+                'ip_address': '10.0.0.99',
+                'mac_address': '00:11:22:33:44:55',
+                'resource_group': 'fake-rg',
+                'location': 'westeurope',
+                'os_type': 'Linux'
+            }
+            vnets_with_devices[0]['subnets'][0]['devices'].append(fake_device)
+    
+    subscription_data['vnets'] = vnets_with_devices
+    return subscription_data
+
+def bootstrap_netbox(nb, config):
+    """
+    Create the objects every subscription shares (custom fields, sync/additional/
+    environment tags, device types and roles, region sites and tags) so that
+    shard workers only ever find them and never race on get_or_create_*.
+    """
+    from netresources import DEVICE_TYPES
+
+    mapping = config['mapping']
+    setup_custom_fields(nb, config)
+    sync_tag_dict, _ = get_base_tags(nb, config)
+    
+    for env_slug in ('dev', 'hml', 'uat', 'prd'):
+        get_or_create_tag(
+            nb,
+            tag_name=env_slug.upper(),
+            tag_slug=env_slug,
+            tag_description=f"Environment: {env_slug.upper()}"
+        )
+    
+    for device_type in DEVICE_TYPES:
+        get_or_create_device_type(
+            nb,
+            model=f"{mapping['device_type_prefix']} {device_type.title()}",
+            manufacturer_name=mapping['manufacturer'],
+            tags=sync_tag_dict
+        )
+        get_or_create_device_role(
+            nb,
+            name=f"{mapping['device_role_prefix']} {device_type.title()}",
+            vm_role=device_type == 'vm',
+            tags=sync_tag_dict
+        )
+    
+    regions = config.get('organization', {}).get('regions', {}).get('mapping', [])
+    for region in regions:
+        location = region['azure_location']
+        location_slug = location.lower().replace(' ', '')
+        get_or_create_tag(
+            nb,
+            tag_name=location_slug.capitalize(),
+            tag_slug=location_slug,
+            tag_description=f"Azure region: {location}"
+        )
+        get_or_create_site(
+            nb,
+            name=f"{mapping['site_prefix']}{location}",
+            description=f"Azure Region: {location}",
+            tags=sync_tag_dict
+        )
+    logger.info(f"Netbox bootstrap done ({len(regions)} regions)")
+
+def run_sync(config, credential, nb, report=None, shard=None, bootstrap=True, checkpoint=None, deadletter=None,
+             lease=None):
+    """
+    One full sync cycle: Azure discovery then Netbox sync. Returns the RunReport.
+    shard=(i, N) keeps only the subscriptions hashed to shard i; bootstrap=False
+    skips the custom field setup (done once by the coordinator). Subscriptions
+    already completed in `checkpoint` are neither discovered nor synced again.
+    """
+    report = report or RunReport()
+    schedule = open_schedule(config, shard)
+    all_network_data = discover_inventory(config, credential, report, shard, checkpoint, schedule)
+    
+    with metered_netbox(nb, report):
+        if bootstrap:
+            setup_custom_fields(nb, config)
+        prefetch_netbox_state(nb, config)
+        try:
+            sync_to_netbox(all_network_data, config, nb, report, checkpoint, deadletter, schedule, lease)
+        finally:
+            clear_netbox_state()
+            if schedule:
+                schedule.record(report, all_network_data)
+    
+    trends_config = config.get('trends', {})
+    if trends_config.get('path'):
+        import trends
+        try:
+            trends.record(trends_config['path'], all_network_data,
+                          trends_config.get('raw_days', 7), trends_config.get('retention_days', 365))
+        except Exception as e:
+            logger.warning(f"Could not record capacity trends: {str(e)}")
+            report.error(f"trends: {str(e)}")
+    return report.finish()
+
+@contextlib.contextmanager
+def metered_netbox(nb, report):
+    """
+    With netbox.concurrency, count the Netbox requests of this run (its writer
+    threads included) and record them, with the shared limit, in `report`
+    """
+    import concurrency
+
+    limiter = concurrency.limiter_of(nb)
+    if limiter is None:
+        yield
+        return
+    meter, previous = concurrency.RunMeter(), concurrency.current_meter()
+    concurrency.set_meter(meter)
+    try:
+        yield
+    finally:
+        concurrency.set_meter(previous)
+        meter.record(report, limiter)
+
+def discover_inventory(config, credential, report, shard=None, checkpoint=None, schedule=None):
+    """
+    Azure side of a sync: the subscriptions to process, discovered (and
+    recorded to the snapshot, if any). With a schedule, in its order and
+    limited to what fits its budget.
+    """
+    import sharding
+
+    subscriptions = get_subscriptions_to_process(credential, config)
+    if shard:
+        total = len(subscriptions)
+        subscriptions = sharding.select(subscriptions, *shard)
+        logger.info(f"Shard {shard[0]}/{shard[1]}: {len(subscriptions)} of {total} subscriptions")
+    report.count('subscriptions', len(subscriptions))
+    if checkpoint:
+        remaining = [sub for sub in subscriptions if not checkpoint.is_done(sub.subscription_id)]
+        report.count('subscriptions_resumed', len(subscriptions) - len(remaining))
+        subscriptions = remaining
+    if schedule:
+        subscriptions = schedule.select(subscriptions, report)
+    
+    mg_tree = None
+    if custom_field_enabled(config, 'azure_management_group'):
+        try:
+            mg_tree = get_management_group_tree(credential, config)
+        except Exception as e:
+            logger.warning(f"Management group tree unavailable, azure_management_group not set: {str(e)}")
+    
+    snapshot_writer = None
+    snapshot_path = config.get('snapshot', {}).get('path')
+    if snapshot_path:
+        from snapshot import SnapshotWriter, shard_path
+
+        snapshot_path = time.strftime(snapshot_path)
+        if shard:
+            # Workers start within the same second: one file per shard
+            snapshot_path = shard_path(snapshot_path, shard)
+        snapshot_writer = SnapshotWriter(snapshot_path)
+        logger.info(f"Recording inventory snapshot to {snapshot_path}")
+    
+    def discover(subscription):
+        sub_start = time.time()
+        subscription_data = discover_subscription(subscription, credential, config)
+        if mg_tree:
+            subscription_data['management_group'] = mg_tree.group_of(subscription.subscription_id)
+        return subscription_data, time.time() - sub_start
+    
+    # azure.discovery_workers > 1 discovers subscriptions in parallel; results
+    # are still consumed (snapshot, report) in subscription order
+    discovery_workers = config['azure'].get('discovery_workers', 1)
+    executor = None
+    if discovery_workers > 1 and len(subscriptions) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=discovery_workers, thread_name_prefix='discovery')
+    
+    all_network_data = []
+    try:
+        results = executor.map(discover, subscriptions) if executor else map(discover, subscriptions)
+        for subscription, (subscription_data, duration) in zip(subscriptions, results):
+            all_network_data.append(subscription_data)
+            if snapshot_writer:
+                snapshot_writer.write_subscription(subscription_data)
+            report.subscription_done(subscription.subscription_id, subscription.display_name,
+                                     duration, vnets=len(subscription_data['vnets']))
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        if snapshot_writer:
+            snapshot_writer.close()
+    return all_network_data
+
+def run_replay(config, nb, snapshot_path, report=None, shard=None, bootstrap=True, deadletter=None):
+    """Netbox stage only: sync a saved inventory snapshot, no Azure client involved"""
+    from snapshot import SnapshotReader
+
+    report = report or RunReport()
+    logger.info(f"Replaying inventory snapshot {snapshot_path}")
+    all_network_data = list(SnapshotReader(snapshot_path).subscriptions())
+    if shard:
+        import sharding
+
+        selected = {sub.subscription_id for sub in sharding.select(
+            [SimpleNamespace(subscription_id=data['subscription_id']) for data in all_network_data], *shard)}
+        all_network_data = [data for data in all_network_data if data['subscription_id'] in selected]
+    report.count('subscriptions', len(all_network_data))
+    report.count('snapshot_devices', sum(len(subnet['devices']) for data in all_network_data
+                                         for vnet in data['vnets'] for subnet in vnet['subnets']))
+    logger.info(f"Loaded {len(all_network_data)} subscriptions in {report.duration:.1f}s")
+    
+    with metered_netbox(nb, report):
+        if bootstrap:
+            setup_custom_fields(nb, config)
+        sync_start = time.time()
+        prefetch_netbox_state(nb, config)
+        try:
+            sync_to_netbox(all_network_data, config, nb, report, deadletter=deadletter)
+        finally:
+            clear_netbox_state()
+    report.count('netbox_sync_ms', int((time.time() - sync_start) * 1000))
+    return report.finish()
+
+def run_plan(config, nb, args, report, shard=None):
+    """
+    `plan [FILE]`: Azure discovery (or --from-snapshot) and a bulk read of
+    Netbox, then the change set written to FILE (default plan.path). No write.
+    """
+    import plan as planning
+
+    plan_config = config.get('plan', {})
+    path = time.strftime(args.path or plan_config.get('path', 'azure-sync-plan.json.gz'))
+    if args.from_snapshot:
+        from snapshot import SnapshotReader
+
+        all_network_data = list(SnapshotReader(args.from_snapshot).subscriptions())
+    else:
+        credential = get_azure_credentials(config['azure']['authentication']['method'],
+                                           config['azure']['authentication'])
+        all_network_data = discover_inventory(config, credential, report, shard)
+    
+    plan = plan_netbox(all_network_data, config, nb, prune=args.prune or plan_config.get('prune', False))
+    plan.save(path)
+    for kind, counts in plan.summary.items():
+        for action, value in counts.items():
+            report.count(f"plan_{kind}_{action}", value)
+    logger.info(f"Plan written to {path} ({len(plan.ops)} writes):\n{planning.format_summary(plan.summary)}")
+    return report.finish()
+
+def run_apply(config, nb, args, report, lease=None):
+    """`apply FILE`: execute the writes of a plan in dependency order, without reading Netbox"""
+    import plan as planning
+
+    plan_config = config.get('plan', {})
+    plan = planning.load(args.path)
+    if plan['netbox'] != config['netbox']['url']:
+        raise RuntimeError(f"Plan {args.path} was computed for {plan['netbox']}, not {config['netbox']['url']}")
+    age = time.time() - plan['created_at']
+    max_age = plan_config.get('max_age', 86400)
+    if age > max_age and not args.force:
+        raise RuntimeError(f"Plan {args.path} is {age / 3600:.1f}h old (plan.max_age {max_age}s); "
+                           f"plan again or pass --force")
+    logger.info(f"Applying {len(plan['ops'])} writes from {args.path}:\n{planning.format_summary(plan['summary'])}")
+    planning.apply(nb, plan, plan_config.get('batch_size', 200), report, lease)
+    return report.finish()
+
+def open_deadletter(config, shard=None):
+    """Dead-letter queue of this run (one file per shard), None if disabled"""
+    from deadletter import DeadLetterQueue
+
+    deadletter_config = config.get('deadletter', {})
+    path = deadletter_config.get('path')
+    if not path:
+        return None
+    if shard:
+        path = f"{path}.shard{shard[0]}-of-{shard[1]}"
+    return DeadLetterQueue(path, deadletter_config.get('max_failures'))
+
+def run_deadletter_replay(config, nb, path, report):
+    """Retry only the dead-lettered writes of a previous run (Netbox only, no Azure)"""
+    import deadletter
+
+    deadletter_config = config.get('deadletter', {})
+    queue = deadletter.DeadLetterQueue(path)
+    handlers = {
+        'device': lambda device: sync_device(nb, config, device, report),
+        'vnet': lambda entry: sync_vnet(nb, config, entry['vnet'], entry['subscription_id'],
+                                        entry['subscription_name'],
+                                        get_subscription_tags(nb, config, entry['subscription_name']),
+                                        report, entry['prefix_fields']),
+    }
+    replayed, failing = deadletter.replay(queue, handlers, deadletter_config.get('retries', 3),
+                                          deadletter_config.get('backoff', 2.0))
+    report.count('deadletter_replayed', replayed)
+    report.count('deadletter_failing', failing)
+    logger.info(f"Dead-letter replay of {path}: {replayed} written, {failing} still failing")
+    return report.finish('success' if not failing else 'partial')
+
+def run_daemon(config, credential, nb, args):
+    """Run sync cycles forever on the configured interval, with a health/metrics endpoint"""
+    import syncdaemon
+
+    daemon_config = config.get('daemon', {})
+    interval = args.interval or daemon_config.get('interval', 3600)
+    jitter = args.jitter if args.jitter is not None else daemon_config.get('jitter', 0)
+    metrics_port = args.metrics_port or daemon_config.get('metrics_port')
+
+    state = syncdaemon.DaemonState(interval, jitter)
+    if metrics_port:
+        syncdaemon.start_metrics_server(state, metrics_port, daemon_config.get('metrics_bind', '127.0.0.1'))
+
+    def cycle():
+        report = RunReport()
+        try:
+            with acquire_lease(config, nb) or contextlib.nullcontext() as cycle_lease:
+                run_sync(config, credential, nb, report, lease=cycle_lease)
+        except LeaseHeld as e:
+            logger.warning(f"Skipping this cycle: {str(e)}")
+            report.finish('skipped')
+        except Exception as e:
+            logger.error(f"Error during Azure to Netbox sync: {str(e)}", exc_info=True)
+            report.error(str(e))
+            report.finish('failure')
+            # Objects may have been deleted in Netbox; look them up again next cycle
+            invalidate_netbox_cache(config)
+        if args.report:
+            report.save(args.report)
+        return report
+
+    logger.info(f"Daemon mode: syncing every {interval}s (+/- {jitter}s)")
+    syncdaemon.run_forever(cycle, state)
+
+_subscription_names = {}
+
+def get_subscription_name(credential, subscription_id):
+    """Display name of a subscription (cached for the life of the process)"""
+    if subscription_id not in _subscription_names:
+        from azure.mgmt.subscription import SubscriptionClient
+
+        sub = SubscriptionClient(credential).subscriptions.get(subscription_id)
+        _subscription_names[subscription_id] = sub.display_name
+    return _subscription_names[subscription_id]
+
+def subnet_allowed(credential, config, subnet_id, vnet_cache):
+    """True if the VNet of a subnet passes the config filters (one VNet GET per batch)"""
+    import armid
+
+    subnet = armid.parse(subnet_id)
+    vnet_id = subnet.parent
+    if vnet_id not in vnet_cache:
+        network_client = get_network_client(credential, vnet_id.subscription_id)
+        vnet = network_client.virtual_networks.get(vnet_id.resource_group, vnet_id.name)
+        vnet_cache[vnet_id] = apply_filters([vnet_to_dict(vnet)], config)
+    return any(armid.parse(allowed['id']) == subnet
+               for vnet in vnet_cache[vnet_id] for allowed in vnet['subnets'])
+
+def sync_vnet_change(nb, config, credential, change, report):
+    """Re-sync the prefixes of one VNet (VNet or subnet write event)"""
+    parts = change.parts
+    network_client = get_network_client(credential, change.subscription_id)
+    vnet = network_client.virtual_networks.get(parts['resource_group'], parts['name'])
+    vnets = apply_filters([vnet_to_dict(vnet)], config)
+    if not vnets:
+        logger.info(f"VNet {vnet.name} ignored by filters")
+        return
+    subscription_name = get_subscription_name(credential, change.subscription_id)
+    sub_tags = get_subscription_tags(nb, config, subscription_name)
+    subscription_data = {}
+    if custom_field_enabled(config, 'azure_management_group'):
+        subscription_data['management_group'] = get_management_group_tree(credential, config).group_of(change.subscription_id)
+    prefix_fields = subscription_prefix_fields(config, subscription_data)
+    if peering_status_enabled(config):
+        # Remote VNets are unknown here: reciprocity is judged from the peering state only
+        import peering
+        peering.annotate([{'vnets': vnets}], config['peering'], report)
+    sync_vnet(nb, config, vnets[0], change.subscription_id, subscription_name, sub_tags, report, prefix_fields)
+
+def sync_nic_change(nb, config, credential, change, report, vnet_cache):
+    """Re-sync the devices behind one NIC or VM write event"""
+    import netresources
+    from events import resource_id_parts
+
+    parts = change.parts
+    network_client = get_network_client(credential, change.subscription_id)
+    compute_client = get_compute_client(credential, change.subscription_id)
+
+    if change.kind == 'vm':
+        vm = compute_client.virtual_machines.get(parts['resource_group'], parts['name'])
+        nics = []
+        for nic_ref in vm.network_profile.network_interfaces or []:
+            nic_parts = resource_id_parts(nic_ref.id)
+            nics.append(network_client.network_interfaces.get(nic_parts['resource_group'], nic_parts['name']))
+    else:
+        nic = network_client.network_interfaces.get(parts['resource_group'], parts['name'])
+        vm = None
+        if nic.virtual_machine:
+            vm_parts = resource_id_parts(nic.virtual_machine.id)
+            vm = compute_client.virtual_machines.get(vm_parts['resource_group'], vm_parts['name'])
+        nics = [nic]
+
+    types = netresources.enabled_types(config)
+    for nic in nics:
+        for subnet_id, device in nic_to_devices(nic, vm, types):
+            if subnet_allowed(credential, config, subnet_id, vnet_cache):
+                sync_device(nb, config, device, report)
+
+def subscription_vnet_prefixes(nb, subscription_id, vnet_name=None):
+    """VNet prefixes synced from one subscription (description 'Azure VNet: <name> (Subscription: <id>)')"""
+    if vnet_name:
+        return list(nb.ipam.prefixes.filter(description__ie=f"Azure VNet: {vnet_name} (Subscription: {subscription_id})"))
+    return list(nb.ipam.prefixes.filter(description__iew=f"(Subscription: {subscription_id})"))
+
+def retire_resource(nb, config, change, report):
+    """
+    Handle a delete event without deleting anything in Netbox: prefixes go to
+    'deprecated' and devices to 'offline'; the nightly reconciliation has the
+    final word. Only objects of the event's subscription are touched: its
+    VNet prefixes are found by their description, subnets within them, and
+    devices by an IP address within them (names repeat across subscriptions
+    and tenants).
+    """
+    import ipaddress
+
+    parts = change.parts
+    if change.kind == 'vnet':
+        vnet_prefixes = subscription_vnet_prefixes(nb, change.subscription_id, parts['name'])
+        objects = list(vnet_prefixes)
+        for vnet_prefix in vnet_prefixes:
+            objects += list(nb.ipam.prefixes.filter(within=vnet_prefix.prefix,
+                                                    description__iew=f"(VNet: {parts['name']})"))
+        status = 'deprecated'
+    elif change.kind == 'subnet':
+        objects = []
+        for vnet_prefix in subscription_vnet_prefixes(nb, change.subscription_id, parts['name']):
+            objects += list(nb.ipam.prefixes.filter(
+                within=vnet_prefix.prefix,
+                description__ie=f"Azure Subnet: {parts['child_name']} (VNet: {parts['name']})"))
+        status = 'deprecated'
+    else:
+        device_name = truncate_name(parts['name'], config['mapping']['max_name_length'])
+        sync_slug = config['tags']['sync_tag']['name'].lower().replace(" ", "-")
+        spaces = [ipaddress.ip_network(prefix.prefix)
+                  for prefix in subscription_vnet_prefixes(nb, change.subscription_id)]
+        objects = []
+        for device in nb.dcim.devices.filter(name=device_name, tag=sync_slug):
+            addresses = [ipaddress.ip_interface(ip.address).ip
+                         for ip in nb.ipam.ip_addresses.filter(device_id=device.id)]
+            if any(address in space for address in addresses for space in spaces):
+                objects.append(device)
+            else:
+                logger.info(f"Device {device} has no address in subscription {change.subscription_id}, left as is")
+        status = 'offline'
+
+    for obj in objects:
+        if getattr(obj.status, 'value', obj.status) != status:
+            obj.status = status
+            obj.save()
+            report.count(f"{change.kind}_retired")
+            logger.info(f"Marked {obj} as {status} ({change.kind} deleted in Azure)")
+
+def handle_resource_changes(changes, credential, nb, config, report=None, lease=None):
+    """
+    Apply coalesced Azure resource changes to Netbox, one targeted update per
+    resource. Under a lease, stops (LeaseLost) before the next change once it
+    was taken over.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    report = report or RunReport()
+    vnet_cache = {}
+    for change in changes:
+        if lease:
+            lease.check()
+        try:
+            if change.action == 'delete':
+                retire_resource(nb, config, change, report)
+            elif change.kind in ('vnet', 'subnet'):
+                sync_vnet_change(nb, config, credential, change, report)
+            else:
+                sync_nic_change(nb, config, credential, change, report, vnet_cache)
+            report.count('events_applied')
+        except ResourceNotFoundError:
+            # Deleted again before we got to it; the delete event will follow
+            logger.info(f"{change.resource_id} no longer exists, skipping")
+        except Exception as e:
+            logger.error(f"Error applying {change}: {str(e)}", exc_info=True)
+            report.error(f"{change.resource_id}: {str(e)}")
+    return report.finish('success' if not report.errors else 'failure')
+
+def run_events(config, credential, nb, args):
+    """
+    Consume resource-change events and apply them; full sync once a day as
+    reconciliation. Each batch takes the run lease; a batch that cannot get
+    it goes back into the coalescer and is retried after the debounce.
+    """
+    import signal
+    import threading
+    import events
+
+    events_config = config.get('events', {})
+    event_queue = events.open_queue(args.events or events_config.get('source'))
+    coalescer = events.Coalescer(events_config.get('debounce', 30), events_config.get('max_delay', 300))
+    stop_event = threading.Event()
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    setup_custom_fields(nb, config)
+
+    def handler(changes):
+        try:
+            with acquire_lease(config, nb) or contextlib.nullcontext() as batch_lease:
+                report = handle_resource_changes(changes, credential, nb, config, lease=batch_lease)
+        except (LeaseHeld, LeaseLost) as e:
+            # Updates are idempotent: retry the whole batch once the lease is free
+            logger.warning(f"Deferring {len(changes)} change(s): {str(e)}")
+            coalescer.requeue(changes)
+            return
+        logger.info(f"Applied {len(changes)} change(s) in {report.duration:.1f}s: {dict(report.counters)}")
+        if args.report:
+            report.save(args.report)
+
+    def reconcile():
+        report = RunReport()
+        try:
+            with acquire_lease(config, nb) or contextlib.nullcontext() as cycle_lease:
+                run_sync(config, credential, nb, report, lease=cycle_lease)
+        except LeaseHeld as e:
+            logger.warning(f"Skipping reconciliation: {str(e)}")
+            report.finish('skipped')
+        except Exception as e:
+            logger.error(f"Error during reconciliation: {str(e)}", exc_info=True)
+            report.error(str(e))
+            report.finish('failure')
+            invalidate_netbox_cache(config)
+        if args.report:
+            report.save(args.report)
+
+    events.run_event_loop(event_queue, coalescer, handler, stop_event,
+                          reconcile, events_config.get('reconcile_at', '02:00'))
+
+def acquire_lease(config, nb):
+    """
+    Take the run lease (lease.py) so that overlapping runs never sync at the
+    same time. Returns the held lease, None when no lease is configured;
+    raises LeaseHeld once lease.wait seconds have passed.
+    """
+    import lease
+
+    lease_config = config.get('lease')
+    if not lease_config:
+        return None
+    return lease.open_lease(lease_config, nb).acquire(lease_config.get('wait', 0), lease_config.get('poll', 10))
+
+def open_schedule(config, shard=None):
+    """Subscription schedule of this run (one state file per shard), None without a schedule section"""
+    import scheduler
+
+    schedule_config = config.get('schedule')
+    if not schedule_config:
+        return None
+    path = schedule_config.get('path')
+    if path and shard:
+        path = f"{path}.shard{shard[0]}-of-{shard[1]}"
+    return scheduler.Schedule(path, schedule_config, detect_environment)
+
+def open_checkpoint(config, args, shard=None, scope=None):
+    """Checkpoint of this run (one state file per shard); --resume reloads the previous one"""
+    from checkpoint import Checkpoint
+
+    path = config.get('checkpoint', {}).get('path', '.azure-sync-checkpoint.json')
+    scope = scope or os.path.abspath(args.config)
+    if shard:
+        path = f"{path}.shard{shard[0]}-of-{shard[1]}"
+        scope = f"{scope} shard {shard[0]}/{shard[1]}"
+    return Checkpoint.open(path, scope, resume=args.resume)
+
+def run_workers(config, nb, args, lease=None):
+    """
+    Coordinator for --workers N: bootstrap shared Netbox objects once, then run
+    N worker processes (this script with --shard i/N --skip-bootstrap) and merge
+    their run reports. --from-snapshot and --record-snapshot are passed on: each
+    worker replays its slice of the snapshot, or records its own shard file.
+    Workers run under the coordinator's lease: they are terminated if it is
+    taken over.
+    """
+    import subprocess
+    import tempfile
+
+    bootstrap_netbox(nb, config)
+    authentication = config['azure']['authentication']
+    if not args.from_snapshot and (authentication.get('token_cache') or {}).get('path'):
+        # Workers then read the token from the shared cache instead of each probing the chain
+        import credentials
+        credentials.warm(get_azure_credentials(authentication['method'], authentication))
+
+    report = RunReport()
+    with tempfile.TemporaryDirectory(prefix='azure-sync-') as tmp_dir:
+        workers = []
+        for index in range(args.workers):
+            shard_report = os.path.join(tmp_dir, f"shard{index}.json")
+            cmd = [sys.executable, os.path.abspath(sys.argv[0]), '--config', args.config,
+                   '--shard', f"{index}/{args.workers}", '--skip-bootstrap', '--report', shard_report]
+            if args.resume:
+                cmd.append('--resume')
+            if args.budget:
+                cmd += ['--budget', str(args.budget)]
+            if args.from_snapshot:
+                cmd += ['--from-snapshot', os.path.abspath(args.from_snapshot)]
+            if args.record_snapshot:
+                cmd += ['--record-snapshot', os.path.abspath(args.record_snapshot)]
+            logger.info(f"Starting worker {index}/{args.workers}")
+            workers.append((index, shard_report, subprocess.Popen(cmd)))
+
+        while lease and any(proc.poll() is None for _, _, proc in workers):
+            if lease.lost:
+                logger.error("Run lease lost, terminating the workers")
+                for _, _, proc in workers:
+                    if proc.poll() is None:
+                        proc.terminate()
+                break
+            time.sleep(1)
+        for index, shard_report, proc in workers:
+            returncode = proc.wait()
+            shard = RunReport.load(shard_report)
+            if shard:
+                report.merge(shard)
+            if returncode != 0:
+                report.error(f"Worker {index}/{args.workers} exited with code {returncode}")
+                report.status = 'failure'
+    report.finished_at = time.time()
+    if report.status == 'running':
+        report.status = 'success'
+    if lease:
+        lease.check()
+    return report
+
+def run_tenants(orchestration, args):
+    """
+    --tenants FILE: sync every tenant of an orchestrator file in this process
+    (tenants.py). Tenants of one Netbox target share its client and bootstrap.
+    Returns the consolidated RunReport.
+    """
+    import tenants
+
+    def run_tenant(tenant, nb):
+        config = tenant.config
+        report = RunReport()
+        authentication = config['azure']['authentication']
+        credential = get_azure_credentials(authentication.get('method', 'default'), authentication)
+        try:
+            run_lease = acquire_lease(config, nb)
+        except LeaseHeld as e:
+            logger.warning(f"Skipping tenant {tenant.name}: {str(e)}")
+            return report.finish('skipped')
+        try:
+            checkpoint = open_checkpoint(config, args, scope=f"{os.path.abspath(args.tenants)} tenant {tenant.name}")
+            run_sync(config, credential, nb, report, bootstrap=False, checkpoint=checkpoint,
+                     deadletter=open_deadletter(config), lease=run_lease)
+            checkpoint.clear()
+        finally:
+            if run_lease:
+                run_lease.release()
+        return report
+    
+    logger.info(f"Syncing {len(orchestration.tenants)} tenants to {len(orchestration.targets)} Netbox targets "
+                f"({orchestration.max_concurrency} at a time)")
+    return tenants.run(orchestration, connect_netbox, bootstrap_netbox, run_tenant)
 
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Sync Azure network data to Netbox')
+    parser.add_argument('command', nargs='?', choices=('sync', 'plan', 'apply', 'replay'), default='sync',
+                        help='sync (default); plan [FILE]: read everything and write the Netbox change set, '
+                             'no write; apply FILE: execute a plan without reading Netbox; replay [FILE]: '
+                             'retry the dead-lettered writes of a previous run')
+    parser.add_argument('path', nargs='?', help='plan: output file (default plan.path); apply: the plan file; '
+                                                'replay: the dead-letter file (default deadletter.path)')
+    parser.add_argument('--prune', action='store_true',
+                        help='plan: also delete synced prefixes of the planned subscriptions gone from Azure')
+    parser.add_argument('--force', action='store_true', help='apply: accept a plan older than plan.max_age')
     parser.add_argument('--config', help='Path to config YAML file', default='./config.yaml')
-    return parser.parse_args()
+    parser.add_argument('--check-config', action='store_true',
+                        help='Validate the config file and exit (does not load the Azure/Netbox SDKs)')
+    parser.add_argument('--report', help='Write the run report (JSON) to this file')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and sync every interval (see the daemon section of the config)')
+    parser.add_argument('--interval', type=int, help='Daemon: seconds between syncs (override config)')
+    parser.add_argument('--jitter', type=int, help='Daemon: random +/- seconds added to the interval (override config)')
+    parser.add_argument('--metrics-port', type=int, help='Daemon: port of the /healthz and /metrics endpoint (override config)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its checkpoint (skips finished subscriptions/VNets)')
+    parser.add_argument('--replay-failed', nargs='?', const='', metavar='FILE',
+                        help='Same as the replay command (default: deadletter.path)')
+    parser.add_argument('--from-snapshot', metavar='FILE',
+                        help='Skip Azure discovery and sync this inventory snapshot to Netbox')
+    parser.add_argument('--record-snapshot', metavar='FILE',
+                        help='Record the discovered inventory to this snapshot file (override config)')
+    parser.add_argument('--budget', type=int, metavar='SECONDS',
+                        help='Sync the most valuable subscriptions that fit in SECONDS, carry the rest over '
+                             '(override schedule.budget)')
+    parser.add_argument('--shard', metavar='I/N',
+                        help='Only sync the subscriptions of shard I of N (consistent hashing, 0 <= I < N)')
+    parser.add_argument('--workers', type=int,
+                        help='Bootstrap shared objects, then sync with N worker processes (one shard each)')
+    parser.add_argument('--bootstrap-only', action='store_true',
+                        help='Only create the shared Netbox objects (coordinator step before shard Jobs)')
+    parser.add_argument('--skip-bootstrap', action='store_true',
+                        help='Do not set up custom fields (already done by the coordinator)')
+    parser.add_argument('--tenants', metavar='FILE',
+                        help='Sync all tenants of an orchestrator file (see tenants.py); --config is not used')
+    parser.add_argument('--events', nargs='?', const='', metavar='SOURCE',
+                        help='Event-driven mode: spool:<dir> or webhook:<port> (default: events.source in config)')
+    args = parser.parse_args()
+    if args.command == 'apply' and not args.path:
+        parser.error("apply needs the plan file")
+    if args.from_snapshot and args.record_snapshot:
+        parser.error("--record-snapshot records an Azure discovery, --from-snapshot does not discover")
+    if args.workers:
+        ignored = [flag for flag, used in (
+            (args.command, args.command != 'sync'), ('--replay-failed', args.replay_failed is not None),
+            ('--shard', args.shard), ('--daemon', args.daemon), ('--events', args.events is not None),
+            ('--bootstrap-only', args.bootstrap_only), ('--tenants', args.tenants)) if used]
+        if ignored:
+            parser.error(f"--workers cannot be combined with {', '.join(ignored)}")
+    return args
 
 def main():
     """Main function to orchestrate the Azure to Netbox sync"""
     args = parse_arguments()
+    if args.tenants:
+        main_tenants(args)
+        return
     config = load_config(args.config)
+
+    errors = validate_config(config)
+    if args.check_config:
+        for error in errors:
+            print(f"[ERR] {error}", file=sys.stderr)
+        print(f"{args.config}: {'OK' if not errors else f'{len(errors)} error(s)'}")
+        sys.exit(1 if errors else 0)
+
     global logger
     logger = setup_logging(config)
     
-    netbox_url = config['netbox']['url']
-    netbox_token = config['netbox']['token']
-    if not netbox_url or not netbox_token:
-        logger.error("Netbox URL and token must be provided in config")
+    if errors:
+        for error in errors:
+            logger.error(error)
         sys.exit(1)
     
+    if args.record_snapshot:
+        config.setdefault('snapshot', {})['path'] = args.record_snapshot
+    if args.budget:
+        config.setdefault('schedule', {})['budget'] = args.budget
+    
+    shard = None
+    if args.shard:
+        import sharding
+        try:
+            shard = sharding.parse_shard(args.shard)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+    
+    report = RunReport()
+    run_lease = None
     try:
         logger.info("Starting Azure to Netbox sync")
         
-        credential = get_azure_credentials(config['azure']['authentication']['method'])
+        nb = connect_netbox(config)
+        if args.bootstrap_only:
+            bootstrap_netbox(nb, config)
+            report.finish()
+            return
+        # Shard workers run under the lease of their coordinator; daemon and
+        # events modes take it per cycle
+        if not shard and not args.daemon and args.events is None and args.command != 'plan':
+            run_lease = acquire_lease(config, nb)
         
-        azure_subs = config['azure']['subscriptions']
-        if azure_subs.get('process_all', False):
-            subscriptions = get_azure_subscriptions(credential)
-        elif 'specific_id' in azure_subs and azure_subs['specific_id']:
-            logger.info(f"Fetching details for specific subscription {azure_subs['specific_id']}")
-            subscription_client = SubscriptionClient(credential)
-            try:
-                sub = subscription_client.subscriptions.get(azure_subs['specific_id'])
-                subscriptions = [type('obj', (object,), {
-                    'subscription_id': sub.subscription_id,
-                    'display_name': sub.display_name
-                })]
-                logger.info(f"Found subscription: {sub.display_name} ({sub.subscription_id})")
-            except Exception as e:
-                logger.error(f"Failed to fetch subscription {azure_subs['specific_id']}: {str(e)}")
+        if args.command == 'plan':
+            run_plan(config, nb, args, report, shard)
+            return
+        if args.command == 'apply':
+            run_apply(config, nb, args, report, run_lease)
+            logger.info(f"Plan applied in {report.duration:.1f}s: {dict(report.counters)}")
+            return
+        if args.workers:
+            report = run_workers(config, nb, args, run_lease)
+            logger.info(f"Sharded sync finished ({report.status}) in {report.duration:.1f}s: {dict(report.counters)}")
+            if report.status != 'success':
                 sys.exit(1)
-        elif 'management_group' in azure_subs:
-            mg = azure_subs['management_group']
-            subscriptions = get_management_group_subscriptions(
-                credential, 
-                mg.get('id'), 
-                mg.get('name')
-            )
-            if not subscriptions:
-                logger.error("No subscriptions found in the specified management group")
+            return
+        
+        if args.command == 'replay' or args.replay_failed is not None:
+            path = args.path or args.replay_failed or config.get('deadletter', {}).get('path')
+            if not path:
+                logger.error("No dead-letter file to replay: give FILE or set deadletter.path")
                 sys.exit(1)
-        else:
-            logger.error("No valid subscription configuration provided")
-            sys.exit(1)
+            run_deadletter_replay(config, nb, path, report)
+            if report.status != 'success':
+                sys.exit(1)
+            return
         
-        all_network_data = []
+        if args.from_snapshot:
+            run_replay(config, nb, args.from_snapshot, report, shard=shard, bootstrap=not args.skip_bootstrap,
+                       deadletter=open_deadletter(config, shard))
+            logger.info(f"Snapshot replay completed in {report.duration:.1f}s: {dict(report.counters)}")
+            return
         
-        for subscription in subscriptions:
-            subscription_id = subscription.subscription_id
-            subscription_data = {
-                'subscription_id': subscription_id,
-                'subscription_name': subscription.display_name,
-                'vnets': []
-            }
-            
-            vnets_data = get_vnets_and_subnets(subscription_id, credential)
-            vnets_data = apply_filters(vnets_data, config)  # Apply filters
-            vnets_with_devices = get_devices_in_subnet(subscription_id, credential, vnets_data)
-
-            # Temporary fake device for testing (configurable? For now, keep as is)
-            if not any(subnet['devices'] for vnet in vnets_with_devices for subnet in vnet['subnets']):
-                logger.warning("No devices found; adding fake one for testing")
-                if vnets_with_devices and vnets_with_devices[0]['subnets']:
-                    fake_device = {
-                        'name': 'test-vm',
-                        'id': '/fake/id',
-                        'type': 'vm',
-                        'ip_address': '10.0.0.99',
-                        'mac_address': '00:11:22:33:44:55',
-                        'resource_group': 'fake-rg',
-                        'location': 'westeurope',
-                        'os_type': 'Linux'
-                    }
-                    vnets_with_devices[0]['subnets'][0]['devices'].append(fake_device)
-            
-            subscription_data['vnets'] = vnets_with_devices
-            all_network_data.append(subscription_data)
+        credential = get_azure_credentials(config['azure']['authentication']['method'],
+                                           config['azure']['authentication'])
         
-        # Setup Netbox API
-        nb = api(netbox_url, token=netbox_token)
-        session = requests.Session()
-        session.verify = config['ssl']['verify']
-        session.timeout = config['timeouts']['netbox_api']
-        nb.http_session = session
+        if args.events is not None:
+            run_events(config, credential, nb, args)
+            return
+        if args.daemon:
+            run_daemon(config, credential, nb, args)
+            return
         
-        setup_custom_fields(nb, config)
-        sync_to_netbox(all_network_data, config, nb)
+        checkpoint = open_checkpoint(config, args, shard)
+        run_sync(config, credential, nb, report, shard=shard, bootstrap=not args.skip_bootstrap,
+                 checkpoint=checkpoint, deadletter=open_deadletter(config, shard), lease=run_lease)
+        checkpoint.clear()
         
-        logger.info("Azure to Netbox sync completed successfully")
+        logger.info(f"Azure to Netbox sync completed successfully in {report.duration:.1f}s: {dict(report.counters)}")
         
+    except LeaseHeld as e:
+        logger.warning(f"Another sync is running, exiting: {str(e)}")
+        report.finish('skipped')
     except Exception as e:
         logger.error(f"Error during Azure to Netbox sync: {str(e)}", exc_info=True)
+        report.error(str(e))
+        report.finish('failure')
+        sys.exit(1)
+    finally:
+        if run_lease:
+            run_lease.release()
+        if args.report and not args.daemon and args.events is None:
+            report.save(args.report)
+
+def main_tenants(args):
+    """main() of --tenants: validate every tenant, sync them, write one consolidated report"""
+    global logger
+    import tenants
+
+    orchestration = tenants.load(args.tenants, load_config)
+    errors = tenants.validate(orchestration, validate_config)
+    if args.check_config or errors:
+        for error in errors:
+            print(f"[ERR] {error}", file=sys.stderr)
+        print(f"{args.tenants}: {'OK' if not errors else f'{len(errors)} error(s)'} "
+              f"({len(orchestration.tenants)} tenants, {len(orchestration.targets)} targets)")
+        sys.exit(1 if errors else 0)
+    
+    # Logging settings of the first tenant (all inherit them from the base config)
+    logger = setup_logging(orchestration.tenants[0].config)
+    
+    report = RunReport()
+    try:
+        report = run_tenants(orchestration, args)
+        logger.info(f"Multi-tenant sync finished ({report.status}) in {report.duration:.1f}s: "
+                    f"{ {name: tenant['status'] for name, tenant in report.tenants.items()} }")
+        if report.status != 'success':
+            sys.exit(1)
+    except Exception as e:
+        logger.error(f"Error during multi-tenant sync: {str(e)}", exc_info=True)
+        report.error(str(e))
+        report.finish('failure')
         sys.exit(1)
+    finally:
+        if args.report:
+            report.save(args.report)
 
 if __name__ == "__main__":
     main()
 ```
 
 ### How to Use It
-1. **Install Dependencies**: Ensure you have `pyyaml` installed (`pip install pyyaml`). The other imports are from the original script.
-2. **Prepare config.yaml**: Use the template you provided. Customize as needed (e.g., set `process_all: true` or `specific_id`, add filters like `regions.include: ["northeurope"]`, etc.). Note: For mutually exclusive subscription options, set only one.
+1. **Install Dependencies**: Ensure you have `pyyaml` installed (`pip install pyyaml`). The other imports are from the original script. Optional: `cryptography` (`pip install cryptography`) encrypts the `azure.authentication.token_cache` file; without it the token cache stays in memory.
+2. **Prepare config.yaml**: Use the template you provided. The optional features (token cache, snapshot, trends, schedule, lease, dead-letter queue, peering and capacity custom fields) ship commented out or `enabled: false`; uncomment or enable the ones you want. Customize as needed (e.g., set `process_all: true` or `specific_id`, add filters like `regions.include: ["northeurope"]`, etc.). Note: For mutually exclusive subscription options, set only one.
 3. **Run the Script**: 
    - `python azure-sync.py --config /path/to/config.yaml`
    - If the config is in the current directory as `config.yaml`, just `python azure-sync.py`.
+   - `python azure-sync.py --config /path/to/config.yaml --check-config` validates the config and exits (0 = OK) without loading the Azure SDKs or pynetbox; use it as a pre-flight step in cron/Kubernetes Jobs.
+   - `python azure-sync.py --daemon [--interval 3600 --jitter 300 --metrics-port 9464]` keeps the process alive and syncs on a schedule, reusing credentials, Azure clients, the Netbox HTTP session and the tag/site/device-type/custom-field cache between cycles. `GET /healthz` returns 503 when no cycle has succeeded for longer than expected (partial runs and cycles skipped under another instance's lease count as healthy, so standby replicas pass their probe); `GET /metrics` exposes last-run duration, lag and counters in Prometheus format.
+   - `python azure-sync.py --events spool:/var/spool/azure-sync` (or `--events webhook:8085`) consumes Event Grid resource write/delete events for VNets, subnets, NICs and VMs. Bursts are debounced and coalesced per resource, then applied as targeted updates through `sync_vnet`/`sync_device`. Deletes mark prefixes `deprecated` and devices `offline`. Each batch takes the run lease; while another run holds it, the batch goes back into the coalescer and is retried after the debounce. A full sync runs daily at `events.reconcile_at`.
+   - Sharding: `python azure-sync.py --workers 4` bootstraps the shared Netbox objects once (custom fields, sync/additional/environment tags, device types/roles, sites and tags of `organization.regions.mapping`). It then runs 4 worker processes, one shard each, and merges their reports. `--from-snapshot FILE` makes each worker replay its shard of the file; `--record-snapshot FILE` makes each worker record its own shard file. Options a worker cannot honour (`plan`, `apply`, `replay`, `--shard`, `--daemon`, `--events`...) are rejected with `--workers`. On Kubernetes, run `--bootstrap-only` once (init Job), then an Indexed Job with `--shard $(JOB_COMPLETION_INDEX)/N --skip-bootstrap`. Subscriptions are split by consistent hashing (`sharding.py`), so changing N moves only ~1/N of them.
+   - Management groups: the hierarchy is cached in `azure.management_group_cache.path` for `ttl` seconds. On a miss, each group is expanded one level in parallel instead of one recursive call. With `custom_fields.azure_management_group.enabled`, every prefix also gets the name of its subscription's management group at no extra API cost.
+   - Snapshots: with `snapshot.path` set (strftime patterns allowed, `.gz` compresses), each discovered subscription is streamed to a compact NDJSON inventory (dictionary-encoded strings). A shard (`--shard i/N`, or each `--workers` process) writes its own `<name>.shardI-of-N.ndjson[.gz]`. `python snapshot.py summary|diff|capacity-csv` reads it lazily without Azure or Netbox. `capacity-csv` produces the CSV `ips/netbox.py` consumes.
+   - Replay: `python azure-sync.py --from-snapshot snapshots/inventory-....ndjson.gz --report replay.json` skips every Azure client and feeds a saved inventory straight into the Netbox stage. Use it to benchmark or debug the Netbox write path repeatably, or to re-run only the Netbox side. `--record-snapshot FILE` records one during a normal run (overrides `snapshot.path`).
+   - Schema bootstrap: custom fields and base tags (sync, additional and environment tags) are fingerprinted from the config. When the fingerprint matches `schema.cache_path`, the bootstrap makes no Netbox request. Otherwise it lists the existing objects with one filtered GET per type, then bulk-creates the missing ones and bulk-updates the drifted custom fields. The cache is re-validated after `schema.ttl` seconds and dropped when a daemon/events cycle fails.
+   - Peering status: with `peering.enabled` and the `peering_status` custom field enabled, each VNet prefix gets `peering.ok_value`, `ko_value` or `no_peerings_value`. The value comes from a peering graph built from the peerings `virtual_networks.list_all()` already returns inline, so there are no extra Azure calls. A peering is KO when it is not `Connected`, not fully in sync, or asymmetric (the remote VNet is in the inventory but does not peer back). The value is written in the same prefix update as `azure_subscription`.
+   - Capacity: the `list_available_ips` (text defined once in `capacity.py`, which `ips/netbox.py` also uses), `ips_used` and `ips_available` custom fields are computed from the NIC addresses the sync already discovers. Each subnet is charged Azure's 5 reserved IPs, and an address space sums its subnets. The fields are written in the prefix upsert itself, so the separate `azure-vnet-scan.sh` + `ips/netbox.py` pass is no longer needed (disable a field to keep it out).
+   - Capacity trends: with `trends.path` set, each run appends the used/available IPs of every prefix to a SQLite file (downsampled to one sample per day after `raw_days`, dropped after `retention_days`). `python trends.py report trends.sqlite --top 20` fits the growth of all prefixes in one aggregate query and lists the projected exhaustion dates. `--write-netbox` writes the top-N to the `capacity_forecast` custom field in one bulk update.
+   - Free blocks: `python allocator.py snapshots/inventory-....ndjson.gz 10.0.0.0/8 --prefixlen 24 --count 4` (or `--largest`) answers from a merged interval index of every VNet address space and subnet, in milliseconds and without Azure calls. `--netbox` also avoids the prefixes already in Netbox, and `--reserve` creates the result as `reserved` prefixes. From Python: `IntervalIndex(used_networks(all_network_data)).allocate(container, 24, 4)`.
+   - No-op updates: existing prefixes, devices, interfaces and IPs are compared with their desired state in canonical form (nested objects and `{'id': n}` as ids, choices as values, tags as sorted id lists, only the custom fields we manage). They are saved only on a real difference. The run report counts `<kind>_updated` vs `<kind>_unchanged`. Tags on devices, interfaces and IPs are only ever added. An existing device only gets tags: its type, role and status are set at creation, so operator edits and the `offline` status of a deleted VM are kept.
+   - Resume: a normal run checkpoints its progress to `checkpoint.path` (one file per shard). It records the subscriptions fully written to Netbox and the VNets done in the current one, after every VNet. If the run dies (pod eviction, token expiry, Netbox restart), `--resume` skips the finished work, without even rediscovering finished subscriptions, and continues from the last written VNet. The file is deleted when the run succeeds. With `--workers N --resume` each worker resumes its own shard.
+   - Failed writes: with `deadletter.path` set, a VNet or device whose Netbox write fails is appended to that NDJSON file with its payload and error, and the run continues. The run aborts only after `max_failures` failures, e.g. when Netbox is down. `python azure-sync.py replay [FILE]` (or `--replay-failed [FILE]`) retries just those entries (`retries` attempts, exponential `backoff`), with no Azure call, and keeps only the ones still failing. Shards write `FILE.shardI-of-N`.
+   - GraphQL prefetch: with `netbox.graphql_prefetch: true`, the prefixes, devices, interfaces and IP addresses are read up front through `/graphql/` in pages of `graphql_page_size`. Only the compared fields are fetched (id, prefix, vrf, status, description, tags, custom fields, name, site, device, assigned object), and the results are indexed. The sync then replaces most REST lookups with dictionary hits; a miss still falls back to REST. `python bench.py graphql` compares both read paths (requests, bytes, time) against a local stub or a real Netbox.
+   - Multi-tenant: `python azure-sync.py --tenants tenants.yaml --report run.json` syncs every tenant block of an orchestrator file in one process (format in `tenants.py`). Each block is merged over a shared `base` config and names a Netbox `target`. Tenants of the same target share one pynetbox client and connection pool (`pool_size`). The schema bootstrap runs once per target and distinct schema. Tenants run concurrently, limited by `max_concurrency` overall and `max_tenants` per target. Within a tenant, `discovery_workers` subscriptions are discovered in parallel. Checkpoint, dead-letter, snapshot, trends and management group cache files get a per-tenant suffix. The report holds one summary per tenant plus the merged counters. `--check-config` validates every tenant. `azure.authentication.method: service_principal` authenticates against each tenant's `tenant_id`.
+   - Run lease: with a `lease` section, a run started while another one is still syncing waits up to `lease.wait` seconds, then exits 0 with a `skipped` report. Shard workers run under their coordinator's lease; daemon cycles and events reconciliations take it per cycle, event batches per batch. The `file` backend is an flock that the kernel releases when a run dies, for one host. The `netbox` backend creates a lease tag (unique slug, so creation is atomic) whose expiry a heartbeat pushes forward every `ttl/3`. A lease past its expiry belongs to a crashed run and is reclaimed, so it works across hosts and pods. A run whose heartbeat finds its lease taken over, or cannot renew it for `ttl` seconds, stops before its next VNet or apply batch and fails; `--resume` continues it later. A `--workers` coordinator terminates its workers in that case.
+   - Plan/apply: `python azure-sync.py plan [FILE]` does every read up front: Azure discovery (or `--from-snapshot`) and a bulk read of Netbox (GraphQL, else one paginated list per type). It writes the full change set to a compact plan file (default `plan.path`) and logs creates/updates/deletes per object type. `python azure-sync.py apply FILE` then runs only those writes, one bulk call per `plan.batch_size` objects, in dependency order (tags and custom fields, then sites/device types/roles, prefixes, devices, interfaces, IPs). It reads nothing back: objects created by the plan are referenced through placeholder ids. `apply` refuses a plan made for another Netbox, or older than `plan.max_age` without `--force`. `plan --prune` also plans the deletion of synced prefixes whose subscription is planned but which are gone from Azure. Use it to run the read side off-peak and keep the write window short.
+   - Credentials: `azure.authentication.chain` (e.g. `[managed_identity, cli]`) builds only those azure-identity credentials, in that order. There is no DefaultAzureCredential probing (IMDS timeouts, CLI subprocess) of unused sources; without `chain`, `method` alone is used. With `token_cache.path`, access tokens are stored encrypted (Fernet, `pip install cryptography`; in memory only without it) and shared by later runs and by `--workers` processes. The coordinator fetches the first token, so workers never authenticate themselves. A token within `refresh_margin` seconds of expiry is still served while the next one is fetched in the background.
+   - Network resources: private endpoint IPs are attributed to the private endpoint (recognised from its NIC in the NIC list already read). Internal load balancer frontends, application gateway frontends and Azure Firewall IPs, which have no NIC, are read with one `list_all()` per type and subscription. Each becomes a device of its own type and role (`Azure Private_Endpoint`, `Azure Load_Balancer`, `Azure Application_Gateway`, `Azure Firewall`) instead of an anonymous network interface or nothing, so subnet usage in Netbox is complete. `azure.resource_types` limits which types are resolved; a private endpoint left out stays a `Network_Interface` device.
+   - Scheduling: with a `schedule` section, subscriptions are synced highest value first instead of in Azure's order. The value combines a priority (`overrides` per subscription, else `priorities` by the dev/hml/uat/prd environment of its name), a bonus for subscriptions whose inventory changed recently, and the hours since their last sync. With `schedule.budget` (or `--budget SECONDS`), only the subscriptions whose runtime in previous runs fits the budget are synced, and no new one starts once it has elapsed. The rest is carried over to `schedule.path` and goes first on the next run, so production is synced first and nothing starves. Shards keep one schedule file each.
+   - Write concurrency: the devices of a VNet are written by `netbox.concurrency.max` threads when `netbox.concurrency` is set, otherwise by the fixed `netbox.write_workers` (default 1). All the entries of one device (same name and site, e.g. a multi-IP NIC or a load balancer with several frontends) go to the same thread, so a device is never created twice. With `netbox.concurrency`, every Netbox request goes through an adaptive limiter (AIMD), which decides how many of the writers' requests are actually in flight. The limit is cut by `backoff` when the p95 latency of a `window` of requests exceeds `target_p95` or too many fail, and cut at once on a 429, which is retried after its Retry-After. It grows by one while requests queue for a slot and Netbox keeps up. Tenants of one target share its limiter, but each run counts its own requests. The run report (and the daemon `/metrics`) holds the gauges `netbox_concurrency_limit` and `netbox_requests_per_second` (merged shard and tenant reports keep the highest) and the counters `netbox_requests`, `netbox_errors` and `netbox_throttled`. `python bench.py concurrency` compares one writer, `--max` fixed writers and the limiter against a local stub with injectable latency, whose capacity drops halfway through.
+   - `--report run.json` writes the run report (duration, counters, per-subscription timings, errors).
+   - `python bench.py startup` guards the startup time of `--help` / `--check-config` and fails if an Azure/Netbox SDK gets imported at module level.
 4. **Testing**: Start with a simple config and check logs for filtered items or created tags/custom fields.
 5. **Extensibility**: If you need more config options (e.g., for timeouts in Azure calls), you can extend the script accordingly.
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Azure -> Netbox sync scripts.
+
+    python bench.py startup [--script azure-sync.py] [--config config.yaml]
+    python bench.py graphql [--prefixes 5000] [--url https://netbox/api --token ...]
+    python bench.py concurrency [--latency 0.01] [--capacity 8] [--busy-capacity 3] [--requests 1000]
+
+Each benchmark prints its measurements and exits non-zero when a guard is
+exceeded (or a script exits non-zero), so it can run in CI next to the
+deployment workflows. azure-sync.py and config.yaml are markdown documents
+around a fenced block: the startup bench runs (and parses) that block.
+"""
+
+import os
+import sys
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must never be loaded by --help / --check-config
+HEAVY_MODULES = ('azure.identity', 'azure.mgmt', 'pynetbox', 'requests')
+
+def run_timed(cmd, env=None):
+    """Run a command, return (wall seconds, completed process)"""
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    return time.perf_counter() - start, proc
+
+def fenced_block(path, language):
+    """
+    The ```<language> block of a file written as a markdown fence (azure-sync.py
+    and config.yaml are), None for a plain file
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+    fence = f'```{language}'
+    if fence not in lines or lines[0].startswith('#!'):
+        return None
+    start = lines.index(fence) + 1
+    end = lines.index('```', start) if '```' in lines[start:] else len(lines)
+    return '\n'.join(lines[start:end]) + '\n'
+
+def unfenced(path, language, workdir):
+    """
+    Path of a file that runs/parses as is: a markdown-fenced file has its
+    block written to workdir, a plain file is returned unchanged.
+    """
+    source = fenced_block(path, language)
+    if source is None:
+        return path
+    extracted = os.path.join(workdir, os.path.basename(path))
+    with open(extracted, 'w') as f:
+        f.write(source)
+    return extracted
+
+def runnable_script(script_path, workdir):
+    """(path, env) to run a script: an extracted one gets its own directory on PYTHONPATH for the sibling modules"""
+    run_path = unfenced(script_path, 'python', workdir)
+    if run_path == script_path:
+        return script_path, None
+    pythonpath = os.pathsep.join(filter(None, [os.path.dirname(script_path), os.environ.get('PYTHONPATH')]))
+    return run_path, dict(os.environ, PYTHONPATH=pythonpath)
+
+def exit_failure(script, mode, proc):
+    """Failure message of a non-zero exit (last stderr line), None on success"""
+    if proc.returncode == 0:
+        return None
+    last_line = (proc.stderr.strip().splitlines() or [''])[-1]
+    return f"{script} {mode} exited with code {proc.returncode}: {last_line}"
+
+def heavy_imports(importtime_output):
+    """Return the heavy modules found in a `python -X importtime` stderr dump"""
+    found = set()
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        module = line.rsplit('|', 1)[-1].strip()
+        for heavy in HEAVY_MODULES:
+            if module == heavy or module.startswith(heavy + '.'):
+                found.add(heavy)
+    return sorted(found)
+
+def bench_startup(args):
+    """Measure --help and --check-config wall time and check no SDK gets imported"""
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        config_path = unfenced(os.path.abspath(args.config), 'yaml', workdir)
+        for script in args.script:
+            script_path = os.path.join(HERE, script) if not os.path.isabs(script) else script
+            run_path, env = runnable_script(script_path, workdir)
+            for mode in (['--help'], ['--check-config', '--config', config_path]):
+                cmd = [sys.executable, run_path] + mode
+                runs = [run_timed(cmd, env) for _ in range(args.runs)]
+                samples = [elapsed for elapsed, _ in runs]
+                median = statistics.median(samples)
+
+                _, proc = run_timed([sys.executable, '-X', 'importtime'] + cmd[1:], env)
+                heavy = heavy_imports(proc.stderr)
+
+                print(f"{os.path.basename(script_path):<32} {' '.join(mode[:1]):<16} "
+                      f"median={median * 1000:7.1f} ms  min={min(samples) * 1000:7.1f} ms  "
+                      f"heavy_imports={','.join(heavy) or '-'}")
+                # A script that crashes at startup is fast and imports nothing: never a pass
+                failure = next(filter(None, (exit_failure(script, mode[0], p) for _, p in runs + [(0, proc)])), None)
+                if failure:
+                    failures.append(failure)
+                    continue
+                if heavy:
+                    failures.append(f"{script} {mode[0]} imports {', '.join(heavy)}")
+                if median > args.max_seconds:
+                    failures.append(f"{script} {mode[0]} took {median:.2f}s (> {args.max_seconds}s)")
+
+    for failure in failures:
+        print(f"[FAIL] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+def stub_prefix(index):
+    """A prefix as the Netbox 4 REST API returns it (nested objects included)"""
+    prefix = f"10.{index // 256 % 256}.{index % 256}.0/24"
+    tag = {'id': 1, 'url': 'http://stub/api/extras/tags/1/', 'display': 'azure-sync', 'name': 'azure-sync',
+           'slug': 'azure-sync', 'color': 'aa1409'}
+    return {
+        'id': index + 1, 'url': f'http://stub/api/ipam/prefixes/{index + 1}/', 'display_url': f'http://stub/ipam/prefixes/{index + 1}/',
+        'display': prefix, 'family': {'value': 4, 'label': 'IPv4'}, 'prefix': prefix, 'vrf': None,
+        'scope_type': None, 'scope_id': None, 'scope': None, 'tenant': None, 'vlan': None,
+        'status': {'value': 'active', 'label': 'Active'}, 'role': None, 'is_pool': False, 'mark_utilized': False,
+        'description': f"Azure Subnet: subnet-{index} (VNet: vnet-{index // 16})", 'comments': '',
+        'tags': [tag], 'custom_fields': {'azure_subscription': 'sub - 00000000-0000-0000-0000-000000000000',
+                                         'azure_subscription_url': 'https://portal.azure.com/#@/subscription/0/overview'},
+        'created': '2025-01-01T00:00:00.000000Z', 'last_updated': '2025-01-01T00:00:00.000000Z',
+        'children': 0, '_depth': 1,
+    }
+
+def start_stub(count):
+    """Local Netbox stub: REST /api/ipam/prefixes/?prefix= and GraphQL prefix_list"""
+    prefixes = [stub_prefix(index) for index in range(count)]
+    by_prefix = {p['prefix']: p for p in prefixes}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            results = [by_prefix[p] for p in query.get('prefix', []) if p in by_prefix]
+            self._send({'count': len(results), 'next': None, 'previous': None, 'results': results})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            variables = request.get('variables', {})
+            page = prefixes[variables['offset']:variables['offset'] + variables['limit']]
+            self._send({'data': {'prefix_list': [
+                {'id': str(p['id']), 'prefix': p['prefix'], 'description': p['description'], 'status': 'ACTIVE',
+                 'vrf': None, 'tags': [{'id': '1'}], 'custom_fields': p['custom_fields']} for p in page]}})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, [p['prefix'] for p in prefixes]
+
+class UrllibSession:
+    """requests-like session on urllib (the benchmark must not depend on requests/pynetbox)"""
+
+    class Response:
+        def __init__(self, content, status_code=200, headers=None):
+            self.content = content
+            self.status_code = status_code
+            self.headers = headers or {}
+
+        def json(self):
+            return json.loads(self.content)
+
+        def raise_for_status(self):
+            pass
+
+    def __init__(self):
+        self.headers = {}
+
+    def get(self, url, headers=None):
+        request = urllib.request.Request(url, headers={**self.headers, **(headers or {})})
+        with urllib.request.urlopen(request) as response:
+            return self.Response(response.read())
+
+    def post(self, url, data, headers=None):
+        request = urllib.request.Request(url, data=data.encode(), headers={**self.headers, **(headers or {})})
+        with urllib.request.urlopen(request) as response:
+            return self.Response(response.read())
+
+    def request(self, method, url, headers=None, **kwargs):
+        """Any method; HTTP errors are returned as responses (status_code), like requests does"""
+        data = json.dumps(kwargs['json']).encode() if kwargs.get('json') is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={**self.headers, **(headers or {})})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return self.Response(response.read(), response.status, response.headers)
+        except urllib.error.HTTPError as e:
+            return self.Response(e.read(), e.code, e.headers)
+
+def bench_graphql(args):
+    """Compare the per-prefix REST lookups of the sync with the GraphQL bulk prefetch"""
+    sys.path.insert(0, HERE)
+    import nbgraphql
+
+    server = None
+    if args.url:
+        api_url, token = args.url.rstrip('/'), args.token
+        rest_prefixes = None
+    else:
+        server, rest_prefixes = start_stub(args.prefixes)
+        api_url, token = f"http://127.0.0.1:{server.server_address[1]}/api", 'stub'
+
+    session = UrllibSession()
+    session.headers = {'Authorization': f"Token {token}", 'Accept': 'application/json'}
+    client = nbgraphql.GraphQLClient(nbgraphql.graphql_url(api_url), token, session)
+
+    start = time.perf_counter()
+    fetched = [nbgraphql.to_rest('prefixes', obj) for obj in client.fetch_all('prefixes', args.page_size)]
+    graphql_time = time.perf_counter() - start
+
+    # What the sync does without prefetch: one filtered GET per prefix
+    rest_prefixes = rest_prefixes or [p['prefix'] for p in fetched]
+    rest_bytes = 0
+    start = time.perf_counter()
+    for prefix in rest_prefixes:
+        rest_bytes += len(session.get(f"{api_url}/ipam/prefixes/?{urllib.parse.urlencode({'prefix': prefix})}").content)
+    rest_time = time.perf_counter() - start
+    if server:
+        server.shutdown()
+
+    print(f"{'path':<10} {'objects':>8} {'requests':>9} {'KiB':>10} {'seconds':>9}")
+    print(f"{'rest':<10} {len(rest_prefixes):>8} {len(rest_prefixes):>9} {rest_bytes / 1024:>10.0f} {rest_time:>9.2f}")
+    print(f"{'graphql':<10} {len(fetched):>8} {client.requests:>9} {client.bytes / 1024:>10.0f} {graphql_time:>9.2f}")
+
+    failures = []
+    if len(fetched) != len(rest_prefixes):
+        failures.append(f"GraphQL returned {len(fetched)} prefixes, expected {len(rest_prefixes)}")
+    if fetched and fetched[0]['status'] != 'active':
+        failures.append(f"GraphQL status not normalized: {fetched[0]['status']!r}")
+    if client.bytes >= rest_bytes or graphql_time >= rest_time:
+        failures.append("GraphQL prefetch is not smaller and faster than the REST lookups")
+    for failure in failures:
+        print(f"[FAIL] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+def start_latency_stub(latency, capacity):
+    """
+    Local Netbox stub with injectable latency: a request takes `latency`
+    seconds while at most state['capacity'] are in flight, proportionally
+    longer beyond (the server queues), and 429 beyond twice the capacity.
+    Change state['capacity'] to simulate business hours.
+    """
+    state = {'capacity': capacity, 'in_flight': 0, 'throttled': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _serve(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            with lock:
+                state['in_flight'] += 1
+                in_flight, capacity = state['in_flight'], state['capacity']
+            try:
+                if in_flight > 2 * capacity:
+                    with lock:
+                        state['throttled'] += 1
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0.05')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                time.sleep(latency * max(1.0, in_flight / capacity))
+                body = b'{"id": 1, "name": "stub-device"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        do_GET = do_POST = do_PATCH = _serve
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 128
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+def run_workload(url, limiter, count, threads, state, busy_capacity):
+    """
+    `count` device writes from `threads` writer threads through a
+    LimitedSession; the stub drops to busy_capacity halfway. Returns
+    (seconds, HTTP round-trip latencies, final limit).
+    """
+    import queue
+    from concurrency import LimitedSession
+
+    latencies = []
+    done = []
+    lock = threading.Lock()
+
+    class TimedSession(UrllibSession):
+        def request(self, method, url, **kwargs):
+            start = time.perf_counter()
+            response = super().request(method, url, **kwargs)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            return response
+
+    session = LimitedSession(TimedSession(), limiter)
+    work = queue.Queue()
+    for index in range(count):
+        work.put(index)
+
+    def writer():
+        while True:
+            try:
+                index = work.get_nowait()
+            except queue.Empty:
+                return
+            session.post(f"{url}/dcim/devices/", json={'name': f"device-{index}"})
+            with lock:
+                done.append(index)
+                if len(done) == count // 2:
+                    state['capacity'] = busy_capacity
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, latencies, int(limiter.limit)
+
+def bench_concurrency(args):
+    """Fixed concurrency (1 and --max) vs the adaptive limiter against a stub whose capacity drops halfway"""
+    sys.path.insert(0, HERE)
+    from concurrency import AdaptiveLimiter, percentile
+
+    print(f"{'writers':<12} {'requests':>9} {'seconds':>8} {'writes/s':>8} {'p95 ms':>8} {'429':>6} {'limit':>6}")
+    results = {}
+    for name, initial, low, high in (('fixed-1', 1, 1, 1), (f"fixed-{args.max}", args.max, args.max, args.max),
+                                     ('adaptive', args.initial, 1, args.max)):
+        server, state = start_latency_stub(args.latency, args.capacity)
+        limiter = AdaptiveLimiter(initial=initial, min_limit=low, max_limit=high, target_p95=args.target_p95,
+                                  window=args.window)
+        url = f"http://127.0.0.1:{server.server_address[1]}/api"
+        seconds, latencies, limit = run_workload(url, limiter, args.requests, high, state, args.busy_capacity)
+        server.shutdown()
+        results[name] = {'rate': args.requests / seconds, 'p95': percentile(latencies, 0.95),
+                         'throttled': state['throttled'], 'limit': limit}
+        print(f"{name:<12} {len(latencies):>9} {seconds:>8.2f} {results[name]['rate']:>8.0f} "
+              f"{results[name]['p95'] * 1000:>8.1f} {state['throttled']:>6} {limit:>6}")
+
+    adaptive, serial, flooding = results['adaptive'], results['fixed-1'], results[f"fixed-{args.max}"]
+    failures = []
+    if adaptive['rate'] < 2 * serial['rate']:
+        failures.append("Adaptive limiter is not at least twice as fast as one writer")
+    if adaptive['throttled'] > flooding['throttled'] / 4:
+        failures.append(f"Adaptive limiter got {adaptive['throttled']} 429s (fixed-{args.max}: {flooding['throttled']})")
+    if adaptive['limit'] > 2 * args.busy_capacity + 1:
+        failures.append(f"Adaptive limit ended at {adaptive['limit']}, above what the busy stub serves "
+                        f"({2 * args.busy_capacity})")
+    for failure in failures:
+        print(f"[FAIL] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmarks for the Azure -> Netbox sync')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    startup = sub.add_parser('startup', help='CLI startup time without Azure/Netbox SDK imports')
+    startup.add_argument('--script', action='append',
+                         help='Script to measure (repeatable, default: azure-sync.py and ../azure_netbox_with_config.py)')
+    startup.add_argument('--config', default=os.path.join(HERE, 'config.yaml'),
+                         help='Config passed to --check-config')
+    startup.add_argument('--runs', type=int, default=5, help='Runs per measurement')
+    startup.add_argument('--max-seconds', type=float, default=1.0,
+                         help='Fail if the median startup time exceeds this')
+    startup.set_defaults(func=bench_startup)
+
+    graphql = sub.add_parser('graphql', help='GraphQL bulk prefetch vs per-object REST lookups (payload, latency)')
+    graphql.add_argument('--prefixes', type=int, default=5000, help='Prefixes served by the local stub')
+    graphql.add_argument('--page-size', type=int, default=1000, help='GraphQL page size')
+    graphql.add_argument('--url', help='Real Netbox API URL instead of the local stub (read-only)')
+    graphql.add_argument('--token', help='Token for --url')
+    graphql.set_defaults(func=bench_graphql)
+
+    limiter = sub.add_parser('concurrency', help='Adaptive Netbox write concurrency vs fixed writer counts')
+    limiter.add_argument('--latency', type=float, default=0.01, help='Stub latency (s) within its capacity')
+    limiter.add_argument('--capacity', type=int, default=8, help='Requests the stub serves at full speed')
+    limiter.add_argument('--busy-capacity', type=int, default=3, help='Stub capacity after half of the requests')
+    limiter.add_argument('--requests', type=int, default=1000, help='Writes per scenario')
+    limiter.add_argument('--max', type=int, default=32, help='Writer threads (and maximum limit)')
+    limiter.add_argument('--initial', type=int, default=4, help='Initial adaptive limit')
+    limiter.add_argument('--target-p95', type=float, default=0.03, help='Adaptive limiter p95 target (s)')
+    limiter.add_argument('--window', type=int, default=20, help='Requests per adaptive limiter decision')
+    limiter.set_defaults(func=bench_concurrency)
+
+    args = parser.parse_args()
+    if args.bench == 'startup' and not args.script:
+        args.script = ['azure-sync.py', os.path.join('..', 'azure_netbox_with_config.py')]
+    return args
+
+def main():
+    args = parse_arguments()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
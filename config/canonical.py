@@ -0,0 +1,89 @@
+"""
+Canonical form of Netbox object state, so an update is sent only when the
+desired state really differs from what Netbox already holds.
+
+Both sides are reduced to plain JSON values before being compared: nested
+objects and {'id': n} references become n, choice fields ({'value', 'label'})
+become their value, '' and None are the same, tag lists are sorted id lists,
+and custom fields are compared on the keys we manage only. The current state
+comes from Record.serialize(), which needs no extra request.
+"""
+
+import hashlib
+import json
+
+def normalize(value):
+    """Plain, order-independent JSON value of a Netbox field"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, dict):
+        if 'id' in value:
+            return value['id']
+        if 'value' in value:
+            return value['value']
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = [normalize(item) for item in value]
+        try:
+            return sorted(items)
+        except TypeError:
+            return items
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    # pynetbox Record: look at 'id' only, other attribute lookups may fetch the object
+    return getattr(value, 'id', str(value))
+
+def digest(state):
+    """Stable hash of a normalized state dict"""
+    return hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+def current_state(record, desired):
+    """
+    Normalized state of a record restricted to the keys (and custom fields) of
+    `desired`. Keys the record does not carry (e.g. a prefix 'parent', which
+    Netbox computes) are left out: they can be neither compared nor written.
+    """
+    serialized = record.serialize()
+    state = {}
+    for key, value in desired.items():
+        if key not in serialized:
+            continue
+        if key == 'custom_fields':
+            current = serialized.get('custom_fields') or {}
+            state[key] = {name: normalize(current.get(name)) for name in value}
+        else:
+            state[key] = normalize(serialized.get(key))
+    return state
+
+def desired_state(desired):
+    return {key: normalize(value) for key, value in desired.items()}
+
+def plan_update(record, desired, merge=()):
+    """
+    Fields to write so that `record` matches `desired`, {} for a no-op.
+    Keys in `merge` (tag lists) are added to what the object already has
+    instead of replacing it; custom fields are always merged.
+    """
+    current = current_state(record, desired)
+    wanted = {key: value for key, value in desired_state(desired).items() if key in current}
+    for key in merge:
+        if key in wanted:
+            wanted[key] = sorted(set(current[key] or []) | set(wanted[key] or []))
+    if digest(current) == digest(wanted):
+        return {}
+
+    changes = {}
+    for key, value in wanted.items():
+        if value == current[key]:
+            continue
+        if key == 'custom_fields':
+            custom_fields = dict(record.serialize().get('custom_fields') or {})
+            custom_fields.update(desired['custom_fields'])
+            changes[key] = custom_fields
+        elif key in merge:
+            changes[key] = [{'id': item} for item in value]
+        else:
+            changes[key] = desired[key]
+    return changes
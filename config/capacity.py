@@ -0,0 +1,74 @@
+"""
+IP capacity of discovered VNets, computed the same way as
+ips/vnet-ip-report.sh: every subnet loses the 5 addresses Azure reserves,
+and an address space's used count is the sum of its subnets' used counts.
+make_summary() defines the list_available_ips text; ips/netbox.py loads it from here.
+"""
+
+import ipaddress
+
+AZURE_RESERVED_IPS = 5
+
+def subnet_usage(address_prefix, assigned_ips):
+    """{'total', 'used', 'available', 'reserved', 'subnets'} of a subnet with `assigned_ips` NIC addresses"""
+    total = ipaddress.ip_network(address_prefix, strict=False).num_addresses
+    reserved = min(AZURE_RESERVED_IPS, total)
+    used = min(total, reserved + assigned_ips)
+    return {'total': total, 'used': used, 'available': total - used, 'reserved': reserved, 'subnets': 1}
+
+def vnet_usage(vnet):
+    """
+    Usage of a vnet_info dict (as built by discovery), returns
+    ({address_space: usage}, {subnet_prefix: usage}); `subnets` is the number
+    of subnets inside the prefix (1 for a subnet).
+    """
+    subnets = {}
+    for subnet in vnet['subnets']:
+        if not subnet.get('address_prefix'):
+            continue
+        assigned = len({device['ip_address'] for device in subnet['devices'] if device.get('ip_address')})
+        subnets[subnet['address_prefix']] = subnet_usage(subnet['address_prefix'], assigned)
+
+    networks = [(ipaddress.ip_network(prefix, strict=False), usage) for prefix, usage in subnets.items()]
+    spaces = {}
+    for address_space in vnet['address_space']:
+        network = ipaddress.ip_network(address_space, strict=False)
+        inside = [usage for subnet_network, usage in networks
+                  if subnet_network.version == network.version and subnet_network.subnet_of(network)]
+        used = sum(usage['used'] for usage in inside)
+        spaces[address_space] = {
+            'total': network.num_addresses,
+            'used': used,
+            'available': network.num_addresses - used,
+            'reserved': sum(usage['reserved'] for usage in inside),
+            'subnets': len(inside),
+        }
+    return spaces, subnets
+
+def fmt_int(n):
+    try:
+        n = int(n)
+    except Exception:
+        return "0"
+    return f"{n:,}".replace(",", " ")
+
+def avail_pct(prefix_cidr, ips_avail):
+    """Available share of the usable addresses (IPv4 only)"""
+    try:
+        net = ipaddress.ip_network(prefix_cidr, strict=False)
+    except Exception:
+        return None
+    if net.version == 6:
+        return None
+    usable = max(net.num_addresses - AZURE_RESERVED_IPS, 0)
+    if usable == 0:
+        return None
+    return round(max(0.0, min(100.0, float(ips_avail) / float(usable) * 100.0)), 1)
+
+def make_summary(prefix_cidr, nb_subnets, ips_used, ips_avail):
+    """list_available_ips text, shared by azure-sync.py and ips/netbox.py"""
+    line = f"🧩 Subnets: {fmt_int(nb_subnets)} | 🔴 Utilisées: {fmt_int(ips_used)} | 🟢 Disponibles: {fmt_int(ips_avail)}"
+    pct = avail_pct(prefix_cidr, ips_avail)
+    if pct is not None:
+        line += f" | ⚖️ {pct}%"
+    return line
@@ -0,0 +1,78 @@
+"""
+Checkpoint of a sync run, so `azure-sync.py --resume` continues where a
+crashed or killed run stopped instead of starting over.
+
+The state file records the subscriptions fully written to Netbox and, for the
+subscription in progress, the VNets already written (the write cursor). It is
+rewritten atomically after every VNet and removed when the run succeeds. A
+checkpoint only applies to the same run scope (config file and shard).
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class Checkpoint:
+    """Completed subscriptions and VNets of one run scope, persisted to `path`"""
+
+    def __init__(self, path, scope):
+        self.path = path
+        self.scope = scope
+        self.done = set()
+        self.vnets = {}  # subscription id -> [vnet ids written]
+        self.started_at = time.time()
+
+    @classmethod
+    def open(cls, path, scope, resume=False):
+        """New checkpoint, or the saved one when resuming the same scope"""
+        checkpoint = cls(path, scope)
+        if not resume:
+            checkpoint.clear()
+            return checkpoint
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.info(f"No checkpoint to resume from in {path}, starting a full run")
+            return checkpoint
+        if data.get('scope') != scope:
+            logger.warning(f"Checkpoint {path} belongs to another run ({data.get('scope')}), ignoring it")
+            return checkpoint
+        checkpoint.done = set(data.get('done', []))
+        checkpoint.vnets = {sub: list(vnets) for sub, vnets in data.get('vnets', {}).items()}
+        checkpoint.started_at = data.get('started_at', checkpoint.started_at)
+        logger.info(f"Resuming from {path}: {len(checkpoint.done)} subscriptions done, "
+                    f"{sum(len(v) for v in checkpoint.vnets.values())} VNets of unfinished ones")
+        return checkpoint
+
+    def is_done(self, subscription_id):
+        return subscription_id in self.done
+
+    def vnet_is_done(self, subscription_id, vnet_id):
+        return vnet_id.lower() in self.vnets.get(subscription_id, ())
+
+    def vnet_done(self, subscription_id, vnet_id):
+        self.vnets.setdefault(subscription_id, []).append(vnet_id.lower())
+        self.save()
+
+    def subscription_done(self, subscription_id):
+        self.done.add(subscription_id)
+        self.vnets.pop(subscription_id, None)
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'scope': self.scope, 'started_at': self.started_at, 'saved_at': time.time(),
+                       'done': sorted(self.done), 'vnets': self.vnets}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove the state file (run succeeded, or a fresh run starts)"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
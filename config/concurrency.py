@@ -0,0 +1,259 @@
+"""
+Adaptive limit on the Netbox requests in flight (netbox.concurrency).
+
+A fixed number of writers is either too timid for an idle Netbox or
+overloads it during business hours. AdaptiveLimiter adjusts the limit with
+AIMD from what it measures: every `window` completed requests, the limit is
+multiplied by `backoff` when the p95 latency is above `target_p95` seconds
+or more than `max_error_rate` of the requests failed (5xx, connection
+errors), and raised by one when the window was saturated (requests waited
+for a slot) and healthy. A 429 cuts the limit at once and the request is
+retried after its Retry-After.
+
+LimitedSession wraps the requests.Session of the pynetbox client, so every
+REST call of the sync holds a slot, whatever thread makes it. The limiter is
+shared by every run on the client (tenants of one target); what one run sent
+is counted by its own RunMeter, set for the threads of that run
+(set_meter), and goes to its report:
+
+    netbox_concurrency_limit      gauge: shared limit at the end of the run
+    netbox_requests_per_second    gauge: the run's completed requests / busy time
+    netbox_requests, netbox_errors, netbox_throttled   counters
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class AdaptiveLimiter:
+    """AIMD limit on concurrent requests, driven by p95 latency and error/429 rates"""
+
+    def __init__(self, initial=4, min_limit=1, max_limit=16, target_p95=0.5, max_error_rate=0.05, window=50,
+                 backoff=0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.backoff = backoff
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.last_p95 = None
+        self._waiting = 0
+        self._since_cut = max_limit  # requests since the last cut: the first 429 cuts at once
+        self._cond = threading.Condition()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._latencies = []
+        self._errors = 0
+        self._saturated = False
+
+    def acquire(self):
+        """Wait for a free slot"""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                self._saturated = True
+                self._waiting += 1
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                self._waiting -= 1
+            self.in_flight += 1
+
+    def release(self, latency, error=False, throttled=False):
+        """Free a slot and account for the request it carried"""
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += error
+            self._since_cut += 1
+            if throttled:
+                self.throttled += 1
+                # The requests sent under the old limit answer 429 too: one cut per limit's worth
+                if self._since_cut > int(self.limit):
+                    self._decrease('429 from Netbox')
+            else:
+                self._latencies.append(latency)
+                self._errors += error
+                if len(self._latencies) >= self.window:
+                    self._evaluate()
+            self._cond.notify_all()
+
+    def _decrease(self, reason):
+        limit = max(self.min_limit, self.limit * self.backoff)
+        if int(limit) < int(self.limit):
+            logger.info(f"Netbox concurrency {int(self.limit)} -> {int(limit)} ({reason})")
+        self.limit = limit
+        self._since_cut = 0
+        self._reset_window()
+
+    def _evaluate(self):
+        self.last_p95 = percentile(self._latencies, 0.95)
+        error_rate = self._errors / len(self._latencies)
+        if error_rate > self.max_error_rate:
+            self._decrease(f"{error_rate:.0%} errors")
+        elif self.last_p95 > self.target_p95:
+            self._decrease(f"p95 {self.last_p95 * 1000:.0f} ms")
+        else:
+            if (self._saturated or self._waiting) and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, int(self.limit) + 1)
+                logger.debug(f"Netbox concurrency -> {int(self.limit)} (p95 {self.last_p95 * 1000:.0f} ms)")
+            self._reset_window()
+
+    def stats(self):
+        """Current limit and totals since the limiter was built (all the runs sharing it)"""
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'requests': self.requests,
+                'errors': self.errors,
+                'throttled': self.throttled,
+                'p95_ms': round(self.last_p95 * 1000, 1) if self.last_p95 is not None else None,
+            }
+
+class RunMeter:
+    """Netbox requests of one run, counted apart from the limiter its client shares with other runs"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._busy_since = None
+        self._busy_time = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            if self._in_flight == 0:
+                self._busy_since = time.perf_counter()
+            self._in_flight += 1
+
+    def end(self, error=False, throttled=False):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._busy_time += time.perf_counter() - self._busy_since
+            self.requests += 1
+            self.errors += error
+            self.throttled += throttled
+
+    def requests_per_second(self):
+        """Completed requests / time with at least one request in flight"""
+        with self._lock:
+            busy = self._busy_time
+            if self._in_flight:
+                busy += time.perf_counter() - self._busy_since
+        return round(self.requests / busy, 1) if busy else 0.0
+
+    def record(self, report, limiter):
+        """Add this run's requests (and the shared limit) to its RunReport"""
+        limit = int(limiter.limit)
+        requests_per_second = self.requests_per_second()
+        report.gauge('netbox_concurrency_limit', limit)
+        report.gauge('netbox_requests_per_second', requests_per_second)
+        report.count('netbox_requests', self.requests)
+        report.count('netbox_errors', self.errors)
+        report.count('netbox_throttled', self.throttled)
+        logger.info(f"Netbox writes: {self.requests} requests at {requests_per_second}/s, "
+                    f"concurrency {limit}, p95 {limiter.stats()['p95_ms']} ms, {self.throttled} throttled")
+
+_run = threading.local()
+
+def current_meter():
+    """RunMeter of the run this thread works for, None outside a metered run"""
+    return getattr(_run, 'meter', None)
+
+def set_meter(meter):
+    """Count this thread's requests in `meter` (None: stop counting); worker threads of a run set it too"""
+    _run.meter = meter
+
+def retry_after(response, attempt):
+    """Seconds to wait before retrying a 429 (Retry-After header, else exponential)"""
+    try:
+        return min(float(response.headers.get('Retry-After')), 60.0)
+    except (TypeError, ValueError):
+        return min(0.5 * 2 ** attempt, 10.0)
+
+class LimitedSession:
+    """
+    requests.Session wrapper: each request holds a limiter slot, and a 429
+    is retried (up to max_retries) after its Retry-After. Any other
+    attribute (headers, verify, mount...) is the wrapped session's.
+    """
+
+    def __init__(self, session, limiter, max_retries=3):
+        self.__dict__.update(session=session, limiter=limiter, max_retries=max_retries)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.session, name, value)
+
+    def request(self, method, url, **kwargs):
+        meter = current_meter()
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            if meter:
+                meter.begin()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception:
+                self.limiter.release(time.perf_counter() - start, error=True)
+                if meter:
+                    meter.end(error=True)
+                raise
+            throttled = response.status_code == 429
+            error = response.status_code >= 500
+            self.limiter.release(time.perf_counter() - start, error=error, throttled=throttled)
+            if meter:
+                meter.end(error=error, throttled=throttled)
+            if not throttled or attempt == self.max_retries:
+                return response
+            time.sleep(retry_after(response, attempt))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def options(self, url, **kwargs):
+        return self.request('OPTIONS', url, **kwargs)
+
+def from_config(concurrency_config):
+    """AdaptiveLimiter of the netbox.concurrency section"""
+    return AdaptiveLimiter(
+        initial=concurrency_config.get('initial', 4),
+        min_limit=concurrency_config.get('min', 1),
+        max_limit=concurrency_config.get('max', 16),
+        target_p95=concurrency_config.get('target_p95', 0.5),
+        max_error_rate=concurrency_config.get('max_error_rate', 0.05),
+        window=concurrency_config.get('window', 50),
+        backoff=concurrency_config.get('backoff', 0.7),
+    )
+
+def limiter_of(nb):
+    """Limiter of a pynetbox client built by connect_netbox, None without netbox.concurrency"""
+    return getattr(getattr(nb, 'http_session', None), 'limiter', None)
@@ -0,0 +1,230 @@
+"""
+Azure credentials built from an explicit chain, with a shared token cache.
+
+DefaultAzureCredential probes environment, workload identity, managed
+identity (IMDS timeouts), the CLI (a subprocess)... before the first call,
+and every worker process pays it again. azure.authentication.chain lists the
+sources to try, in order, and nothing else is built:
+
+    environment, workload_identity, managed_identity, service_principal,
+    cli, interactive, default
+
+Access tokens are kept in azure.authentication.token_cache.path, encrypted
+with Fernet (optional `cryptography` package; key from the
+AZURE_SYNC_TOKEN_CACHE_KEY environment variable or key_path, created 0600 on
+first use). Without `cryptography` tokens are cached in memory only, never
+written in clear. The file is shared by runs and worker processes (one flock
+around each read-modify-write). A token within refresh_margin seconds of
+expiry is still returned while a background thread fetches the next one, so
+a long sync never waits on re-authentication.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('environment', 'workload_identity', 'managed_identity', 'service_principal', 'cli',
+           'interactive', 'default')
+MANAGEMENT_SCOPE = 'https://management.azure.com/.default'
+
+def build_source(source, authentication):
+    """One azure-identity credential of the chain"""
+    import azure.identity as identity
+
+    tenant_id = authentication.get('tenant_id') or None
+    if source == 'environment':
+        return identity.EnvironmentCredential()
+    if source == 'workload_identity':
+        return identity.WorkloadIdentityCredential()
+    if source == 'managed_identity':
+        client_id = authentication.get('managed_identity_client_id')
+        return identity.ManagedIdentityCredential(client_id=client_id) if client_id else identity.ManagedIdentityCredential()
+    if source == 'service_principal':
+        return identity.ClientSecretCredential(authentication['tenant_id'], authentication['client_id'],
+                                               authentication['client_secret'])
+    if source == 'cli':
+        return identity.AzureCliCredential(tenant_id=tenant_id, process_timeout=authentication.get('cli_timeout', 10))
+    if source == 'interactive':
+        return identity.InteractiveBrowserCredential(tenant_id=tenant_id) if tenant_id else identity.InteractiveBrowserCredential()
+    if source == 'default':
+        return identity.DefaultAzureCredential()
+    raise ValueError(f"Unknown credential source '{source}'")
+
+def chain_of(method, authentication):
+    """Sources to try: azure.authentication.chain, else the single `method`"""
+    return list(authentication.get('chain') or [method or 'default'])
+
+def validate(method, authentication):
+    """Config errors of the chain (unknown sources, missing service principal keys)"""
+    errors = []
+    chain = chain_of(method, authentication)
+    for source in chain:
+        if source not in SOURCES:
+            errors.append(f"Unknown azure.authentication source '{source}' (one of {', '.join(SOURCES)})")
+    if 'service_principal' in chain:
+        for key in ('tenant_id', 'client_id', 'client_secret'):
+            if not authentication.get(key):
+                errors.append(f"Missing key 'azure.authentication.{key}' (service_principal)")
+    return errors
+
+def _load_fernet(cache_config):
+    """Fernet of the token cache, None when `cryptography` is not installed"""
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        logger.warning("cryptography is not installed: Azure tokens are cached in memory only")
+        return None
+    key = os.environ.get('AZURE_SYNC_TOKEN_CACHE_KEY')
+    if not key:
+        key_path = cache_config.get('key_path') or f"{cache_config['path']}.key"
+        if not os.path.exists(key_path):
+            try:
+                fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(Fernet.generate_key())
+                logger.info(f"Created token cache key {key_path}")
+            except FileExistsError:
+                pass  # created by another worker meanwhile
+        with open(key_path, 'rb') as f:
+            key = f.read().strip()
+    return Fernet(key)
+
+class TokenCache:
+    """{cache key: encrypted AccessToken} file shared between processes"""
+
+    def __init__(self, path, fernet):
+        self.path = path
+        self.fernet = fernet
+        self.memory = {}
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(f.read() or b'{}')
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, key):
+        if key in self.memory:
+            return self.memory[key]
+        if not self.fernet:
+            return None
+        entry = self._read().get(key)
+        if not entry:
+            return None
+        try:
+            token, expires_on = json.loads(self.fernet.decrypt(entry.encode()))
+        except Exception:
+            return None  # other key, or corrupted entry: fetch a new token
+        self.memory[key] = (token, expires_on)
+        return self.memory[key]
+
+    def put(self, key, token, expires_on):
+        self.memory[key] = (token, expires_on)
+        if not self.fernet:
+            return
+        import fcntl
+
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self._read()
+            entries[key] = self.fernet.encrypt(json.dumps([token, expires_on]).encode()).decode()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+class CachedCredential:
+    """
+    azure-core TokenCredential in front of a credential chain: tokens come
+    from the shared cache, and are refreshed in the background once they are
+    within `refresh_margin` seconds of expiry.
+    """
+
+    def __init__(self, credential, cache, identity, refresh_margin=600):
+        self.credential = credential
+        self.cache = cache
+        self.identity = identity
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def _key(self, scopes, tenant_id):
+        raw = json.dumps([self.identity, sorted(scopes), tenant_id])
+        return base64.urlsafe_b64encode(hashlib.sha256(raw.encode()).digest()).decode()
+
+    def _fetch(self, key, scopes, kwargs):
+        access_token = self.credential.get_token(*scopes, **kwargs)
+        self.cache.put(key, access_token.token, access_token.expires_on)
+        return access_token
+
+    def _refresh_in_background(self, key, scopes, kwargs):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, scopes, kwargs)
+                logger.debug("Azure token refreshed ahead of expiry")
+            except Exception as e:
+                logger.warning(f"Background token refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='token-refresh', daemon=True).start()
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        if claims:
+            # Claims challenge (CAE): the cached token was revoked, ask the source
+            return self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        if tenant_id:
+            kwargs['tenant_id'] = tenant_id
+        key = self._key(scopes, tenant_id)
+        cached = self.cache.get(key)
+        now = time.time()
+        if cached and cached[1] > now + 60:
+            if cached[1] - now < self.refresh_margin:
+                self._refresh_in_background(key, scopes, kwargs)
+            return AccessToken(cached[0], int(cached[1]))
+        return self._fetch(key, scopes, kwargs)
+
+    def close(self):
+        close = getattr(self.credential, 'close', None)
+        if close:
+            close()
+
+def from_config(method, authentication):
+    """Credential of azure.authentication: the explicit chain, behind the token cache if configured"""
+    from azure.identity import ChainedTokenCredential
+
+    chain = chain_of(method, authentication)
+    sources = [build_source(source, authentication) for source in chain]
+    credential = sources[0] if len(sources) == 1 else ChainedTokenCredential(*sources)
+    logger.info(f"Azure credential chain: {' -> '.join(chain)}")
+
+    cache_config = authentication.get('token_cache') or {}
+    if not cache_config.get('path'):
+        return credential
+    # Tokens of a chain are cached under its sources and principal, never shared with another config
+    identity = [chain, authentication.get('tenant_id'), authentication.get('client_id'),
+                authentication.get('managed_identity_client_id')]
+    cache = TokenCache(cache_config['path'], _load_fernet(cache_config))
+    return CachedCredential(credential, cache, identity, cache_config.get('refresh_margin', 600))
+
+def warm(credential, scope=MANAGEMENT_SCOPE):
+    """Fetch a token once (e.g. in the coordinator) so worker processes find it in the cache"""
+    start = time.time()
+    credential.get_token(scope)
+    logger.info(f"Azure token ready in {time.time() - start:.1f}s")
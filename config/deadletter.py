@@ -0,0 +1,91 @@
+"""
+Dead-letter file for Netbox writes that failed during a sync.
+
+Each failed unit of work (one device, or one VNet's prefixes) is appended as
+an NDJSON line holding everything needed to redo it, plus the error, and the
+run carries on. `azure-sync.py replay [FILE]` (or `--replay-failed [FILE]`)
+feeds the entries back to the same sync functions with exponential backoff
+and keeps only those still failing.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TooManyFailures(RuntimeError):
+    """More failures than deadletter.max_failures: Netbox is probably down, stop the run"""
+
+class DeadLetterQueue:
+    """Append-only NDJSON file of {'kind', 'payload', 'error', 'at', 'attempts'} entries"""
+
+    def __init__(self, path, max_failures=None):
+        self.path = path
+        self.max_failures = max_failures
+        self.added = 0
+        self._lock = threading.Lock()  # devices are written by concurrent threads with netbox.concurrency
+
+    def add(self, kind, payload, error, attempts=1):
+        entry = {'kind': kind, 'payload': payload, 'error': str(error), 'at': time.time(), 'attempts': attempts}
+        line = json.dumps(entry, default=str, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.added += 1
+        logger.error(f"Failed {kind} write dead-lettered to {self.path}: {error}")
+        if self.max_failures is not None and self.added > self.max_failures:
+            raise TooManyFailures(f"More than {self.max_failures} failed writes, aborting the run")
+
+    def entries(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def rewrite(self, entries):
+        """Replace the file content (removed when no entry is left)"""
+        if not entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+def replay(queue, handlers, retries=3, base_delay=1.0, max_delay=30.0):
+    """
+    Retry every entry with its kind's handler(payload), up to `retries` times
+    with exponential backoff. Entries still failing stay in the file.
+    Returns (replayed, still_failing).
+    """
+    remaining = []
+    replayed = 0
+    for entry in queue.entries():
+        handler = handlers.get(entry['kind'])
+        if handler is None:
+            logger.warning(f"No replay handler for dead-letter kind '{entry['kind']}', keeping it")
+            remaining.append(entry)
+            continue
+        delay = base_delay
+        for attempt in range(1, retries + 1):
+            try:
+                handler(entry['payload'])
+                replayed += 1
+                break
+            except Exception as e:
+                entry['error'], entry['at'] = str(e), time.time()
+                entry['attempts'] = entry.get('attempts', 1) + 1
+                if attempt == retries:
+                    logger.error(f"Replay of {entry['kind']} failed {retries} times: {e}")
+                    remaining.append(entry)
+                else:
+                    time.sleep(delay)
+                    delay = min(delay * 2, max_delay)
+    queue.rewrite(remaining)
+    return replayed, len(remaining)
@@ -0,0 +1,291 @@
+"""
+Event-driven sync: read Azure resource-change events (Event Grid schema or
+CloudEvents) from a queue, coalesce bursts, and hand the resulting changes
+to a handler that updates just those objects in Netbox.
+
+Queues:
+    spool:<dir>     JSON files dropped in a directory (one event or a list per file)
+    webhook:<port>  local HTTP endpoint receiving Event Grid POSTs (handles the
+                    subscription validation handshake)
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import armid
+
+logger = logging.getLogger(__name__)
+
+# ARM resource types we know how to sync, case-folded
+RESOURCE_KINDS = {
+    'microsoft.network/virtualnetworks': 'vnet',
+    'microsoft.network/virtualnetworks/subnets': 'subnet',
+    'microsoft.network/networkinterfaces': 'nic',
+    'microsoft.compute/virtualmachines': 'vm',
+}
+
+class ResourceChange:
+    """One coalesced change to an Azure resource"""
+
+    __slots__ = ('resource_id', 'kind', 'action', 'subscription_id', 'event_time', 'count')
+
+    def __init__(self, resource_id, kind, action, subscription_id, event_time=None):
+        self.resource_id = resource_id
+        self.kind = kind
+        self.action = action  # 'write' or 'delete'
+        self.subscription_id = subscription_id
+        self.event_time = event_time or time.time()
+        self.count = 1
+
+    @property
+    def key(self):
+        return armid.parse(self.resource_id).key
+
+    @property
+    def parts(self):
+        return resource_id_parts(self.resource_id)
+
+    @property
+    def parent_key(self):
+        """Case-folded ID of the parent (VNet of a subnet), None for top-level resources"""
+        parent = armid.parse(self.resource_id).parent
+        return parent.key if parent else None
+
+    def __repr__(self):
+        return f"ResourceChange({self.action} {self.kind} {self.resource_id} x{self.count})"
+
+def resource_id_parts(resource_id):
+    """Segments of an ARM resource ID: subscription, resource group, name, child name"""
+    parsed = armid.parse(resource_id)
+    return {
+        'subscription_id': parsed.subscription_id,
+        'resource_group': parsed.resource_group,
+        'name': parsed.names[0] if parsed.names else None,
+        'child_name': parsed.names[1] if len(parsed.names) > 1 else None,
+    }
+
+def resource_kind(resource_id):
+    """Map an ARM resource ID to 'vnet', 'subnet', 'nic', 'vm' or None"""
+    parsed = armid.parse(resource_id)
+    if not parsed.names:
+        return None
+    return RESOURCE_KINDS.get(parsed.type.casefold())
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')[:32]).timestamp()
+    except (AttributeError, ValueError):
+        return time.time()
+
+def parse_event(event):
+    """Turn one Event Grid / CloudEvents payload into a ResourceChange (None if irrelevant)"""
+    event_type = event.get('eventType') or event.get('type') or ''
+    data = event.get('data') or {}
+    resource_id = data.get('resourceUri') or event.get('subject') or ''
+    operation = (data.get('operationName') or '').lower()
+
+    if event_type.endswith('ResourceWriteSuccess') or operation.endswith('/write'):
+        action = 'write'
+    elif event_type.endswith('ResourceDeleteSuccess') or operation.endswith('/delete'):
+        action = 'delete'
+    else:
+        return None
+
+    kind = resource_kind(resource_id)
+    if kind is None:
+        return None
+    subscription_id = data.get('subscriptionId') or armid.parse(resource_id).subscription_id
+    return ResourceChange(resource_id, kind, action, subscription_id,
+                          _parse_time(event.get('eventTime') or event.get('time')))
+
+class Coalescer:
+    """
+    Debounce bursts of events: changes are keyed by resource ID (the last action
+    wins) and released once no new event arrived for `debounce` seconds, or
+    `max_delay` seconds after the oldest pending one. A pending VNet change
+    absorbs its subnets' changes, since syncing the VNet re-syncs all subnets.
+    """
+
+    def __init__(self, debounce=30, max_delay=300):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.pending = {}
+        self.first_at = None
+        self.last_at = None
+
+    def add(self, change, now=None):
+        now = now or time.time()
+        existing = self.pending.get(change.key)
+        if existing:
+            change.count += existing.count
+        self.pending[change.key] = change
+        self.first_at = self.first_at or now
+        self.last_at = now
+
+    def ready(self, now=None):
+        if not self.pending:
+            return False
+        now = now or time.time()
+        return now - self.last_at >= self.debounce or now - self.first_at >= self.max_delay
+
+    def drain(self):
+        """Return the pending changes (subnets folded into their VNet) and reset"""
+        changes = self.pending
+        self.pending, self.first_at, self.last_at = {}, None, None
+        vnet_writes = {key for key, c in changes.items() if c.kind == 'vnet' and c.action == 'write'}
+        result = []
+        for change in changes.values():
+            parent = change.parent_key
+            if change.kind == 'subnet' and parent in vnet_writes:
+                changes[parent].count += change.count
+                continue
+            result.append(change)
+        return result
+
+    def requeue(self, changes, now=None):
+        """Put drained changes back (a newer pending change of the same resource wins); retried after the debounce"""
+        now = now or time.time()
+        for change in changes:
+            existing = self.pending.get(change.key)
+            if existing:
+                existing.count += change.count
+            else:
+                self.pending[change.key] = change
+        self.first_at = self.first_at or now
+        self.last_at = now
+
+class SpoolQueue:
+    """Read events from JSON files dropped into a directory; processed files move to done/"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.done_dir = os.path.join(directory, 'done')
+        os.makedirs(self.done_dir, exist_ok=True)
+
+    def get(self, timeout):
+        """Return the raw events of all spooled files (waits up to `timeout` if none)"""
+        deadline = time.time() + timeout
+        while True:
+            names = sorted(n for n in os.listdir(self.directory)
+                           if n.endswith('.json') and os.path.isfile(os.path.join(self.directory, n)))
+            if names or time.time() >= deadline:
+                break
+            time.sleep(min(1.0, max(deadline - time.time(), 0)))
+
+        events = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable spool file {path}: {str(e)}")
+                os.replace(path, os.path.join(self.done_dir, name + '.invalid'))
+                continue
+            events.extend(payload if isinstance(payload, list) else [payload])
+            os.replace(path, os.path.join(self.done_dir, name))
+        return events
+
+    def close(self):
+        pass
+
+class WebhookQueue:
+    """Local HTTP endpoint for Event Grid webhooks (POST a JSON event or list of events)"""
+
+    def __init__(self, port, bind='127.0.0.1'):
+        self.events = queue.Queue()
+        events = self.events
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'[]')
+                except ValueError:
+                    self._send(400, {'error': 'invalid JSON'})
+                    return
+                payload = payload if isinstance(payload, list) else [payload]
+                for event in payload:
+                    if event.get('eventType') == 'Microsoft.EventGrid.SubscriptionValidationEvent':
+                        self._send(200, {'validationResponse': event['data']['validationCode']})
+                        return
+                for event in payload:
+                    events.put(event)
+                self._send(202, {'accepted': len(payload)})
+
+            def _send(self, code, body):
+                body = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug(f"webhook: {fmt % args}")
+
+        self.server = ThreadingHTTPServer((bind, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='webhook', daemon=True).start()
+        logger.info(f"Listening for Event Grid events on http://{bind}:{port}/")
+
+    def get(self, timeout):
+        events = []
+        try:
+            events.append(self.events.get(timeout=timeout))
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def close(self):
+        self.server.shutdown()
+
+def open_queue(spec):
+    """Build a queue from 'spool:<dir>' or 'webhook:<port>[:<bind>]'"""
+    kind, _, target = spec.partition(':')
+    if kind == 'spool' and target:
+        return SpoolQueue(target)
+    if kind == 'webhook' and target:
+        port, _, bind = target.partition(':')
+        return WebhookQueue(int(port), bind or '127.0.0.1')
+    raise ValueError(f"Unknown event source '{spec}' (expected spool:<dir> or webhook:<port>)")
+
+def next_reconcile_at(reconcile_time, now=None):
+    """Timestamp of the next daily reconciliation at 'HH:MM' local time"""
+    now = now or time.time()
+    hour, minute = (int(x) for x in reconcile_time.split(':'))
+    today = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    at = today.timestamp()
+    return at if at > now else at + 86400
+
+def run_event_loop(event_queue, coalescer, handler, stop_event, reconcile=None, reconcile_time=None):
+    """
+    Consume events until stop_event is set. `handler(changes)` receives each
+    coalesced batch; `reconcile()` (a full sync) runs daily at reconcile_time.
+    """
+    reconcile_at = next_reconcile_at(reconcile_time) if reconcile and reconcile_time else None
+    while not stop_event.is_set():
+        for event in event_queue.get(timeout=1.0):
+            change = parse_event(event)
+            if change:
+                coalescer.add(change)
+            else:
+                logger.debug(f"Ignoring event {event.get('eventType') or event.get('type')}: {event.get('subject')}")
+
+        if coalescer.ready():
+            changes = coalescer.drain()
+            logger.info(f"Processing {len(changes)} coalesced resource change(s)")
+            handler(changes)
+
+        if reconcile_at and time.time() >= reconcile_at:
+            logger.info("Starting scheduled full reconciliation")
+            reconcile()
+            reconcile_at = next_reconcile_at(reconcile_time)
+    event_queue.close()
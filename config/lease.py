@@ -0,0 +1,222 @@
+"""
+Run lease, so that a sync overrunning its cron interval is not joined by a
+second one hammering Netbox with the same get_or_create_* calls.
+
+Two backends (lease.backend):
+
+    file     an flock on lease.path. The kernel drops it when the process
+             dies, so a crashed run never leaves a stale lock. One host only
+             (flock is not reliable on NFS).
+    netbox   a tag whose slug is lease.name, created by the holder (the slug
+             is unique, so creation is the atomic test-and-set). Its
+             description holds the owner and an expiry pushed forward by a
+             heartbeat every ttl/3; a lease past its expiry belongs to a
+             crashed run and is reclaimed. Works across hosts and pods.
+
+A second instance waits up to lease.wait seconds, then gives up (LeaseHeld).
+A holder whose heartbeat finds the lease taken over stops at its next
+check() (LeaseLost) instead of writing on without it.
+"""
+
+import abc
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class LeaseHeld(RuntimeError):
+    """Another run holds the lease"""
+
+class LeaseLost(RuntimeError):
+    """The lease was taken over while we held it: stop writing"""
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class Lease(abc.ABC):
+    """Base lease: acquire with wait/poll, heartbeat thread, release"""
+
+    def __init__(self, name, ttl=300):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner_id()
+        self.holder = None  # owner of the lease when we could not take it
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @abc.abstractmethod
+    def _try_acquire(self):
+        """Take the lease if free; False (with self.holder set) when another run has it"""
+
+    @abc.abstractmethod
+    def _renew(self):
+        """Push the expiry forward; False when the lease is no longer ours"""
+
+    @abc.abstractmethod
+    def _release(self):
+        """Give the lease back"""
+
+    def acquire(self, wait=0, poll=10):
+        """Take the lease, waiting up to `wait` seconds; raises LeaseHeld"""
+        deadline = time.time() + wait
+        while not self._try_acquire():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise LeaseHeld(f"Lease '{self.name}' is held by {self.holder}")
+            logger.info(f"Lease '{self.name}' held by {self.holder}, waiting ({remaining:.0f}s left)")
+            time.sleep(min(poll, remaining))
+        logger.info(f"Acquired lease '{self.name}' as {self.owner}")
+        self._heartbeat = threading.Thread(target=self._beat, name=f"lease-{self.name}", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def _beat(self):
+        renewed_at = time.time()
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self._renew():
+                    self.lost = True
+                    logger.error(f"Lease '{self.name}' was taken over by another run")
+                    return
+                renewed_at = time.time()
+            except Exception as e:
+                logger.warning(f"Lease '{self.name}' heartbeat failed: {str(e)}")
+                if time.time() - renewed_at >= self.ttl:
+                    # Expired for the other runs: it may be reclaimed at any time
+                    self.lost = True
+                    logger.error(f"Lease '{self.name}' not renewed for {self.ttl}s, giving it up")
+                    return
+
+    def check(self):
+        """Raise LeaseLost once the heartbeat found the lease taken over (call between units of work)"""
+        if self.lost:
+            raise LeaseLost(f"Lease '{self.name}' was taken over by another run, stopping")
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+        if not self.lost:
+            try:
+                self._release()
+            except Exception as e:
+                logger.warning(f"Could not release lease '{self.name}': {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class FileLease(Lease):
+    """flock on a local file; the file content only documents the holder"""
+
+    def __init__(self, path, ttl=300):
+        super().__init__(path, ttl)
+        self.path = path
+        self._file = None
+
+    def _try_acquire(self):
+        import fcntl
+
+        f = open(self.path, 'a+')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.seek(0)
+            try:
+                self.holder = json.loads(f.read() or '{}').get('owner')
+            except ValueError:
+                self.holder = None
+            f.close()
+            return False
+        self._file = f
+        self._write(acquired_at=time.time())
+        return True
+
+    def _write(self, **fields):
+        self._file.seek(0)
+        self._file.truncate()
+        json.dump(dict(owner=self.owner, heartbeat_at=time.time(), **fields), self._file)
+        self._file.flush()
+
+    def _renew(self):
+        self._write()
+        return True
+
+    def _release(self):
+        import fcntl
+
+        self._file.seek(0)
+        self._file.truncate()
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+class NetboxLease(Lease):
+    """Tag `name` in Netbox, description = {'owner', 'expires_at'}"""
+
+    def __init__(self, nb, name, ttl=300):
+        super().__init__(name, ttl)
+        self.nb = nb
+
+    def _description(self):
+        return json.dumps({'owner': self.owner, 'expires_at': round(time.time() + self.ttl)})
+
+    def _current(self):
+        tag = self.nb.extras.tags.get(slug=self.name)
+        if tag is None:
+            return None, {}
+        try:
+            return tag, json.loads(tag.description or '{}')
+        except ValueError:
+            return tag, {}
+
+    def _try_acquire(self):
+        from pynetbox import RequestError
+
+        for _ in range(2):
+            try:
+                self.nb.extras.tags.create(name=self.name, slug=self.name, description=self._description())
+                return True
+            except RequestError:
+                tag, data = self._current()
+                if tag is None:
+                    continue  # released in between
+                self.holder = data.get('owner')
+                expired_for = time.time() - data.get('expires_at', 0)
+                if expired_for < 0:
+                    return False
+                logger.warning(f"Reclaiming stale lease '{self.name}' of {self.holder} "
+                               f"(expired {expired_for:.0f}s ago)")
+                try:
+                    tag.delete()
+                except RequestError:
+                    pass  # another run reclaimed it first (delete is by id), its new tag wins
+        return False
+
+    def _renew(self):
+        tag, data = self._current()
+        if tag is None or data.get('owner') != self.owner:
+            return False
+        tag.update({'description': self._description()})
+        return True
+
+    def _release(self):
+        tag, data = self._current()
+        if tag is not None and data.get('owner') == self.owner:
+            tag.delete()
+
+def open_lease(lease_config, nb=None):
+    """Lease described by the `lease` config section"""
+    backend = lease_config.get('backend', 'file')
+    ttl = lease_config.get('ttl', 300)
+    if backend == 'netbox':
+        return NetboxLease(nb, lease_config.get('name', 'azure-sync-lease'), ttl)
+    if backend == 'file':
+        return FileLease(lease_config.get('path', '.azure-sync.lock'), ttl)
+    raise ValueError(f"Unknown lease backend '{backend}'")
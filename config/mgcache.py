@@ -0,0 +1,142 @@
+"""
+Management-group hierarchy cache.
+
+The tree (group id -> display name, parent, child groups, subscriptions) is
+built by expanding every group one level in parallel, instead of one slow
+recursive `get(expand="children", recurse=True)`, and persisted as JSON with
+a TTL so most runs never call the Management Groups API at all.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MG_TYPE = "/providers/Microsoft.Management/managementGroups"
+SUBSCRIPTION_TYPE = "/subscriptions"
+
+class ManagementGroupTree:
+    """In-memory management-group hierarchy with name->id and child->parent indexes"""
+
+    def __init__(self, groups=None, subscriptions=None, fetched_at=None):
+        # group id -> {'display_name', 'parent'}
+        self.groups = groups or {}
+        # subscription id -> {'display_name', 'parent'}
+        self.subscriptions = subscriptions or {}
+        self.fetched_at = fetched_at or time.time()
+        self._index()
+
+    def _index(self):
+        self.name_index = {}
+        self.children = {group_id: [] for group_id in self.groups}
+        self.group_subscriptions = {group_id: [] for group_id in self.groups}
+        for group_id, group in self.groups.items():
+            self.name_index.setdefault(group['display_name'], group_id)
+            if group['parent'] in self.children:
+                self.children[group['parent']].append(group_id)
+        for sub_id, sub in self.subscriptions.items():
+            if sub['parent'] in self.group_subscriptions:
+                self.group_subscriptions[sub['parent']].append(sub_id)
+
+    def resolve(self, management_group_id=None, management_group_name=None):
+        """Group id from an id or a display name (None if unknown)"""
+        if management_group_id:
+            return management_group_id if management_group_id in self.groups else None
+        return self.name_index.get(management_group_name)
+
+    def subscriptions_under(self, group_id):
+        """[(subscription_id, display_name)] of a group and all its descendants"""
+        result, stack = [], [group_id]
+        while stack:
+            current = stack.pop()
+            for sub_id in self.group_subscriptions.get(current, []):
+                result.append((sub_id, self.subscriptions[sub_id]['display_name']))
+            stack.extend(self.children.get(current, []))
+        return result
+
+    def group_of(self, subscription_id):
+        """Display name of the management group directly holding a subscription"""
+        sub = self.subscriptions.get(subscription_id.lower()) or self.subscriptions.get(subscription_id)
+        if not sub or sub['parent'] not in self.groups:
+            return None
+        return self.groups[sub['parent']]['display_name']
+
+    def path_of(self, subscription_id):
+        """Display names from the root group down to the subscription's group"""
+        sub = self.subscriptions.get(subscription_id.lower()) or self.subscriptions.get(subscription_id)
+        path, current = [], sub['parent'] if sub else None
+        while current in self.groups:
+            path.append(self.groups[current]['display_name'])
+            current = self.groups[current]['parent']
+        return list(reversed(path))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'fetched_at': self.fetched_at, 'groups': self.groups,
+                       'subscriptions': self.subscriptions}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, ttl):
+        """Cached tree if the file exists and is younger than ttl seconds, else None"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data.get('fetched_at', 0) > ttl:
+            logger.info(f"Management group cache {path} expired")
+            return None
+        return cls(data['groups'], data['subscriptions'], data['fetched_at'])
+
+def fetch_tree(mg_client, max_workers=8):
+    """
+    Build the whole tree: one paged list() of the groups, then every group is
+    expanded one level (children only, no recursion) in parallel.
+    """
+    group_ids = [mg.name for mg in mg_client.management_groups.list()]
+    logger.info(f"Expanding {len(group_ids)} management groups with {max_workers} workers")
+
+    def expand(group_id):
+        return mg_client.management_groups.get(group_id=group_id, expand="children", recurse=False)
+
+    groups, subscriptions = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for group_id, details in zip(group_ids, pool.map(expand, group_ids)):
+            parent = getattr(getattr(details, 'details', None), 'parent', None)
+            groups[group_id] = {
+                'display_name': details.display_name,
+                'parent': parent.name if parent else None,
+            }
+            for child in details.children or []:
+                if child.type == SUBSCRIPTION_TYPE:
+                    subscriptions[child.name.lower()] = {'display_name': child.display_name, 'parent': group_id}
+
+    # Parents outside our read scope show up as ids we never expanded
+    for group in groups.values():
+        if group['parent'] not in groups:
+            group['parent'] = None
+    return ManagementGroupTree(groups, subscriptions)
+
+def get_tree(credential, cache_path=None, ttl=86400, max_workers=8):
+    """Tree from the cache when fresh, otherwise fetched (and cached)"""
+    if cache_path:
+        tree = ManagementGroupTree.load(cache_path, ttl)
+        if tree:
+            logger.info(f"Using management group cache {cache_path} "
+                        f"({len(tree.groups)} groups, {len(tree.subscriptions)} subscriptions)")
+            return tree
+
+    from azure.mgmt.managementgroups import ManagementGroupsAPI
+
+    start = time.time()
+    tree = fetch_tree(ManagementGroupsAPI(credential), max_workers)
+    logger.info(f"Fetched management group tree in {time.time() - start:.1f}s "
+                f"({len(tree.groups)} groups, {len(tree.subscriptions)} subscriptions)")
+    if cache_path:
+        tree.save(cache_path)
+    return tree
@@ -0,0 +1,148 @@
+"""
+Prefetch of the Netbox state the sync reconciles against, through the
+GraphQL API instead of one REST lookup per prefix/device/interface/IP.
+
+Only the fields the sync compares are requested, in paginated bulk queries,
+and the results are indexed the way sync_device/get_or_create_prefix look
+objects up. Each entry is a pynetbox Record bound to its REST endpoint, so
+`update()` and `serialize()` work unchanged. A lookup miss is not proof of
+absence (another shard may have created the object since), callers fall back
+to REST then.
+"""
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+QUERIES = {
+    'prefixes': ('prefix_list', """
+        id prefix description status vrf { id } tags { id } custom_fields
+    """),
+    'devices': ('device_list', """
+        id name status site { id } device_type { id } role { id } tags { id }
+    """),
+    'interfaces': ('interface_list', """
+        id name device { id } tags { id }
+    """),
+    'ip_addresses': ('ip_address_list', """
+        id address assigned_object { __typename ... on InterfaceType { id } } tags { id }
+    """),
+}
+
+def graphql_url(api_url):
+    """GraphQL endpoint next to a REST API URL (https://netbox/api -> https://netbox/graphql/)"""
+    base = api_url.rstrip('/')
+    if base.endswith('/api'):
+        base = base[:-len('/api')]
+    return f"{base}/graphql/"
+
+def _choice(value):
+    """Choice value from a GraphQL enum ('STATUS_ACTIVE' / 'ACTIVE' / 'active' -> 'active')"""
+    if value is None:
+        return None
+    value = str(value).lower()
+    return value[len('status_'):] if value.startswith('status_') else value
+
+def _ref(obj):
+    return {'id': int(obj['id'])} if obj else None
+
+def _tags(obj):
+    return [{'id': int(tag['id'])} for tag in obj.get('tags') or []]
+
+def to_rest(kind, obj):
+    """GraphQL object -> the dict shape the REST API returns for the compared fields"""
+    data = {'id': int(obj['id']), 'tags': _tags(obj)}
+    if kind == 'prefixes':
+        data.update(prefix=obj['prefix'], description=obj.get('description') or '', status=_choice(obj.get('status')),
+                    vrf=_ref(obj.get('vrf')), custom_fields=obj.get('custom_fields') or {})
+    elif kind == 'devices':
+        data.update(name=obj['name'], status=_choice(obj.get('status')), site=_ref(obj.get('site')),
+                    device_type=_ref(obj.get('device_type')), role=_ref(obj.get('role')))
+    elif kind == 'interfaces':
+        data.update(name=obj['name'], device=_ref(obj.get('device')))
+    elif kind == 'ip_addresses':
+        assigned = obj.get('assigned_object') or {}
+        is_interface = assigned.get('__typename') == 'InterfaceType'
+        data.update(address=obj['address'],
+                    assigned_object_type='dcim.interface' if is_interface else None,
+                    assigned_object_id=int(assigned['id']) if is_interface else None)
+    return data
+
+class GraphQLClient:
+    """Minimal GraphQL client on the pynetbox HTTP session; counts requests and bytes"""
+
+    def __init__(self, url, token, session):
+        self.url = url
+        self.session = session
+        self.headers = {'Authorization': f"Token {token}", 'Content-Type': 'application/json',
+                        'Accept': 'application/json'}
+        self.requests = 0
+        self.bytes = 0
+
+    def query(self, query, variables=None):
+        response = self.session.post(self.url, data=json.dumps({'query': query, 'variables': variables or {}}),
+                                     headers=self.headers)
+        self.requests += 1
+        self.bytes += len(response.content)
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('errors'):
+            raise RuntimeError(f"GraphQL error: {payload['errors'][0].get('message')}")
+        return payload['data']
+
+    def fetch_all(self, kind, page_size=1000):
+        """All objects of one kind, page by page"""
+        field, fields = QUERIES[kind]
+        query = (f"query($offset: Int!, $limit: Int!) {{ {field}(pagination: {{offset: $offset, limit: $limit}}) "
+                 f"{{ {' '.join(fields.split())} }} }}")
+        offset = 0
+        while True:
+            page = self.query(query, {'offset': offset, 'limit': page_size})[field]
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+class NetboxState:
+    """Indexes of prefetched objects: prefix -> [records], (name, site id), (device id, name), address"""
+
+    def __init__(self):
+        self.prefixes = {}
+        self.devices = {}
+        self.interfaces = {}
+        self.ip_addresses = {}
+
+    def add(self, kind, record):
+        if kind == 'prefixes':
+            self.prefixes.setdefault(str(record.prefix), []).append(record)
+        elif kind == 'devices':
+            self.devices[(record.name, record.site.id)] = record
+        elif kind == 'interfaces':
+            self.interfaces[(record.device.id, record.name)] = record
+        elif kind == 'ip_addresses':
+            self.ip_addresses[str(record.address)] = record
+
+    def __len__(self):
+        return len(self.prefixes) + len(self.devices) + len(self.interfaces) + len(self.ip_addresses)
+
+def prefetch(nb, api_url, token, page_size=1000, kinds=tuple(QUERIES)):
+    """Fetch and index the Netbox state through GraphQL; returns (NetboxState, GraphQLClient)"""
+    from pynetbox.core.response import Record
+
+    endpoints = {
+        'prefixes': nb.ipam.prefixes,
+        'devices': nb.dcim.devices,
+        'interfaces': nb.dcim.interfaces,
+        'ip_addresses': nb.ipam.ip_addresses,
+    }
+    client = GraphQLClient(graphql_url(api_url), token, nb.http_session)
+    state = NetboxState()
+    start = time.time()
+    for kind in kinds:
+        for obj in client.fetch_all(kind, page_size):
+            state.add(kind, Record(to_rest(kind, obj), nb, endpoints[kind]))
+    logger.info(f"Prefetched {len(state)} Netbox objects through GraphQL in {time.time() - start:.1f}s "
+                f"({client.requests} requests, {client.bytes / 1024:.0f} KiB)")
+    return state, client
@@ -0,0 +1,85 @@
+"""
+Subnet IPs held by Azure network resources other than VMs.
+
+network_interfaces.list_all() also returns the NICs Azure creates for
+private endpoints: those are recognised from the NIC itself (its
+`private_endpoint` reference), with no extra call. Internal load balancer
+frontends, application gateway frontends and Azure Firewall IPs have no NIC
+in that list: each type is read with one list_all() per subscription.
+Every IP becomes a device of its own type (device type and role
+"<prefix> Private_Endpoint", "<prefix> Load_Balancer"...) instead of an
+anonymous network interface, or no device at all.
+
+azure.resource_types selects the types resolved (default: all of them).
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_TYPES = ('private_endpoint', 'load_balancer', 'application_gateway', 'firewall')
+
+# Every device type the sync creates (device types and roles made by bootstrap_netbox)
+DEVICE_TYPES = ('vm', 'network_interface') + RESOURCE_TYPES
+
+def enabled_types(config):
+    return set(config.get('azure', {}).get('resource_types', RESOURCE_TYPES) or ())
+
+def validate(config):
+    """Config errors of azure.resource_types"""
+    return [f"Unknown azure.resource_types entry '{kind}' (one of {', '.join(RESOURCE_TYPES)})"
+            for kind in enabled_types(config) if kind not in RESOURCE_TYPES]
+
+def nic_owner(nic, vm=None, types=RESOURCE_TYPES):
+    """(type, name, id) of what a NIC's IPs belong to: its VM, its private endpoint, or the NIC itself"""
+    import armid
+
+    if vm is not None:
+        return 'vm', vm.name, vm.id
+    private_endpoint = getattr(nic, 'private_endpoint', None)
+    if private_endpoint is not None and private_endpoint.id and 'private_endpoint' in types:
+        return 'private_endpoint', armid.parse(private_endpoint.id).name, private_endpoint.id
+    return 'network_interface', nic.name, nic.id
+
+def _frontend_devices(kind, resource, ip_configurations):
+    """(subnet_id, device_info) of the private IPs of a load balancer, gateway or firewall"""
+    import armid
+
+    for ip_config in ip_configurations or []:
+        if not ip_config.subnet or not ip_config.private_ip_address:
+            continue  # public frontend, or a firewall IP config other than the AzureFirewallSubnet one
+        yield ip_config.subnet.id, {
+            'name': resource.name,
+            'id': resource.id,
+            'type': kind,
+            'ip_address': ip_config.private_ip_address,
+            'mac_address': None,
+            'resource_group': armid.resource_group(resource.id),
+            'location': resource.location,
+            'os_type': None
+        }
+
+def list_devices(network_client, types=RESOURCE_TYPES):
+    """
+    (subnet_id, device_info) of the frontends of the NIC-less resource types,
+    one list_all() per type. A type whose list fails is logged and skipped.
+    """
+    listings = (
+        ('load_balancer', network_client.load_balancers.list_all, 'frontend_ip_configurations'),
+        ('application_gateway', network_client.application_gateways.list_all, 'frontend_ip_configurations'),
+        ('firewall', network_client.azure_firewalls.list_all, 'ip_configurations'),
+    )
+    devices = []
+    for kind, list_all, attribute in listings:
+        if kind not in types:
+            continue
+        try:
+            resources = list(list_all())
+        except Exception as e:
+            logger.warning(f"Could not list {kind} resources: {str(e)}")
+            continue
+        found = [item for resource in resources
+                 for item in _frontend_devices(kind, resource, getattr(resource, attribute, None))]
+        logger.info(f"Found {len(resources)} {kind} resources with {len(found)} private IPs")
+        devices.extend(found)
+    return devices
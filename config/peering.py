@@ -0,0 +1,87 @@
+"""
+VNet peering graph built from the peerings that `virtual_networks.list_all()`
+already returns inline with each VNet, so checking them costs no extra API
+call. Each VNet gets a status: OK when all its peerings are Connected, in sync
+and (when the remote VNet is part of the inventory) reciprocated.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONNECTED = 'connected'
+IN_SYNC = 'fullyinsync'
+
+def peerings_of(vnet):
+    """Peering dicts of an Azure VirtualNetwork, stored in vnet_info['peerings']"""
+    return [
+        {
+            'name': peering.name,
+            'remote_id': peering.remote_virtual_network.id if peering.remote_virtual_network else None,
+            'state': str(peering.peering_state or ''),
+            'sync_level': str(getattr(peering, 'peering_sync_level', None) or ''),
+        }
+        for peering in vnet.virtual_network_peerings or []
+    ]
+
+class PeeringGraph:
+    """Directed peering edges between VNet ids (ids compared case-insensitively)"""
+
+    def __init__(self):
+        self.edges = {}  # vnet id -> {remote id: peering dict}
+        self.names = {}
+
+    def add_vnet(self, vnet):
+        key = vnet['id'].lower()
+        self.names[key] = vnet['name']
+        self.edges[key] = {
+            peering['remote_id'].lower(): peering
+            for peering in vnet.get('peerings') or [] if peering.get('remote_id')
+        }
+
+    @classmethod
+    def from_subscriptions(cls, all_network_data):
+        graph = cls()
+        for subscription_data in all_network_data:
+            for vnet in subscription_data['vnets']:
+                if 'peerings' in vnet:
+                    graph.add_vnet(vnet)
+        return graph
+
+    def problems(self, vnet_id):
+        """[(remote name or id, reason)] of the unhealthy peerings of a VNet"""
+        result = []
+        key = vnet_id.lower()
+        for remote, peering in self.edges.get(key, {}).items():
+            remote_name = self.names.get(remote, remote.rsplit('/', 1)[-1])
+            state = peering['state'].lower()
+            if state != CONNECTED:
+                result.append((remote_name, f"state {peering['state']}"))
+            elif peering['sync_level'] and peering['sync_level'].lower() != IN_SYNC:
+                result.append((remote_name, f"sync {peering['sync_level']}"))
+            elif remote in self.edges and key not in self.edges[remote]:
+                result.append((remote_name, "asymmetric"))
+        return result
+
+    def status(self, vnet_id, ok_value, ko_value, no_peerings_value):
+        if not self.edges.get(vnet_id.lower()):
+            return no_peerings_value
+        return ko_value if self.problems(vnet_id) else ok_value
+
+def annotate(all_network_data, peering_config, report=None):
+    """
+    Set vnet_info['peering_status'] on every VNet carrying peerings (VNets read
+    back from a snapshot have none and are left alone). Returns the graph.
+    """
+    graph = PeeringGraph.from_subscriptions(all_network_data)
+    for subscription_data in all_network_data:
+        for vnet in subscription_data['vnets']:
+            if 'peerings' not in vnet:
+                continue
+            for remote_name, reason in graph.problems(vnet['id']):
+                logger.warning(f"Peering {vnet['name']} -> {remote_name}: {reason}")
+                if report:
+                    report.count('peerings_asymmetric' if reason == 'asymmetric' else 'peerings_disconnected')
+            vnet['peering_status'] = graph.status(vnet['id'], peering_config['ok_value'],
+                                                  peering_config['ko_value'], peering_config['no_peerings_value'])
+    return graph
@@ -0,0 +1,231 @@
+"""
+Plan/apply split of the Netbox stage (`azure-sync.py plan` / `apply`).
+
+`plan` does every read up front: Azure discovery, then the Netbox objects the
+sync touches in bulk (GraphQL, or one paginated list per type). It computes
+the writes sync_to_netbox would make and saves them as a compact plan file
+(JSON, gzip when the name ends in .gz):
+
+    {"version": 1, "netbox": url, "created_at": ..., "summary": {kind: {create, update, delete, unchanged}},
+     "ops": [{"op": "create", "kind": "tags", "stage": 0, "ref": -1, "data": {...}},
+             {"op": "update", "kind": "prefixes", "stage": 2, "id": 42, "data": {...}}, ...]}
+
+Objects the plan creates get a negative placeholder id (`ref`) that later
+ops use in their references (tags, site, device_type, parent, device,
+assigned_object_id...). `apply` runs the ops stage by stage, one bulk call
+per batch of the same op and kind, substituting the ids Netbox returned for
+the placeholders. It reads nothing back.
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from itertools import groupby
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+# Dependency order: an op only references objects created in an earlier stage
+STAGES = {
+    'custom_fields': 0,
+    'tags': 0,
+    'manufacturers': 0,
+    'sites': 1,
+    'device_types': 1,
+    'device_roles': 1,
+    'prefixes': 2,  # subnets under a VNet prefix the plan creates: stage 3
+    'devices': 4,
+    'interfaces': 5,
+    'ip_addresses': 6,
+}
+DELETE_STAGE = 7
+OP_ORDER = {'create': 0, 'update': 1, 'delete': 2}
+
+ENDPOINTS = {
+    'custom_fields': ('extras', 'custom_fields'),
+    'tags': ('extras', 'tags'),
+    'manufacturers': ('dcim', 'manufacturers'),
+    'sites': ('dcim', 'sites'),
+    'device_types': ('dcim', 'device_types'),
+    'device_roles': ('dcim', 'device_roles'),
+    'prefixes': ('ipam', 'prefixes'),
+    'devices': ('dcim', 'devices'),
+    'interfaces': ('dcim', 'interfaces'),
+    'ip_addresses': ('ipam', 'ip_addresses'),
+}
+
+# Keys holding the id of another object (placeholders are substituted there only)
+REFERENCE_KEYS = {'id', 'manufacturer', 'site', 'device_type', 'role', 'parent', 'device', 'assigned_object_id'}
+
+# Small object types read in full, indexed by the key the sync looks them up by
+LOOKUP_KEYS = {
+    'custom_fields': 'name',
+    'tags': 'slug',
+    'manufacturers': 'name',
+    'sites': 'name',
+    'device_types': 'model',
+    'device_roles': 'name',
+}
+
+def endpoint(nb, kind):
+    app, name = ENDPOINTS[kind]
+    return getattr(getattr(nb, app), name)
+
+class Plan:
+    """Ops being planned, with the placeholder ids handed out for objects to create"""
+
+    def __init__(self, netbox_url, lookups=None):
+        self.netbox_url = netbox_url
+        self.lookups = lookups or {kind: {} for kind in LOOKUP_KEYS}
+        self.ops = []
+        self.summary = {}
+        self._next_ref = -1
+        self._created = {}  # (kind, key) -> create op
+        self._updates = {}  # (kind, id) -> update op
+
+    def _count(self, kind, action, value=1):
+        counts = self.summary.setdefault(kind, {'create': 0, 'update': 0, 'delete': 0, 'unchanged': 0})
+        counts[action] += value
+
+    def create(self, kind, key, data, stage=None):
+        """Plan a create (once per key); returns the placeholder id"""
+        if (kind, key) in self._created:
+            op = self._created[(kind, key)]
+            op['data'].update(data)
+            return op['ref']
+        op = {'op': 'create', 'kind': kind, 'stage': STAGES[kind] if stage is None else stage,
+              'ref': self._next_ref, 'data': data}
+        self._next_ref -= 1
+        self._created[(kind, key)] = op
+        self.ops.append(op)
+        self._count(kind, 'create')
+        return op['ref']
+
+    def planned(self, kind, key):
+        """Placeholder id of an object already planned for creation, None otherwise"""
+        op = self._created.get((kind, key))
+        return op['ref'] if op else None
+
+    def ensure(self, kind, key, data):
+        """Id of a lookup object (tag, site, device type...), created by the plan if missing"""
+        existing = self.lookups[kind].get(key)
+        if existing is not None:
+            return existing
+        return self.create(kind, key, data)
+
+    def update(self, kind, record, desired, merge=()):
+        """Plan the update of an existing record to `desired` (canonical diff); returns its id"""
+        import canonical
+
+        changes = canonical.plan_update(record, desired, merge)
+        if not changes:
+            if (kind, record.id) not in self._updates:
+                self._count(kind, 'unchanged')
+            return record.id
+        op = self._updates.get((kind, record.id))
+        if op:
+            op['data'].update(changes)
+        else:
+            op = {'op': 'update', 'kind': kind, 'stage': STAGES[kind], 'id': record.id, 'data': changes}
+            self._updates[(kind, record.id)] = op
+            self.ops.append(op)
+            self._count(kind, 'update')
+        return record.id
+
+    def delete(self, kind, object_id):
+        self.ops.append({'op': 'delete', 'kind': kind, 'stage': DELETE_STAGE, 'id': object_id})
+        self._count(kind, 'delete')
+
+    def to_dict(self):
+        return {
+            'version': PLAN_VERSION,
+            'netbox': self.netbox_url,
+            'created_at': time.time(),
+            'summary': self.summary,
+            'ops': self.ops,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'), default=str)
+
+def load(path):
+    """Plan file as a dict"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version {data.get('version')} in {path}")
+    return data
+
+def format_summary(summary):
+    """One line per object type: 'prefixes: +3 ~12 -0 (=240)'"""
+    return '\n'.join(f"  {kind}: +{counts['create']} ~{counts['update']} -{counts['delete']} (={counts['unchanged']})"
+                     for kind, counts in sorted(summary.items(), key=lambda item: STAGES.get(item[0], 0)))
+
+def read_lookups(nb):
+    """{kind: {key: id}} of the small object types, one paginated list each"""
+    lookups = {}
+    for kind, key in LOOKUP_KEYS.items():
+        lookups[kind] = {getattr(obj, key): obj.id for obj in endpoint(nb, kind).all()}
+    return lookups
+
+def read_state(nb, netbox_config):
+    """Prefixes, devices, interfaces and IPs indexed like the sync looks them up (nbgraphql.NetboxState)"""
+    import nbgraphql
+
+    try:
+        state, _ = nbgraphql.prefetch(nb, netbox_config['url'], netbox_config['token'],
+                                      netbox_config.get('graphql_page_size', 1000))
+        return state
+    except Exception as e:
+        logger.warning(f"GraphQL read failed ({str(e)}), listing objects through REST")
+    state = nbgraphql.NetboxState()
+    for kind in ('prefixes', 'devices', 'interfaces', 'ip_addresses'):
+        for record in endpoint(nb, kind).all():
+            state.add(kind, record)
+    return state
+
+def _resolve(value, ids, key=None):
+    if isinstance(value, dict):
+        return {k: _resolve(v, ids, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, ids, key) for item in value]
+    if key in REFERENCE_KEYS and isinstance(value, int) and not isinstance(value, bool) and value < 0:
+        return ids[value]
+    return value
+
+def apply(nb, plan, batch_size=200, report=None, lease=None):
+    """
+    Run the ops of a loaded plan in stage order, one bulk call per batch.
+    Counts '<kind>_created/_updated/_deleted' in `report`. Stops at the first
+    failed batch (the rest of the plan is not applied; plan again), or
+    before a batch once `lease` was taken over (LeaseLost).
+    """
+    ids = {}
+    ops = sorted(plan['ops'], key=lambda op: (op['stage'], OP_ORDER[op['op']], op['kind']))
+    for (stage, action, kind), group in groupby(ops, key=lambda op: (op['stage'], op['op'], op['kind'])):
+        group = list(group)
+        target = endpoint(nb, kind)
+        start = time.time()
+        for offset in range(0, len(group), batch_size):
+            batch = group[offset:offset + batch_size]
+            if lease:
+                lease.check()
+            if action == 'create':
+                created = target.create([_resolve(op['data'], ids) for op in batch])
+                for op, record in zip(batch, created):
+                    ids[op['ref']] = record.id
+            elif action == 'update':
+                target.update([dict(_resolve(op['data'], ids), id=op['id']) for op in batch])
+            else:
+                target.delete([op['id'] for op in batch])
+        logger.info(f"Stage {stage}: {action} {len(group)} {kind} in {time.time() - start:.1f}s")
+        if report:
+            report.count(f"{kind}_{action}d", len(group))
+    return ids
@@ -0,0 +1,123 @@
+"""
+Run report for the Azure -> Netbox sync: timings, counters and errors of one
+sync cycle, written as JSON so later runs (and the daemon metrics endpoint)
+can read it back.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+class RunReport:
+    """Collects what happened during one sync run"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = 'running'
+        self.counters = Counter()
+        self.gauges = {}
+        self.subscriptions = {}
+        self.tenants = {}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """Increment a counter (e.g. 'prefixes_created'); safe from concurrent writer threads"""
+        with self._lock:
+            self.counters[name] += value
+
+    def gauge(self, name, value):
+        """Set a point-in-time value (e.g. 'netbox_concurrency_limit'); merged reports keep the highest"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def subscription_done(self, subscription_id, name, duration, **extra):
+        """Record the outcome of one subscription"""
+        self.subscriptions[subscription_id] = dict(name=name, duration=round(duration, 3), **extra)
+
+    def error(self, message):
+        """Record a non-fatal error"""
+        self.errors.append(message)
+
+    def merge(self, other):
+        """Fold another report (e.g. one shard or tenant) into this one"""
+        self.started_at = min(self.started_at, other.started_at)
+        if other.finished_at is not None:
+            self.finished_at = max(self.finished_at or 0, other.finished_at)
+        if other.status != 'success':
+            self.status = other.status
+        self.counters.update(other.counters)
+        for name, value in other.gauges.items():
+            self.gauges[name] = max(self.gauges.get(name, value), value)
+        self.subscriptions.update(other.subscriptions)
+        self.tenants.update(other.tenants)
+        self.errors.extend(other.errors)
+        return self
+
+    def tenant_done(self, name, target, other):
+        """Fold one tenant's report into this one, keeping a per-tenant summary"""
+        for subscription in other.subscriptions.values():
+            subscription['tenant'] = name
+        other.errors = [f"{name}: {error}" for error in other.errors]
+        self.merge(other)
+        self.tenants[name] = {
+            'target': target,
+            'status': other.status,
+            'duration': round(other.duration, 3),
+            'counters': dict(other.counters),
+            'gauges': dict(other.gauges),
+            'errors': len(other.errors),
+        }
+
+    def finish(self, status='success'):
+        """Close the report"""
+        self.finished_at = time.time()
+        self.status = status
+        return self
+
+    @property
+    def duration(self):
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': round(self.duration, 3),
+            'status': self.status,
+            'counters': dict(self.counters),
+            'gauges': self.gauges,
+            'subscriptions': self.subscriptions,
+            'tenants': self.tenants,
+            'errors': self.errors,
+        }
+
+    def save(self, path):
+        """Write the report as JSON (atomic replace)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a report written by save(); returns None if missing or unreadable"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        report = cls()
+        report.started_at = data.get('started_at', report.started_at)
+        report.finished_at = data.get('finished_at')
+        report.status = data.get('status', 'unknown')
+        report.counters = Counter(data.get('counters', {}))
+        report.gauges = data.get('gauges', {})
+        report.subscriptions = data.get('subscriptions', {})
+        report.tenants = data.get('tenants', {})
+        report.errors = data.get('errors', [])
+        return report
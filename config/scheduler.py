@@ -0,0 +1,178 @@
+"""
+Priority- and budget-aware ordering of the subscriptions of a run.
+
+Subscriptions are synced highest value first instead of in the order Azure
+lists them. The value of a subscription is
+
+    priority * (1 + recency_weight * 0.5 ** (since last change / recency_half_life))
+             + staleness_weight * hours since last sync (capped at max_staleness hours)
+
+where priority comes from schedule.overrides (subscription id or name), else
+from the environment detected in its name (schedule.priorities: prd, uat,
+hml, dev, default). A subscription "changed" when its discovered inventory
+differs from the previous sync.
+
+With schedule.budget (seconds, or --budget), only the subscriptions whose
+estimated runtime (discovery + Netbox sync of previous runs, or the median
+of the known ones) fits in the budget are synced; the others are carried
+over and go first on the next run. The sync also stops starting new
+subscriptions once the budget has elapsed. History and carry-over live in
+schedule.path:
+
+    {"subscriptions": {id: {name, duration, synced_at, changed_at, digest}}, "pending": [id, ...]}
+"""
+
+import glob
+import json
+import logging
+import os
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITIES = {'prd': 100, 'uat': 30, 'hml': 20, 'dev': 10, 'default': 10}
+
+class Schedule:
+    """Subscription history of previous runs and the carry-over of this one"""
+
+    def __init__(self, path, schedule_config, environment_of):
+        self.path = path
+        self.budget = schedule_config.get('budget') or None
+        self.priorities = dict(DEFAULT_PRIORITIES, **(schedule_config.get('priorities') or {}))
+        self.overrides = schedule_config.get('overrides') or {}
+        self.recency_weight = schedule_config.get('recency_weight', 1.0)
+        self.recency_half_life = schedule_config.get('recency_half_life', 3 * 86400)
+        self.staleness_weight = schedule_config.get('staleness_weight', 1.0)
+        self.max_staleness = schedule_config.get('max_staleness', 168)
+        self.default_duration = schedule_config.get('default_duration', 60)
+        self.environment_of = environment_of
+        self.history = {}
+        self.pending = []
+        self.started_at = time.time()
+        self._load()
+        for pattern in schedule_config.get('reports') or []:
+            self.seed_from_reports(pattern)
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.history = data.get('subscriptions', {})
+        self.pending = data.get('pending', [])
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'subscriptions': self.history, 'pending': self.pending}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def seed_from_reports(self, pattern):
+        """Runtimes of subscriptions without history, from previous run reports (--report files)"""
+        from runreport import RunReport
+
+        for path in sorted(glob.glob(pattern)):
+            report = RunReport.load(path)
+            if report is None:
+                continue
+            for subscription_id, entry in report.subscriptions.items():
+                if subscription_id not in self.history:
+                    self.history[subscription_id] = {
+                        'name': entry.get('name'),
+                        'duration': entry.get('duration', 0) + entry.get('sync_duration', 0),
+                        'synced_at': report.finished_at,
+                    }
+
+    def priority(self, subscription_id, name):
+        if subscription_id in self.overrides:
+            return self.overrides[subscription_id]
+        if name in self.overrides:
+            return self.overrides[name]
+        return self.priorities.get(self.environment_of(name or '') or 'default', self.priorities['default'])
+
+    def value(self, subscription_id, name, now=None):
+        now = now or time.time()
+        entry = self.history.get(subscription_id) or {}
+        changed_at = entry.get('changed_at')
+        recency = 0.5 ** ((now - changed_at) / self.recency_half_life) if changed_at else 0.0
+        synced_at = entry.get('synced_at')
+        staleness = min((now - synced_at) / 3600, self.max_staleness) if synced_at else self.max_staleness
+        return self.priority(subscription_id, name) * (1 + self.recency_weight * recency) \
+            + self.staleness_weight * staleness
+
+    def estimate(self, subscription_id):
+        """Expected runtime (s) of a subscription: its last one, else the median of the known ones"""
+        duration = (self.history.get(subscription_id) or {}).get('duration')
+        if duration is not None:
+            return duration
+        known = [entry['duration'] for entry in self.history.values() if entry.get('duration') is not None]
+        return statistics.median(known) if known else self.default_duration
+
+    def select(self, subscriptions, report=None):
+        """
+        The subscriptions to sync, in sync order: carried-over ones first, then
+        by value. With a budget, the ones that do not fit are carried over
+        (the first one is always taken, so an oversized subscription still runs).
+        """
+        now = time.time()
+        pending = set(self.pending)
+        ordered = sorted(subscriptions, key=lambda sub: (
+            sub.subscription_id not in pending, -self.value(sub.subscription_id, sub.display_name, now)))
+        if not self.budget:
+            return ordered
+
+        selected, deferred, planned = [], [], 0.0
+        for sub in ordered:
+            cost = self.estimate(sub.subscription_id)
+            if not selected or planned + cost <= self.budget:
+                selected.append(sub)
+                planned += cost
+            else:
+                deferred.append(sub)
+        self.pending = [sub.subscription_id for sub in deferred]
+        self.save()
+        if report:
+            report.count('subscriptions_deferred', len(deferred))
+        logger.info(f"Schedule: {len(selected)} subscriptions (~{planned:.0f}s) fit the {self.budget}s budget, "
+                    f"{len(deferred)} carried over to the next run")
+        return selected
+
+    def expired(self):
+        """True once the budget has elapsed (no new subscription is started)"""
+        return bool(self.budget) and time.time() - self.started_at >= self.budget
+
+    def defer(self, subscription_ids):
+        """Carry over subscriptions discovered but not synced before the budget ran out"""
+        self.pending.extend(sub for sub in subscription_ids if sub not in self.pending)
+        self.save()
+
+    def record(self, report, all_network_data):
+        """Update runtimes, sync times and change times from this run's report and inventory"""
+        import canonical
+
+        now = time.time()
+        for subscription_data in all_network_data:
+            subscription_id = subscription_data['subscription_id']
+            entry = report.subscriptions.get(subscription_id) or {}
+            if 'sync_duration' not in entry:
+                continue  # discovered, not synced (budget ran out)
+            previous = self.history.get(subscription_id) or {}
+            digest = canonical.digest(subscription_data['vnets'])
+            changed = previous.get('digest') is not None and digest != previous['digest']
+            self.history[subscription_id] = {
+                'name': subscription_data['subscription_name'],
+                'duration': round(entry.get('duration', 0) + entry['sync_duration'], 3),
+                'synced_at': now,
+                'changed_at': now if changed else previous.get('changed_at'),
+                'digest': digest,
+            }
+            if subscription_id in self.pending:
+                self.pending.remove(subscription_id)
+        self.save()
@@ -0,0 +1,163 @@
+"""
+Netbox schema bootstrap (custom fields and base tags) for azure-sync.py.
+
+The desired schema is derived from the config and fingerprinted. The
+fingerprint and the Netbox ids it resolved to are cached locally, so a run
+whose config did not change skips the bootstrap without any request. On a
+mismatch, existing objects are listed in one filtered GET per object type and
+only the differences are sent, in one bulk create / bulk update per type.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT_TAGS = ('dev', 'hml', 'uat', 'prd')
+
+def desired_schema(config):
+    """{'custom_fields': {name: spec}, 'tags': {slug: spec}} wanted by the config"""
+    custom_fields = {}
+    for field_name, field in config['custom_fields'].items():
+        if not field.get('enabled'):
+            continue
+        custom_fields[field_name] = {
+            'type': field['field_type'],
+            'description': field.get('description', ''),
+            'object_types': sorted(field.get('object_types', ["ipam.prefix"])),
+        }
+
+    tags_config = config['tags']
+    sync_tag = tags_config['sync_tag']
+    tags = {
+        sync_tag['name'].lower().replace(" ", "-"): {'name': sync_tag['name'], 'description': sync_tag['description']},
+    }
+    for tag_slug in tags_config['additional_tags']:
+        tags[tag_slug] = {'name': tag_slug.capitalize(), 'description': f"Additional tag: {tag_slug}"}
+    for env_slug in ENVIRONMENT_TAGS:
+        tags[env_slug] = {'name': env_slug.upper(), 'description': f"Environment: {env_slug.upper()}"}
+    return {'custom_fields': custom_fields, 'tags': tags}
+
+def fingerprint(schema, netbox_url):
+    """Stable hash of a schema on one Netbox instance"""
+    payload = json.dumps({'netbox': netbox_url, 'schema': schema}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def load_cache(path, expected_fingerprint, ttl):
+    """Cached {'custom_fields': {name: id}, 'tags': {slug: id}} if fingerprint and age match, else None"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('fingerprint') != expected_fingerprint:
+        logger.info("Netbox schema changed since the last bootstrap")
+        return None
+    if time.time() - data.get('applied_at', 0) > ttl:
+        logger.info(f"Netbox schema cache {path} expired")
+        return None
+    return data['ids']
+
+def save_cache(path, schema_fingerprint, ids):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'fingerprint': schema_fingerprint, 'applied_at': time.time(), 'ids': ids}, f)
+    os.replace(tmp_path, path)
+
+def invalidate(path):
+    """Forget the cached fingerprint (e.g. after a failed cycle)"""
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _custom_field_data(name, spec):
+    return {
+        'name': name,
+        'label': name.replace('_', ' ').title(),
+        'type': spec['type'],
+        'description': spec['description'],
+        'object_types': spec['object_types'],
+        'required': False,
+        'default': None,
+    }
+
+def apply_schema(nb, schema):
+    """
+    Create missing custom fields/tags and update drifted custom fields, one
+    bulk call per object type and action. Returns ({'custom_fields': {name: id},
+    'tags': {slug: id}}, {'created': n, 'updated': n}).
+    """
+    stats = {'created': 0, 'updated': 0}
+    ids = {'custom_fields': {}, 'tags': {}}
+
+    wanted_fields = schema['custom_fields']
+    if wanted_fields:
+        existing = {cf.name: cf for cf in nb.extras.custom_fields.filter(name=list(wanted_fields))}
+        updates = []
+        for name, spec in wanted_fields.items():
+            current = existing.get(name)
+            if current is None:
+                continue
+            ids['custom_fields'][name] = current.id
+            object_types = sorted(set(current.object_types or []) | set(spec['object_types']))
+            if (current.description or '') != spec['description'] or object_types != sorted(current.object_types or []):
+                updates.append({'id': current.id, 'description': spec['description'], 'object_types': object_types})
+        missing = [_custom_field_data(name, spec) for name, spec in wanted_fields.items() if name not in existing]
+        if missing:
+            logger.info(f"Creating custom fields: {', '.join(data['name'] for data in missing)}")
+            for cf in _bulk_create(nb.extras.custom_fields, missing, 'name'):
+                ids['custom_fields'][cf.name] = cf.id
+            stats['created'] += len(missing)
+        if updates:
+            logger.info(f"Updating {len(updates)} custom fields")
+            nb.extras.custom_fields.update(updates)
+            stats['updated'] += len(updates)
+
+    wanted_tags = schema['tags']
+    if wanted_tags:
+        existing = {tag.slug: tag for tag in nb.extras.tags.filter(slug=list(wanted_tags))}
+        ids['tags'].update({slug: tag.id for slug, tag in existing.items()})
+        missing = [dict(spec, slug=slug) for slug, spec in wanted_tags.items() if slug not in existing]
+        if missing:
+            logger.info(f"Creating tags: {', '.join(data['slug'] for data in missing)}")
+            for tag in _bulk_create(nb.extras.tags, missing, 'slug'):
+                ids['tags'][tag.slug] = tag.id
+            stats['created'] += len(missing)
+    return ids, stats
+
+def _bulk_create(endpoint, objects, key):
+    """Bulk create; if another shard/process won the race, read the objects back instead"""
+    try:
+        return endpoint.create(objects)
+    except Exception:
+        found = list(endpoint.filter(**{key: [data[key] for data in objects]}))
+        if len(found) < len(objects):
+            raise
+        return found
+
+def ensure_schema(nb, config, netbox_url, cache_path=None, ttl=86400):
+    """
+    Make sure the config's schema exists in Netbox. Returns (ids, applied)
+    where applied is False when the cached fingerprint matched and nothing
+    was requested from Netbox.
+    """
+    schema = desired_schema(config)
+    schema_fingerprint = fingerprint(schema, netbox_url)
+    if cache_path:
+        ids = load_cache(cache_path, schema_fingerprint, ttl)
+        if ids is not None:
+            logger.info(f"Netbox schema up to date ({schema_fingerprint[:12]}), skipping bootstrap")
+            return ids, False
+
+    start = time.time()
+    ids, stats = apply_schema(nb, schema)
+    logger.info(f"Netbox schema applied in {time.time() - start:.1f}s "
+                f"({stats['created']} created, {stats['updated']} updated)")
+    if cache_path:
+        save_cache(cache_path, schema_fingerprint, ids)
+    return ids, True
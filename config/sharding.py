@@ -0,0 +1,49 @@
+"""
+Subscription sharding for `azure-sync.py --shard i/N` and `--workers N`.
+
+Subscriptions are placed on a consistent-hash ring, so changing N only moves
+about 1/N of them to another shard (their warm caches and run history stay
+useful) and every worker computes the same split without coordination.
+"""
+
+import bisect
+import hashlib
+
+class HashRing:
+    """Consistent-hash ring of `shards` shards with `vnodes` virtual nodes each"""
+
+    def __init__(self, shards, vnodes=64):
+        if shards < 1:
+            raise ValueError("Number of shards must be >= 1")
+        self.shards = shards
+        points = sorted(
+            (self._hash(f"shard-{shard}-{vnode}"), shard)
+            for shard in range(shards)
+            for vnode in range(vnodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def shard_of(self, key):
+        """Shard owning a key (subscription IDs are compared case-insensitively)"""
+        index = bisect.bisect(self._keys, self._hash(key.lower())) % len(self._keys)
+        return self._shards[index]
+
+def parse_shard(value):
+    """Parse 'i/N' (0 <= i < N) into (i, N)"""
+    try:
+        index, total = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N (e.g. 0/4)")
+    if total < 1 or not 0 <= index < total:
+        raise ValueError(f"Invalid shard '{value}': index must be in [0, {total - 1}]")
+    return index, total
+
+def select(subscriptions, index, total, vnodes=64):
+    """Keep the subscriptions that belong to shard `index` of `total`"""
+    ring = HashRing(total, vnodes)
+    return [sub for sub in subscriptions if ring.shard_of(sub.subscription_id) == index]
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Inventory snapshots of an Azure discovery (subscriptions, VNets, subnets,
+devices), written while discovery proceeds and readable without Azure.
+
+Format: NDJSON, one JSON array per record, optionally gzip-compressed (.gz).
+The first line is a header; records follow in tree order, each one belonging
+to the last record of its parent kind:
+
+    ["S", subscription_id, subscription_name*, management_group*]
+    ["V", name, id, resource_group*, location*, [address_space, ...]]
+    ["N", name, id, address_prefix]
+    ["D", name, id, type*, ip_address, mac_address, resource_group*, location*, os_type*]
+
+Columns marked * are dictionary-encoded: they hold an integer index into a
+string table defined inline by ["=", index, "string"] records, so a
+location or resource group repeated 150k times costs a few bytes each.
+A device id ending with "/<name>" is stored as the index of its parent path
+(".../providers/Microsoft.Compute/virtualMachines"), otherwise verbatim.
+
+CLI:
+    python snapshot.py summary snap.ndjson
+    python snapshot.py diff old.ndjson new.ndjson
+    python snapshot.py capacity-csv snap.ndjson > capacity.csv   (input of ips/netbox.py)
+"""
+
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import mmap
+import os
+import sys
+import time
+
+FORMAT_VERSION = 1
+
+class SnapshotWriter:
+    """Streamed snapshot writer; call write_subscription() as each subscription is discovered"""
+
+    def __init__(self, path):
+        self.path = path
+        self.strings = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        opener = gzip.open if path.endswith('.gz') else open
+        self.file = opener(path, 'wt', encoding='utf-8')
+        self._write({'snapshot': FORMAT_VERSION, 'created_at': time.time()})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False))
+        self.file.write('\n')
+
+    def _ref(self, value):
+        """Index of a dictionary-encoded string, defining it on first use"""
+        if value is None:
+            return None
+        value = str(value)
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+            self._write(['=', index, value])
+        return index
+
+    def _id_ref(self, resource_id, name):
+        """Dictionary-encode the parent path of an ARM id ending with the resource name"""
+        parent, _, last = resource_id.rpartition('/')
+        if parent and last == name:
+            return self._ref(parent)
+        return resource_id
+
+    def write_subscription(self, subscription_data):
+        """Write one subscription dict (as built by discovery) with its VNets, subnets and devices"""
+        self._write(['S', subscription_data['subscription_id'],
+                     self._ref(subscription_data['subscription_name']),
+                     self._ref(subscription_data.get('management_group'))])
+        for vnet in subscription_data['vnets']:
+            self._write(['V', vnet['name'], vnet['id'], self._ref(vnet['resource_group']),
+                         self._ref(vnet['location']), list(vnet['address_space'])])
+            for subnet in vnet['subnets']:
+                self._write(['N', subnet['name'], subnet['id'], subnet.get('address_prefix')])
+                for device in subnet['devices']:
+                    self._write(['D', device['name'], self._id_ref(device['id'], device['name']),
+                                 self._ref(device['type']),
+                                 device['ip_address'], device.get('mac_address'),
+                                 self._ref(device.get('resource_group')), self._ref(device.get('location')),
+                                 self._ref(device.get('os_type'))])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SnapshotReader:
+    """Lazy snapshot reader (memory-mapped when the file is not compressed)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _lines(self):
+        if self.path.endswith('.gz'):
+            with gzip.open(self.path, 'rb') as f:
+                yield from f
+            return
+        with open(self.path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return  # empty file
+            with mm:
+                yield from iter(mm.readline, b'')
+
+    def _rows(self, batch_size=8192):
+        """Decoded JSON rows, decoding `batch_size` lines per json.loads call"""
+        lines = self._lines()
+        header = json.loads(next(lines, b'{}'))
+        if header.get('snapshot') != FORMAT_VERSION:
+            raise ValueError(f"{self.path}: not a version {FORMAT_VERSION} snapshot")
+        while True:
+            batch = list(itertools.islice(lines, batch_size))
+            if not batch:
+                return
+            yield from json.loads(b'[' + b','.join(line.rstrip(b'\n') for line in batch) + b']')
+
+    def records(self):
+        """Yield (kind, record) with dictionary-encoded columns decoded"""
+        strings = []
+        for record in self._rows():
+            kind = record[0]
+            if kind == '=':
+                strings.append(record[2])
+                continue
+            if kind == 'S':
+                yield kind, {'subscription_id': record[1], 'subscription_name': _get(strings, record[2]),
+                             'management_group': _get(strings, record[3])}
+            elif kind == 'V':
+                yield kind, {'name': record[1], 'id': record[2], 'resource_group': _get(strings, record[3]),
+                             'location': _get(strings, record[4]), 'address_space': record[5]}
+            elif kind == 'N':
+                yield kind, {'name': record[1], 'id': record[2], 'address_prefix': record[3]}
+            elif kind == 'D':
+                resource_id = record[2]
+                if resource_id.__class__ is int:
+                    resource_id = f"{strings[resource_id]}/{record[1]}"
+                yield kind, {'name': record[1], 'id': resource_id, 'type': _get(strings, record[3]),
+                             'ip_address': record[4], 'mac_address': record[5],
+                             'resource_group': _get(strings, record[6]), 'location': _get(strings, record[7]),
+                             'os_type': _get(strings, record[8])}
+
+    def subscriptions(self):
+        """Yield subscription dicts with the same nested structure discovery builds"""
+        current = vnet = subnet = None
+        for kind, record in self.records():
+            if kind == 'S':
+                if current:
+                    yield current
+                current = dict(record, vnets=[])
+            elif kind == 'V':
+                vnet = dict(record, subnets=[])
+                current['vnets'].append(vnet)
+            elif kind == 'N':
+                subnet = dict(record, devices=[])
+                vnet['subnets'].append(subnet)
+            elif kind == 'D':
+                subnet['devices'].append(record)
+        if current:
+            yield current
+
+    def devices(self):
+        """Yield flat device dicts with their subscription/VNet/subnet context"""
+        sub = vnet = subnet = None
+        for kind, record in self.records():
+            if kind == 'S':
+                sub = record
+            elif kind == 'V':
+                vnet = record
+            elif kind == 'N':
+                subnet = record
+            elif kind == 'D':
+                record['subscription_id'] = sub['subscription_id']
+                record['vnet'] = vnet['name']
+                record['subnet'] = subnet['name']
+                record['subnet_prefix'] = subnet['address_prefix']
+                yield record
+
+def shard_path(path, shard):
+    """
+    Snapshot file of shard (i, N): ".shard{i}-of-{N}" inserted before the
+    extension, so ".gz" still selects gzip
+    """
+    root, ext = os.path.splitext(path)
+    if ext == '.gz':
+        root, inner_ext = os.path.splitext(root)
+        ext = inner_ext + ext
+    return f"{root}.shard{shard[0]}-of-{shard[1]}{ext}"
+
+def _get(strings, index):
+    return strings[index] if index is not None else None
+
+def summarize(path):
+    """Counts per record kind (only looks at the kind column, no JSON decoding)"""
+    counts = {'subscriptions': 0, 'vnets': 0, 'subnets': 0, 'devices': 0}
+    names = {b'S': 'subscriptions', b'V': 'vnets', b'N': 'subnets', b'D': 'devices'}
+    lines = SnapshotReader(path)._lines()
+    next(lines, None)
+    for line in lines:
+        name = names.get(line[2:3])
+        if name:
+            counts[name] += 1
+    return counts
+
+def _keys(path):
+    prefixes, devices = set(), {}
+    for kind, record in SnapshotReader(path).records():
+        if kind == 'V':
+            prefixes.update(record['address_space'])
+        elif kind == 'N' and record['address_prefix']:
+            prefixes.add(record['address_prefix'])
+        elif kind == 'D':
+            devices[(record['id'].lower(), record['ip_address'])] = record['name']
+    return prefixes, devices
+
+def diff(old_path, new_path):
+    """Prefixes and devices added/removed between two snapshots"""
+    old_prefixes, old_devices = _keys(old_path)
+    new_prefixes, new_devices = _keys(new_path)
+    return {
+        'prefixes_added': sorted(new_prefixes - old_prefixes),
+        'prefixes_removed': sorted(old_prefixes - new_prefixes),
+        'devices_added': sorted(f"{new_devices[key]} {key[1]}" for key in new_devices.keys() - old_devices.keys()),
+        'devices_removed': sorted(f"{old_devices[key]} {key[1]}" for key in old_devices.keys() - new_devices.keys()),
+    }
+
+def write_capacity_csv(path, out):
+    """Per address space capacity, in the CSV layout ips/netbox.py reads"""
+    from capacity import vnet_usage
+
+    writer = csv.writer(out)
+    writer.writerow(['VNet', 'ResourceGroup', 'Prefix', 'Nb subnets', 'IPs used', 'IPs available',
+                     'UsagePercent', 'ReservedIPs'])
+    for subscription in SnapshotReader(path).subscriptions():
+        for vnet in subscription['vnets']:
+            spaces, _ = vnet_usage(vnet)
+            for prefix, usage in spaces.items():
+                pct = usage['used'] / usage['total'] * 100 if usage['total'] else 0
+                writer.writerow([vnet['name'], vnet['resource_group'], prefix, usage['subnets'],
+                                 usage['used'], usage['available'], f"{pct:.2f}", usage['reserved']])
+
+def main():
+    parser = argparse.ArgumentParser(description='Read inventory snapshots written by azure-sync.py')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summary_parser = sub.add_parser('summary', help='Counts of subscriptions, VNets, subnets and devices')
+    summary_parser.add_argument('snapshot')
+    diff_parser = sub.add_parser('diff', help='Prefixes and devices added/removed between two snapshots')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    csv_parser = sub.add_parser('capacity-csv', help='Capacity CSV for ips/netbox.py')
+    csv_parser.add_argument('snapshot')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'summary':
+        print(json.dumps(summarize(args.snapshot), indent=2))
+    elif args.command == 'diff':
+        result = diff(args.old, args.new)
+        for key, values in result.items():
+            print(f"{key}: {len(values)}")
+            for value in values:
+                print(f"  {value}")
+    elif args.command == 'capacity-csv':
+        write_capacity_csv(args.snapshot, sys.stdout)
+    print(f"({time.perf_counter() - start:.2f}s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Daemon loop and health/metrics endpoint for `azure-sync.py --daemon`.
+
+The loop runs a sync callable every `interval` seconds (+/- jitter) in the
+same process, so credentials, HTTP connection pools and Netbox caches stay
+warm between cycles. A small HTTP server exposes:
+
+    /healthz   200 unless no cycle succeeded (or was skipped under another
+               instance's lease, or partial) for longer than expected, else 503
+    /metrics   Prometheus text format (last-run duration, lag, counters)
+"""
+
+import json
+import logging
+import random
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Cycle outcomes that count as the daemon doing its job
+HEALTHY_STATUSES = ('success', 'partial', 'skipped')
+
+class DaemonState:
+    """Shared state between the sync loop and the metrics server"""
+
+    def __init__(self, interval, jitter):
+        self.interval = interval
+        self.jitter = jitter
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.runs = {'success': 0, 'failure': 0}
+        self.last_report = None
+        self.last_success_at = None
+        self.next_run_at = None
+        self.running = False
+
+    def record(self, report):
+        with self.lock:
+            self.last_report = report
+            self.runs[report.status] = self.runs.get(report.status, 0) + 1
+            if report.status in HEALTHY_STATUSES:
+                self.last_success_at = report.finished_at
+
+    def lag(self, now=None):
+        """Seconds since the last healthy cycle ended (since start if none yet)"""
+        now = now or time.time()
+        return now - (self.last_success_at or self.started_at)
+
+    def healthy(self, now=None):
+        """
+        Unhealthy only once no cycle has ended well for one interval + jitter +
+        the last run duration: a single failed cycle, a standby replica
+        skipping cycles under another instance's lease, or a partial run
+        (failures dead-lettered) keep the probe green.
+        """
+        with self.lock:
+            last_duration = self.last_report.duration if self.last_report else 0
+            return self.lag(now) <= self.interval + self.jitter + max(last_duration, self.interval)
+
+    def metrics(self):
+        """Prometheus exposition format"""
+        with self.lock:
+            report = self.last_report
+            lines = [
+                '# HELP azure_sync_lag_seconds Seconds since the last successful, partial or skipped sync ended',
+                '# TYPE azure_sync_lag_seconds gauge',
+                f'azure_sync_lag_seconds {self.lag():.3f}',
+                '# HELP azure_sync_last_run_duration_seconds Duration of the last sync cycle',
+                '# TYPE azure_sync_last_run_duration_seconds gauge',
+                f'azure_sync_last_run_duration_seconds {report.duration if report else 0:.3f}',
+                '# HELP azure_sync_last_success_timestamp_seconds End of the last successful sync',
+                '# TYPE azure_sync_last_success_timestamp_seconds gauge',
+                f'azure_sync_last_success_timestamp_seconds {self.last_success_at or 0:.3f}',
+                '# HELP azure_sync_running 1 while a sync cycle is in progress',
+                '# TYPE azure_sync_running gauge',
+                f'azure_sync_running {int(self.running)}',
+                '# HELP azure_sync_runs_total Sync cycles by outcome',
+                '# TYPE azure_sync_runs_total counter',
+            ]
+            lines += [f'azure_sync_runs_total{{status="{status}"}} {count}'
+                      for status, count in sorted(self.runs.items())]
+            if report and 'netbox_concurrency_limit' in report.gauges:
+                lines += [
+                    '# HELP azure_sync_netbox_concurrency_limit Netbox requests in flight allowed at the end of the last cycle',
+                    '# TYPE azure_sync_netbox_concurrency_limit gauge',
+                    f"azure_sync_netbox_concurrency_limit {report.gauges['netbox_concurrency_limit']}",
+                    '# HELP azure_sync_netbox_requests_per_second Netbox request throughput of the last cycle',
+                    '# TYPE azure_sync_netbox_requests_per_second gauge',
+                    f"azure_sync_netbox_requests_per_second {report.gauges['netbox_requests_per_second']}",
+                ]
+            if report:
+                lines += ['# HELP azure_sync_last_run_objects Objects handled by the last sync cycle',
+                          '# TYPE azure_sync_last_run_objects gauge']
+                lines += [f'azure_sync_last_run_objects{{counter="{name}"}} {value}'
+                          for name, value in sorted(report.counters.items())]
+        return '\n'.join(lines) + '\n'
+
+def start_metrics_server(state, port, bind='127.0.0.1'):
+    """Serve /healthz and /metrics from a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/healthz':
+                healthy = state.healthy()
+                body = json.dumps({
+                    'status': 'ok' if healthy else 'unhealthy',
+                    'lag': round(state.lag(), 3),
+                    'last_run': state.last_report.to_dict() if state.last_report else None,
+                    'next_run_at': state.next_run_at,
+                }).encode()
+                self._send(200 if healthy else 503, body, 'application/json')
+            elif self.path == '/metrics':
+                self._send(200, state.metrics().encode(), 'text/plain; version=0.0.4')
+            else:
+                self._send(404, b'not found\n', 'text/plain')
+
+        def _send(self, code, body, content_type):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logger.debug(f"metrics: {fmt % args}")
+
+    server = ThreadingHTTPServer((bind, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Health/metrics endpoint listening on http://{bind}:{port}/healthz and /metrics")
+    return server
+
+def run_forever(cycle, state, stop_event=None):
+    """
+    Call `cycle()` (which returns a finished RunReport) every interval +/- jitter
+    until SIGTERM/SIGINT. The next run is scheduled from the start of the
+    previous one, so a slow cycle eats into the wait instead of drifting.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping after the current cycle")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stop_event.is_set():
+        cycle_start = time.time()
+        state.running = True
+        try:
+            report = cycle()
+        finally:
+            state.running = False
+        state.record(report)
+        logger.info(f"Sync cycle {report.status} in {report.duration:.1f}s")
+
+        delay = state.interval + random.uniform(-state.jitter, state.jitter)
+        state.next_run_at = cycle_start + max(delay, 0)
+        wait = max(state.next_run_at - time.time(), 0)
+        logger.info(f"Next sync in {wait:.0f}s")
+        stop_event.wait(wait)
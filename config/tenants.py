@@ -0,0 +1,227 @@
+"""
+Multi-tenant orchestration: several Azure tenants, each synced to its Netbox
+target, from one process and one orchestrator file (`azure-sync.py --tenants`).
+
+    base: config.yaml            # shared settings, every tenant is merged over it
+    max_concurrency: 4           # tenants synced at the same time
+    targets:
+      main:
+        url: https://netbox.example.com/api
+        token: ...
+        max_tenants: 2           # tenants writing to this Netbox at the same time
+        pool_size: 16            # HTTP connections shared by those tenants
+    tenants:
+      - name: contoso
+        target: main
+        config: contoso.yaml     # optional, merged over base
+        discovery_workers: 4     # subscriptions of this tenant discovered in parallel
+        azure: {...}             # any other key is a config section merged over base
+
+Tenants of the same target share one pynetbox client (one connection pool)
+and one schema bootstrap per distinct schema. State files (checkpoint, dead
+letters, snapshots, trends, schedule, management group cache) get a per-tenant suffix
+so that concurrent tenants never write the same file.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yaml
+
+from runreport import RunReport
+
+logger = logging.getLogger(__name__)
+
+TENANT_KEYS = ('name', 'target', 'config', 'discovery_workers', 'enabled')
+
+# (section, key) of the per-run state files, suffixed per tenant
+TENANT_PATHS = (
+    ('checkpoint', 'path'),
+    ('deadletter', 'path'),
+    ('snapshot', 'path'),
+    ('trends', 'path'),
+    ('lease', 'path'),
+    ('schedule', 'path'),
+)
+
+class Tenant:
+    """One tenant block resolved to a full sync config"""
+
+    def __init__(self, name, target, config):
+        self.name = name
+        self.target = target
+        self.config = config
+
+    def __repr__(self):
+        return f"Tenant({self.name!r} -> {self.target!r})"
+
+class Orchestration:
+    """Parsed orchestrator file: global limit, Netbox targets and tenants"""
+
+    def __init__(self, path, max_concurrency, targets, tenants):
+        self.path = path
+        self.max_concurrency = max_concurrency
+        self.targets = targets
+        self.tenants = tenants
+
+def deep_merge(base, override):
+    """Copy of `base` with `override` merged in (dicts recursively, anything else replaced)"""
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+def _suffixed(path, suffix):
+    """'deadletter.ndjson' -> 'deadletter.contoso.ndjson' (keeps .ndjson.gz style double extensions)"""
+    directory, filename = os.path.split(path)
+    hidden = filename[:len(filename) - len(filename.lstrip('.'))]
+    stem, dot, extensions = filename[len(hidden):].partition('.')
+    filename = f"{hidden}{stem}.{suffix}.{extensions}" if dot else f"{filename}.{suffix}"
+    return os.path.join(directory, filename)
+
+def tenant_config(base, block, target_name, target):
+    """Full config of one tenant: base, its own config file, its block, then the Netbox target"""
+    overrides = {key: value for key, value in block.items() if key not in TENANT_KEYS}
+    config = deep_merge(base, overrides)
+    netbox = config.setdefault('netbox', {})
+    netbox.update({key: target[key] for key in ('url', 'token', 'pool_size') if key in target})
+    if 'discovery_workers' in block:
+        config.setdefault('azure', {})['discovery_workers'] = block['discovery_workers']
+
+    name = block['name']
+    config.setdefault('checkpoint', {}).setdefault('path', '.azure-sync-checkpoint.json')
+    for section, key in TENANT_PATHS:
+        if (config.get(section) or {}).get(key):
+            config[section][key] = _suffixed(config[section][key], name)
+    if (config.get('lease') or {}).get('backend') == 'netbox':
+        config['lease']['name'] = f"{config['lease'].get('name', 'azure-sync-lease')}-{name}"
+    mg_cache = config.get('azure', {}).get('management_group_cache') or {}
+    if mg_cache.get('path'):
+        mg_cache['path'] = _suffixed(mg_cache['path'], name)
+    # The schema cache describes one Netbox instance: shared by the tenants of a target
+    if (config.get('schema') or {}).get('cache_path'):
+        config['schema']['cache_path'] = _suffixed(config['schema']['cache_path'], target_name)
+    return config
+
+def load(path, load_config):
+    """Read an orchestrator file; tenant and base config files are resolved relative to it"""
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f) or {}
+    directory = os.path.dirname(os.path.abspath(path))
+
+    def resolve(filename):
+        return filename if os.path.isabs(filename) else os.path.join(directory, filename)
+
+    base = load_config(resolve(data['base'])) if data.get('base') else {}
+    targets = data.get('targets') or {}
+    tenants = []
+    for block in data.get('tenants') or []:
+        if not block.get('enabled', True):
+            continue
+        tenant_base = deep_merge(base, load_config(resolve(block['config']))) if block.get('config') else base
+        target_name = block.get('target')
+        tenants.append(Tenant(block.get('name'), target_name,
+                              tenant_config(tenant_base, block, target_name, targets.get(target_name) or {})))
+    return Orchestration(path, data.get('max_concurrency', 4), targets, tenants)
+
+def validate(orchestration, validate_config):
+    """Errors of the orchestrator file and of every tenant config, prefixed with the tenant name"""
+    errors = []
+    if not orchestration.tenants:
+        errors.append("No enabled tenant in the orchestrator file")
+    for name, target in orchestration.targets.items():
+        if not target.get('url') or not target.get('token'):
+            errors.append(f"Target '{name}': url and token are required")
+    seen = set()
+    for tenant in orchestration.tenants:
+        if not tenant.name:
+            errors.append("Tenant without a name")
+            continue
+        if tenant.name in seen:
+            errors.append(f"Duplicate tenant name '{tenant.name}'")
+        seen.add(tenant.name)
+        if tenant.target not in orchestration.targets:
+            errors.append(f"Tenant '{tenant.name}': unknown target '{tenant.target}'")
+        errors.extend(f"Tenant '{tenant.name}': {error}" for error in validate_config(tenant.config))
+    return errors
+
+def bootstrap_key(config):
+    """Hash of what bootstrap_netbox creates, so tenants with the same schema bootstrap once per target"""
+    import schema
+
+    payload = json.dumps({
+        'schema': schema.desired_schema(config),
+        'mapping': config.get('mapping'),
+        'regions': config.get('organization', {}).get('regions', {}).get('mapping', []),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class TargetPool:
+    """Per Netbox target: the shared client, the tenant limit and the schema bootstraps done"""
+
+    def __init__(self, name, target, connect, bootstrap):
+        self.name = name
+        self.slots = threading.BoundedSemaphore(target.get('max_tenants', 2))
+        self.lock = threading.Lock()
+        self._connect = connect
+        self._bootstrap = bootstrap
+        self._nb = None
+        self._bootstrapped = set()
+
+    def client(self, config):
+        """Shared pynetbox client of the target, bootstrapped for this tenant's schema"""
+        with self.lock:
+            if self._nb is None:
+                self._nb = self._connect(config)
+            key = bootstrap_key(config)
+            if key not in self._bootstrapped:
+                logger.info(f"Bootstrapping Netbox target '{self.name}'")
+                self._bootstrap(self._nb, config)
+                self._bootstrapped.add(key)
+            return self._nb
+
+def run(orchestration, connect, bootstrap, run_tenant):
+    """
+    Sync every tenant, at most `max_concurrency` at a time and `max_tenants` per
+    target. connect(config) builds a Netbox client, bootstrap(nb, config) creates
+    the shared objects, run_tenant(tenant, nb) syncs one tenant and returns its
+    RunReport. Returns the consolidated RunReport.
+    """
+    pools = {name: TargetPool(name, target, connect, bootstrap)
+             for name, target in orchestration.targets.items()}
+    report = RunReport()
+
+    def work(tenant):
+        threading.current_thread().name = tenant.name
+        pool = pools[tenant.target]
+        with pool.slots:
+            tenant_report = RunReport()
+            try:
+                nb = pool.client(tenant.config)
+                tenant_report = run_tenant(tenant, nb)
+            except Exception as e:
+                logger.error(f"Tenant {tenant.name} failed: {str(e)}", exc_info=True)
+                tenant_report.error(str(e))
+                tenant_report.finish('failure')
+            return tenant_report
+
+    with ThreadPoolExecutor(max_workers=orchestration.max_concurrency) as executor:
+        futures = {executor.submit(work, tenant): tenant for tenant in orchestration.tenants}
+        for future in as_completed(futures):
+            tenant = futures[future]
+            tenant_report = future.result()
+            logger.info(f"Tenant {tenant.name} finished ({tenant_report.status}) in {tenant_report.duration:.1f}s")
+            report.tenant_done(tenant.name, tenant.target, tenant_report)
+    report.finished_at = time.time()
+    if report.status == 'running':
+        report.status = 'success'
+    return report
@@ -0,0 +1,33 @@
+"""
+Unit tests of the config/ modules shared by azure-sync.py.
+
+    cd config && python -m pytest -q tests
+
+The modules import their siblings by name (as azure-sync.py runs them), so
+config/ goes on sys.path. None of the tests needs Azure, Netbox or their SDKs.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeRecord:
+    """The part of a pynetbox Record the sync uses: id, serialize(), update()"""
+
+    def __init__(self, id, **fields):
+        self.id = id
+        self.fields = dict(fields, id=id)
+        self.updates = []
+
+    def serialize(self):
+        return dict(self.fields)
+
+    def update(self, changes):
+        self.updates.append(changes)
+        self.fields.update(changes)
+        return True
+
+    def __str__(self):
+        return str(self.fields.get('name', self.id))
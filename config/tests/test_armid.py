@@ -0,0 +1,31 @@
+import armid
+
+SUBNET_ID = ('/subscriptions/00000000-0000-0000-0000-000000000001/resourceGroups/RG-Net'
+             '/providers/Microsoft.Network/virtualNetworks/vnet1/subnets/snet1')
+
+
+def test_segments_of_a_child_resource():
+    subnet = armid.parse(SUBNET_ID)
+
+    assert subnet.subscription_id == '00000000-0000-0000-0000-000000000001'
+    assert subnet.resource_group == 'RG-Net'
+    assert subnet.type == 'Microsoft.Network/virtualNetworks/subnets'
+    assert subnet.name == 'snet1'
+    assert subnet.parent.name == 'vnet1'
+    assert armid.parse(subnet.parent.id).parent is None
+
+
+def test_ids_compare_and_hash_case_insensitively():
+    upper = armid.parse(SUBNET_ID.upper())
+
+    assert upper == armid.parse(SUBNET_ID)
+    assert upper == SUBNET_ID.lower() + '/'
+    assert {armid.parse(SUBNET_ID): 'subnet'}[upper] == 'subnet'
+
+
+def test_parse_is_cached():
+    assert armid.parse(SUBNET_ID) is armid.parse(SUBNET_ID)
+
+
+def test_resource_group_keeps_the_original_spelling():
+    assert armid.resource_group(SUBNET_ID) == 'RG-Net'
@@ -0,0 +1,47 @@
+import canonical
+from conftest import FakeRecord
+
+
+def test_normalize_references_choices_and_empty_values():
+    assert canonical.normalize({'id': 7, 'name': 'site'}) == 7
+    assert canonical.normalize({'value': 'active', 'label': 'Active'}) == 'active'
+    assert canonical.normalize('') is None
+    assert canonical.normalize([3, {'id': 1}, 2]) == [1, 2, 3]
+    assert canonical.normalize(4.0) == 4
+
+
+def test_plan_update_is_empty_when_nothing_changed():
+    record = FakeRecord(1, status='active', description='', tags=[2, 1])
+    desired = {'status': {'value': 'active'}, 'description': None, 'tags': [{'id': 1}, {'id': 2}]}
+
+    assert canonical.plan_update(record, desired) == {}
+
+
+def test_plan_update_returns_only_the_changed_fields():
+    record = FakeRecord(1, status='active', description='old', tags=[1])
+
+    changes = canonical.plan_update(record, {'status': 'active', 'description': 'new', 'tags': [{'id': 1}]})
+
+    assert changes == {'description': 'new'}
+
+
+def test_plan_update_skips_keys_the_record_does_not_carry():
+    record = FakeRecord(1, description='same')
+
+    assert canonical.plan_update(record, {'description': 'same', 'parent': 12}) == {}
+
+
+def test_merged_tags_are_added_never_removed():
+    record = FakeRecord(1, tags=[5, 9])
+
+    assert canonical.plan_update(record, {'tags': [{'id': 5}]}, merge=('tags',)) == {}
+    assert canonical.plan_update(record, {'tags': [{'id': 3}]}, merge=('tags',)) == \
+        {'tags': [{'id': 3}, {'id': 5}, {'id': 9}]}
+
+
+def test_custom_fields_compare_managed_keys_and_keep_the_others():
+    record = FakeRecord(1, custom_fields={'azure_subscription': 'sub', 'owner': 'network team'})
+
+    assert canonical.plan_update(record, {'custom_fields': {'azure_subscription': 'sub'}}) == {}
+    assert canonical.plan_update(record, {'custom_fields': {'azure_subscription': 'other'}}) == \
+        {'custom_fields': {'azure_subscription': 'other', 'owner': 'network team'}}
@@ -0,0 +1,45 @@
+import os
+
+import capacity
+
+NETBOX_SCRIPT = os.path.join(os.path.dirname(__file__), '..', '..', 'ips', 'netbox.py')
+
+VNET = {
+    'address_space': ['10.0.0.0/16'],
+    'subnets': [
+        {'address_prefix': '10.0.1.0/24', 'devices': [{'ip_address': '10.0.1.4'}, {'ip_address': '10.0.1.5'}]},
+        {'address_prefix': '10.0.2.0/24', 'devices': []},
+    ],
+}
+
+
+def load_netbox_script():
+    """Namespace of ips/netbox.py; its code stops where the pasted instructions begin"""
+    with open(NETBOX_SCRIPT, encoding='utf-8') as f:
+        source = f.read().split('\nInstructions\n')[0]
+    namespace = {'__file__': NETBOX_SCRIPT, '__name__': 'ips_netbox'}
+    exec(compile(source, NETBOX_SCRIPT, 'exec'), namespace)
+    return namespace
+
+
+def test_vnet_and_subnet_summaries_match_ips_netbox():
+    script = load_netbox_script()
+    spaces, subnets = capacity.vnet_usage(VNET)
+
+    for prefix, usage in [('10.0.0.0/16', spaces['10.0.0.0/16']), ('10.0.1.0/24', subnets['10.0.1.0/24'])]:
+        summary = capacity.make_summary(prefix, usage['subnets'], usage['used'], usage['available'])
+        assert summary == script['make_summary'](prefix, usage['subnets'], usage['used'], usage['available'])
+
+    usage = spaces['10.0.0.0/16']
+    assert capacity.make_summary('10.0.0.0/16', usage['subnets'], usage['used'], usage['available']) == \
+        '🧩 Subnets: 2 | 🔴 Utilisées: 12 | 🟢 Disponibles: 65 524 | ⚖️ 100.0%'
+    usage = subnets['10.0.1.0/24']
+    assert capacity.make_summary('10.0.1.0/24', usage['subnets'], usage['used'], usage['available']) == \
+        '🧩 Subnets: 1 | 🔴 Utilisées: 7 | 🟢 Disponibles: 249 | ⚖️ 99.2%'
+
+
+def test_address_space_sums_its_subnets():
+    spaces, subnets = capacity.vnet_usage(VNET)
+
+    assert subnets['10.0.1.0/24'] == {'total': 256, 'used': 7, 'available': 249, 'reserved': 5, 'subnets': 1}
+    assert (spaces['10.0.0.0/16']['used'], spaces['10.0.0.0/16']['subnets']) == (12, 2)
@@ -0,0 +1,177 @@
+import threading
+import time
+
+import concurrency
+from runreport import RunReport
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ScriptedSession:
+    """requests.Session stand-in answering the given status codes in turn"""
+
+    def __init__(self, *status_codes):
+        self.responses = [Response(code, {'Retry-After': '0'}) for code in status_codes]
+        self.calls = 0
+        self.headers = {}
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def run_window(limiter, latency, errors=0):
+    for index in range(limiter.window):
+        limiter.acquire()
+        limiter.release(latency, error=index < errors)
+
+
+def test_limit_grows_by_one_when_requests_waited_for_a_slot():
+    limiter = concurrency.AdaptiveLimiter(initial=1, max_limit=4, window=2)
+    limiter.acquire()
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    while limiter._waiting == 0:
+        time.sleep(0.001)
+
+    limiter.release(0.01)
+    waiter.join(timeout=5)
+    limiter.release(0.01)
+
+    assert limiter.limit == 2
+
+
+def test_limit_stays_when_no_request_waited():
+    limiter = concurrency.AdaptiveLimiter(initial=4, window=5)
+    run_window(limiter, 0.01)
+
+    assert limiter.limit == 4
+
+
+def test_slow_window_cuts_the_limit():
+    limiter = concurrency.AdaptiveLimiter(initial=10, target_p95=0.5, window=5, backoff=0.7)
+    run_window(limiter, 1.0)
+
+    assert int(limiter.limit) == 7
+    assert limiter.last_p95 == 1.0
+
+
+def test_errors_cut_the_limit_but_never_below_min():
+    limiter = concurrency.AdaptiveLimiter(initial=2, min_limit=1, window=4, max_error_rate=0.05, backoff=0.5)
+    run_window(limiter, 0.01, errors=1)
+    run_window(limiter, 0.01, errors=1)
+
+    assert limiter.limit == 1
+
+
+def test_first_429_cuts_at_once_then_once_per_limit_of_requests():
+    limiter = concurrency.AdaptiveLimiter(initial=10, backoff=0.5)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.01, throttled=True)
+
+    assert limiter.limit == 5
+    assert limiter.throttled == 3
+
+
+def test_limiter_stats_are_totals_of_every_run():
+    limiter = concurrency.AdaptiveLimiter(initial=3)
+    limiter.acquire()
+    limiter.release(0.01, error=True)
+    limiter.acquire()
+    limiter.release(0.01)
+
+    stats = limiter.stats()
+
+    assert (stats['limit'], stats['requests'], stats['errors'], stats['throttled']) == (3, 2, 1, 0)
+
+
+def test_each_thread_counts_in_its_own_run_meter():
+    session = ScriptedSession(200, 500, 200)
+    limited = concurrency.LimitedSession(session, concurrency.AdaptiveLimiter(initial=4))
+    first, second = concurrency.RunMeter(), concurrency.RunMeter()
+
+    def run(meter, count):
+        concurrency.set_meter(meter)
+        for _ in range(count):
+            limited.get('http://netbox/api/')
+
+    thread = threading.Thread(target=run, args=(second, 1))
+    thread.start()
+    thread.join()
+    run(first, 2)
+    concurrency.set_meter(None)
+
+    assert (first.requests, second.requests) == (2, 1)
+    assert first.errors + second.errors == 1
+    assert first.requests_per_second() > 0
+    assert limited.limiter.requests == 3
+
+
+def test_run_meter_records_gauges_and_counters():
+    limiter = concurrency.AdaptiveLimiter(initial=5)
+    meter = concurrency.RunMeter()
+    meter.begin()
+    meter.end(throttled=True)
+    report = RunReport()
+
+    meter.record(report, limiter)
+
+    assert report.gauges['netbox_concurrency_limit'] == 5
+    assert report.gauges['netbox_requests_per_second'] > 0
+    assert (report.counters['netbox_requests'], report.counters['netbox_throttled']) == (1, 1)
+
+
+def test_retry_after_header_else_exponential():
+    assert concurrency.retry_after(Response(429, {'Retry-After': '3'}), 0) == 3.0
+    assert concurrency.retry_after(Response(429, {'Retry-After': '3600'}), 0) == 60.0
+    assert concurrency.retry_after(Response(429), 2) == 2.0
+
+
+def test_limited_session_retries_429_and_frees_its_slots():
+    session = ScriptedSession(429, 200)
+    limited = concurrency.LimitedSession(session, concurrency.AdaptiveLimiter(initial=2))
+
+    response = limited.get('http://netbox/api/dcim/devices/')
+
+    assert response.status_code == 200
+    assert session.calls == 2
+    assert limited.limiter.in_flight == 0
+    assert limited.limiter.throttled == 1
+
+
+def test_limited_session_gives_up_after_max_retries():
+    session = ScriptedSession(429, 429, 429)
+    limited = concurrency.LimitedSession(session, concurrency.AdaptiveLimiter(), max_retries=2)
+
+    assert limited.get('http://netbox/api/').status_code == 429
+    assert session.calls == 3
+
+
+def test_limited_session_passes_attributes_through():
+    session = ScriptedSession()
+    limited = concurrency.LimitedSession(session, concurrency.AdaptiveLimiter())
+    limited.verify = False
+
+    assert session.verify is False
+    assert limited.headers is session.headers
+
+
+def test_merged_reports_keep_the_highest_gauge_and_add_counters():
+    shards = []
+    for limit in (8, 6, 8, 3):
+        report = RunReport()
+        report.gauge('netbox_concurrency_limit', limit)
+        report.count('netbox_requests', 10)
+        shards.append(report)
+    merged = RunReport()
+
+    for report in shards:
+        merged.merge(report)
+
+    assert merged.gauges['netbox_concurrency_limit'] == 8
+    assert merged.counters['netbox_requests'] == 40
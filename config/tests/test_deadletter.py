@@ -0,0 +1,52 @@
+import pytest
+
+import deadletter
+
+
+def test_entries_round_trip(tmp_path):
+    queue = deadletter.DeadLetterQueue(str(tmp_path / 'deadletter.ndjson'))
+    queue.add('device', {'name': 'vm1'}, ValueError('500 Internal Server Error'))
+
+    [entry] = queue.entries()
+
+    assert (entry['kind'], entry['payload'], entry['attempts']) == ('device', {'name': 'vm1'}, 1)
+    assert entry['error'] == '500 Internal Server Error'
+
+
+def test_too_many_failures_abort(tmp_path):
+    queue = deadletter.DeadLetterQueue(str(tmp_path / 'deadletter.ndjson'), max_failures=1)
+    queue.add('device', {}, 'error')
+
+    with pytest.raises(deadletter.TooManyFailures):
+        queue.add('device', {}, 'error')
+
+
+def test_replay_keeps_only_the_entries_still_failing(tmp_path):
+    queue = deadletter.DeadLetterQueue(str(tmp_path / 'deadletter.ndjson'))
+    queue.add('device', {'name': 'ok'}, 'error')
+    queue.add('device', {'name': 'broken'}, 'error')
+    queue.add('vnet', {'name': 'vnet1'}, 'error')
+    calls = []
+
+    def sync_device(payload):
+        calls.append(payload['name'])
+        if payload['name'] == 'broken':
+            raise RuntimeError('still failing')
+
+    replayed, failing = deadletter.replay(queue, {'device': sync_device}, retries=2, base_delay=0)
+
+    assert (replayed, failing) == (1, 2)
+    assert calls == ['ok', 'broken', 'broken']
+    remaining = {entry['payload']['name']: entry for entry in queue.entries()}
+    assert remaining['broken']['attempts'] == 3
+    assert remaining['broken']['error'] == 'still failing'
+    assert 'vnet1' in remaining  # no handler: kept as is
+
+
+def test_replay_removes_the_file_once_everything_went_through(tmp_path):
+    path = tmp_path / 'deadletter.ndjson'
+    queue = deadletter.DeadLetterQueue(str(path))
+    queue.add('device', {'name': 'vm1'}, 'error')
+
+    assert deadletter.replay(queue, {'device': lambda payload: None}) == (1, 0)
+    assert not path.exists()
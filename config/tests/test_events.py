@@ -0,0 +1,88 @@
+import events
+
+SUBSCRIPTION = '00000000-0000-0000-0000-000000000001'
+VNET_ID = f'/subscriptions/{SUBSCRIPTION}/resourceGroups/rg-net/providers/Microsoft.Network/virtualNetworks/vnet1'
+SUBNET_ID = f'{VNET_ID}/subnets/snet1'
+
+
+def change(resource_id, action='write'):
+    return events.ResourceChange(resource_id, events.resource_kind(resource_id), action, SUBSCRIPTION)
+
+
+def test_parse_event_grid_write_and_delete():
+    write = events.parse_event({'eventType': 'Microsoft.Resources.ResourceWriteSuccess',
+                                'data': {'resourceUri': SUBNET_ID}, 'eventTime': '2026-01-01T00:00:00Z'})
+    delete = events.parse_event({'type': 'Microsoft.Resources.ResourceDeleteSuccess', 'subject': VNET_ID})
+
+    assert (write.kind, write.action, write.subscription_id) == ('subnet', 'write', SUBSCRIPTION)
+    assert (delete.kind, delete.action) == ('vnet', 'delete')
+
+
+def test_parse_event_ignores_other_resources_and_actions():
+    storage = f'/subscriptions/{SUBSCRIPTION}/resourceGroups/rg/providers/Microsoft.Storage/storageAccounts/st1'
+
+    assert events.parse_event({'eventType': 'Microsoft.Resources.ResourceWriteSuccess',
+                               'data': {'resourceUri': storage}}) is None
+    assert events.parse_event({'eventType': 'Microsoft.Resources.ResourceActionSuccess',
+                               'data': {'resourceUri': VNET_ID}}) is None
+
+
+def test_resource_kind_is_case_insensitive():
+    assert events.resource_kind(VNET_ID.upper()) == 'vnet'
+
+
+def test_changes_are_keyed_case_insensitively_and_the_last_action_wins():
+    coalescer = events.Coalescer()
+    coalescer.add(change(VNET_ID), now=100)
+    coalescer.add(change(VNET_ID.lower(), 'delete'), now=101)
+
+    drained = coalescer.drain()
+
+    assert len(drained) == 1
+    assert (drained[0].action, drained[0].count) == ('delete', 2)
+    assert coalescer.pending == {}
+
+
+def test_ready_after_the_quiet_period_or_the_max_delay():
+    coalescer = events.Coalescer(debounce=30, max_delay=300)
+    assert not coalescer.ready(now=100)
+
+    coalescer.add(change(VNET_ID), now=100)
+    assert not coalescer.ready(now=129)
+    assert coalescer.ready(now=130)
+
+    for now in range(100, 400, 20):
+        coalescer.add(change(SUBNET_ID), now=now)
+    assert coalescer.ready(now=400)
+
+
+def test_vnet_write_absorbs_its_subnet_changes():
+    coalescer = events.Coalescer()
+    coalescer.add(change(SUBNET_ID), now=100)
+    coalescer.add(change(VNET_ID), now=101)
+
+    drained = coalescer.drain()
+
+    assert [(c.kind, c.count) for c in drained] == [('vnet', 2)]
+
+
+def test_subnet_change_is_kept_when_its_vnet_is_deleted():
+    coalescer = events.Coalescer()
+    coalescer.add(change(SUBNET_ID, 'delete'), now=100)
+    coalescer.add(change(VNET_ID, 'delete'), now=101)
+
+    assert sorted(c.kind for c in coalescer.drain()) == ['subnet', 'vnet']
+
+
+def test_requeued_changes_keep_their_counts_and_newer_changes_win():
+    coalescer = events.Coalescer(debounce=30)
+    coalescer.add(change(VNET_ID), now=100)
+    coalescer.add(change(SUBNET_ID, 'delete'), now=100)
+    drained = coalescer.drain()
+    coalescer.add(change(VNET_ID, 'delete'), now=110)
+
+    coalescer.requeue(drained, now=120)
+
+    assert not coalescer.ready(now=149)
+    assert coalescer.ready(now=150)
+    assert {c.kind: (c.action, c.count) for c in coalescer.drain()} == {'vnet': ('delete', 3)}
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import lease as leases
+
+
+class ScriptedLease(leases.Lease):
+    """Lease whose renewals answer from a list (True, False or an exception)"""
+
+    def __init__(self, renewals, ttl=0.03):
+        super().__init__('scripted', ttl)
+        self.renewals = list(renewals)
+        self.released = False
+
+    def _try_acquire(self):
+        return True
+
+    def _renew(self):
+        result = self.renewals.pop(0) if self.renewals else True
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _release(self):
+        self.released = True
+
+
+def test_lease_base_is_abstract():
+    with pytest.raises(TypeError):
+        leases.Lease('name')
+
+
+def test_file_lease_is_exclusive_and_records_its_holder(tmp_path):
+    path = str(tmp_path / 'sync.lock')
+    first = leases.FileLease(path).acquire()
+    try:
+        with pytest.raises(leases.LeaseHeld):
+            leases.FileLease(path).acquire(wait=0)
+        assert json.loads(open(path).read())['owner'] == first.owner
+    finally:
+        first.release()
+
+    with leases.FileLease(path).acquire() as second:
+        second.check()
+
+
+def test_taken_over_lease_raises_on_check_and_is_not_released():
+    lease = ScriptedLease([False]).acquire()
+    lease._heartbeat.join(timeout=5)
+
+    with pytest.raises(leases.LeaseLost):
+        lease.check()
+    lease.release()
+    assert not lease.released
+
+
+def test_lease_not_renewed_for_ttl_is_given_up():
+    lease = ScriptedLease([OSError('netbox down')] * 10).acquire()
+    lease._heartbeat.join(timeout=5)
+
+    assert lease.lost
+
+
+def test_released_lease_stops_its_heartbeat():
+    lease = ScriptedLease([], ttl=60).acquire()
+    lease.release()
+
+    assert lease.released
+    assert not lease._heartbeat.is_alive()
+    lease.check()
+
+
+def test_open_lease_backends(tmp_path):
+    assert isinstance(leases.open_lease({'path': str(tmp_path / 'lock')}), leases.FileLease)
+    assert isinstance(leases.open_lease({'backend': 'netbox'}, nb=object()), leases.NetboxLease)
+    with pytest.raises(ValueError):
+        leases.open_lease({'backend': 'redis'})
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+
+import pytest
+
+import plan as planning
+from conftest import FakeRecord
+from lease import LeaseLost
+from runreport import RunReport
+
+
+class FakeEndpoint:
+    """Bulk create/update/delete of one Netbox endpoint, logged in call order"""
+
+    def __init__(self, kind, calls, ids):
+        self.kind = kind
+        self.calls = calls
+        self.ids = ids
+
+    def create(self, items):
+        self.calls.append(('create', self.kind, items))
+        return [SimpleNamespace(id=next(self.ids)) for _ in items]
+
+    def update(self, items):
+        self.calls.append(('update', self.kind, items))
+
+    def delete(self, ids):
+        self.calls.append(('delete', self.kind, ids))
+
+
+def fake_netbox():
+    calls, ids = [], iter(range(100, 1000))
+    nb = SimpleNamespace(calls=calls)
+    for kind, (app, name) in planning.ENDPOINTS.items():
+        if not hasattr(nb, app):
+            setattr(nb, app, SimpleNamespace())
+        setattr(getattr(nb, app), name, FakeEndpoint(kind, calls, ids))
+    return nb
+
+
+class LostLease:
+    def check(self):
+        raise LeaseLost('taken over')
+
+
+def test_create_is_planned_once_per_key():
+    plan = planning.Plan('https://netbox/api')
+
+    first = plan.create('sites', 'Azure-westeurope', {'name': 'Azure-westeurope'})
+    again = plan.create('sites', 'Azure-westeurope', {'description': 'Azure Region: westeurope'})
+
+    assert first == again == -1
+    assert plan.ops[0]['data'] == {'name': 'Azure-westeurope', 'description': 'Azure Region: westeurope'}
+    assert plan.summary['sites']['create'] == 1
+    assert plan.planned('sites', 'Azure-westeurope') == -1
+
+
+def test_ensure_uses_the_existing_lookup_id():
+    plan = planning.Plan('https://netbox/api', lookups={kind: {} for kind in planning.LOOKUP_KEYS})
+    plan.lookups['tags']['azure-sync'] = 4
+
+    assert plan.ensure('tags', 'azure-sync', {'slug': 'azure-sync'}) == 4
+    assert plan.ops == []
+
+
+def test_update_plans_only_real_changes():
+    plan = planning.Plan('https://netbox/api')
+    record = FakeRecord(42, description='same', tags=[1])
+
+    assert plan.update('prefixes', record, {'description': 'same'}) == 42
+    plan.update('prefixes', record, {'description': 'new'})
+
+    assert plan.summary['prefixes'] == {'create': 0, 'update': 1, 'delete': 0, 'unchanged': 1}
+    assert plan.ops == [{'op': 'update', 'kind': 'prefixes', 'stage': planning.STAGES['prefixes'], 'id': 42,
+                         'data': {'description': 'new'}}]
+
+
+def test_apply_runs_stages_in_dependency_order_and_resolves_placeholders():
+    plan = planning.Plan('https://netbox/api')
+    plan.delete('prefixes', 7)
+    tag = plan.create('tags', 'azure-sync', {'slug': 'azure-sync'})
+    site = plan.create('sites', 'Azure-westeurope', {'name': 'Azure-westeurope', 'tags': [{'id': tag}]})
+    device = plan.create('devices', ('vm1', site), {'name': 'vm1', 'site': site, 'tags': [{'id': tag}]})
+    plan.update('devices', FakeRecord(9, site=1), {'site': site})
+    plan.create('interfaces', (device, 'eth0'), {'device': device, 'name': 'eth0'})
+    nb = fake_netbox()
+    report = RunReport()
+
+    ids = planning.apply(nb, plan.to_dict(), report=report)
+
+    assert [(action, kind) for action, kind, _ in nb.calls] == [
+        ('create', 'tags'), ('create', 'sites'), ('create', 'devices'), ('update', 'devices'),
+        ('create', 'interfaces'), ('delete', 'prefixes')]
+    assert ids == {tag: 100, site: 101, device: 102, -4: 103}
+    assert nb.calls[1][2] == [{'name': 'Azure-westeurope', 'tags': [{'id': 100}]}]
+    assert nb.calls[2][2] == [{'name': 'vm1', 'site': 101, 'tags': [{'id': 100}]}]
+    assert nb.calls[3][2] == [{'site': 101, 'id': 9}]
+    assert nb.calls[4][2] == [{'device': 102, 'name': 'eth0'}]
+    assert nb.calls[5][2] == [7]
+    assert report.counters['devices_created'] == 1
+    assert report.counters['prefixes_deleted'] == 1
+
+
+def test_apply_leaves_non_reference_negative_values_alone():
+    plan = planning.Plan('https://netbox/api')
+    plan.create('custom_fields', 'ips_used', {'name': 'ips_used', 'validation_minimum': -1})
+    nb = fake_netbox()
+
+    planning.apply(nb, plan.to_dict())
+
+    assert nb.calls[0][2] == [{'name': 'ips_used', 'validation_minimum': -1}]
+
+
+def test_apply_batches_each_op_and_kind():
+    plan = planning.Plan('https://netbox/api')
+    for index in range(5):
+        plan.create('tags', f'tag-{index}', {'slug': f'tag-{index}'})
+    nb = fake_netbox()
+
+    planning.apply(nb, plan.to_dict(), batch_size=2)
+
+    assert [len(items) for _, _, items in nb.calls] == [2, 2, 1]
+
+
+def test_apply_stops_before_the_next_batch_once_the_lease_is_lost():
+    plan = planning.Plan('https://netbox/api')
+    plan.create('tags', 'azure-sync', {'slug': 'azure-sync'})
+    nb = fake_netbox()
+
+    with pytest.raises(LeaseLost):
+        planning.apply(nb, plan.to_dict(), lease=LostLease())
+    assert nb.calls == []
+
+
+def test_saved_plan_loads_back(tmp_path):
+    plan = planning.Plan('https://netbox/api')
+    plan.create('tags', 'azure-sync', {'slug': 'azure-sync'})
+    path = str(tmp_path / 'plan.json.gz')
+
+    plan.save(path)
+    loaded = planning.load(path)
+
+    assert loaded['ops'] == plan.ops
+    assert loaded['netbox'] == 'https://netbox/api'
+
+
+def test_load_rejects_another_plan_version(tmp_path):
+    path = tmp_path / 'plan.json'
+    path.write_text('{"version": 0, "ops": []}')
+
+    with pytest.raises(ValueError):
+        planning.load(str(path))
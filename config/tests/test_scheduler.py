@@ -0,0 +1,107 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import scheduler
+from runreport import RunReport
+
+
+def environment_of(name):
+    for environment in ('prd', 'uat', 'dev'):
+        if environment in name:
+            return environment
+    return None
+
+
+def subscription(subscription_id, name):
+    return SimpleNamespace(subscription_id=subscription_id, display_name=name)
+
+
+def make_schedule(tmp_path, history=None, pending=(), **schedule_config):
+    path = tmp_path / 'schedule.json'
+    if history is not None:
+        path.write_text(json.dumps({'subscriptions': history, 'pending': list(pending)}))
+    return scheduler.Schedule(str(path), schedule_config, environment_of)
+
+
+@pytest.fixture
+def subscriptions():
+    return [subscription('dev-1', 'sub-dev-1'), subscription('prd-1', 'sub-prd-1'),
+            subscription('uat-1', 'sub-uat-1')]
+
+
+def test_select_orders_by_priority_without_budget(tmp_path, subscriptions):
+    schedule = make_schedule(tmp_path)
+
+    selected = schedule.select(subscriptions)
+
+    assert [sub.subscription_id for sub in selected] == ['prd-1', 'uat-1', 'dev-1']
+
+
+def test_overrides_beat_the_environment_priority(tmp_path, subscriptions):
+    schedule = make_schedule(tmp_path, overrides={'sub-dev-1': 500})
+
+    assert schedule.select(subscriptions)[0].subscription_id == 'dev-1'
+
+
+def test_recent_change_raises_the_value(tmp_path):
+    now = time.time()
+    history = {'a': {'synced_at': now, 'changed_at': now}, 'b': {'synced_at': now}}
+    schedule = make_schedule(tmp_path, history)
+
+    assert schedule.value('a', 'sub-dev-a', now) == pytest.approx(2 * schedule.value('b', 'sub-dev-b', now))
+
+
+def test_budget_carries_over_what_does_not_fit(tmp_path, subscriptions):
+    history = {'prd-1': {'duration': 60}, 'uat-1': {'duration': 60}, 'dev-1': {'duration': 30}}
+    schedule = make_schedule(tmp_path, history, budget=100)
+    report = RunReport()
+
+    selected = schedule.select(subscriptions, report)
+
+    assert [sub.subscription_id for sub in selected] == ['prd-1', 'dev-1']
+    assert schedule.pending == ['uat-1']
+    assert report.counters['subscriptions_deferred'] == 1
+    assert json.loads((tmp_path / 'schedule.json').read_text())['pending'] == ['uat-1']
+
+
+def test_carried_over_subscriptions_go_first(tmp_path, subscriptions):
+    history = {'prd-1': {'duration': 60}, 'uat-1': {'duration': 60}, 'dev-1': {'duration': 30}}
+    schedule = make_schedule(tmp_path, history, pending=['uat-1'], budget=100)
+
+    selected = schedule.select(subscriptions)
+
+    assert [sub.subscription_id for sub in selected] == ['uat-1', 'dev-1']
+
+
+def test_an_oversized_first_subscription_still_runs(tmp_path, subscriptions):
+    schedule = make_schedule(tmp_path, {'prd-1': {'duration': 500}}, budget=100, default_duration=60)
+
+    selected = schedule.select(subscriptions)
+
+    assert [sub.subscription_id for sub in selected] == ['prd-1']
+
+
+def test_estimate_falls_back_to_the_median_then_the_default(tmp_path):
+    assert make_schedule(tmp_path, default_duration=42).estimate('new') == 42
+    schedule = make_schedule(tmp_path, {'a': {'duration': 10}, 'b': {'duration': 30}, 'c': {'duration': 50}})
+    assert schedule.estimate('a') == 10
+    assert schedule.estimate('new') == 30
+
+
+def test_defer_keeps_pending_unique(tmp_path):
+    schedule = make_schedule(tmp_path, {}, pending=['a'])
+
+    schedule.defer(['a', 'b'])
+
+    assert schedule.pending == ['a', 'b']
+
+
+def test_budget_expiry(tmp_path):
+    schedule = make_schedule(tmp_path, budget=10)
+    assert not schedule.expired()
+    schedule.started_at -= 10
+    assert schedule.expired()
+    assert not make_schedule(tmp_path).expired()
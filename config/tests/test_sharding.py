@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+import sharding
+
+SUBSCRIPTION_IDS = [f'{index:08x}-0000-0000-0000-000000000000' for index in range(400)]
+
+
+def test_every_key_has_one_shard_and_the_same_one_each_time():
+    ring = sharding.HashRing(4)
+
+    shards = [ring.shard_of(key) for key in SUBSCRIPTION_IDS]
+
+    assert set(shards) == {0, 1, 2, 3}
+    assert shards == [sharding.HashRing(4).shard_of(key) for key in SUBSCRIPTION_IDS]
+
+
+def test_subscription_ids_are_case_insensitive():
+    ring = sharding.HashRing(8)
+
+    assert all(ring.shard_of(key) == ring.shard_of(key.upper()) for key in SUBSCRIPTION_IDS)
+
+
+def test_adding_a_shard_moves_about_one_nth_of_the_keys():
+    before, after = sharding.HashRing(4), sharding.HashRing(5)
+
+    moved = sum(before.shard_of(key) != after.shard_of(key) for key in SUBSCRIPTION_IDS)
+
+    assert moved < len(SUBSCRIPTION_IDS) * 0.4
+
+
+def test_select_splits_subscriptions_without_overlap():
+    subscriptions = [SimpleNamespace(subscription_id=key) for key in SUBSCRIPTION_IDS]
+
+    shards = [sharding.select(subscriptions, index, 3) for index in range(3)]
+
+    assert sorted(sub.subscription_id for shard in shards for sub in shard) == sorted(SUBSCRIPTION_IDS)
+
+
+def test_parse_shard():
+    assert sharding.parse_shard('1/4') == (1, 4)
+    for value in ('4/4', '-1/4', '1', 'a/b', '0/0'):
+        with pytest.raises(ValueError):
+            sharding.parse_shard(value)
+    with pytest.raises(ValueError):
+        sharding.HashRing(0)
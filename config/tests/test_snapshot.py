@@ -0,0 +1,72 @@
+import snapshot
+
+SUBSCRIPTION = '00000000-0000-0000-0000-000000000001'
+RG = f'/subscriptions/{SUBSCRIPTION}/resourceGroups/rg-app'
+
+
+def inventory(devices):
+    return {
+        'subscription_id': SUBSCRIPTION,
+        'subscription_name': 'sub-prd-app',
+        'vnets': [{
+            'name': 'vnet1', 'id': f'{RG}/providers/Microsoft.Network/virtualNetworks/vnet1',
+            'resource_group': 'rg-app', 'location': 'westeurope', 'address_space': ['10.0.0.0/16'],
+            'subnets': [{
+                'name': 'snet1', 'id': f'{RG}/providers/Microsoft.Network/virtualNetworks/vnet1/subnets/snet1',
+                'address_prefix': '10.0.1.0/24',
+                'devices': [{'name': name, 'id': f'{RG}/providers/Microsoft.Compute/virtualMachines/{name}',
+                             'type': 'vm', 'ip_address': ip, 'mac_address': None, 'resource_group': 'rg-app',
+                             'location': 'westeurope', 'os_type': 'Linux'} for name, ip in devices],
+            }],
+        }],
+    }
+
+
+def write(path, subscription_data):
+    with snapshot.SnapshotWriter(str(path)) as writer:
+        writer.write_subscription(subscription_data)
+    return str(path)
+
+
+def test_snapshot_reads_back_what_discovery_built(tmp_path):
+    data = inventory([('vm1', '10.0.1.4'), ('vm2', '10.0.1.5')])
+
+    for name in ('snap.ndjson', 'snap.ndjson.gz'):
+        [read] = snapshot.SnapshotReader(write(tmp_path / name, data)).subscriptions()
+        assert read == dict(data, management_group=None)
+
+
+def test_summary_counts_records(tmp_path):
+    path = write(tmp_path / 'snap.ndjson', inventory([('vm1', '10.0.1.4'), ('vm2', '10.0.1.5')]))
+
+    assert snapshot.summarize(path) == {'subscriptions': 1, 'vnets': 1, 'subnets': 1, 'devices': 2}
+
+
+def test_diff_lists_added_and_removed_devices(tmp_path):
+    old = write(tmp_path / 'old.ndjson', inventory([('vm1', '10.0.1.4'), ('vm2', '10.0.1.5')]))
+    new = write(tmp_path / 'new.ndjson.gz', inventory([('vm2', '10.0.1.5'), ('vm3', '10.0.1.6')]))
+
+    assert snapshot.diff(old, new) == {
+        'prefixes_added': [],
+        'prefixes_removed': [],
+        'devices_added': ['vm3 10.0.1.6'],
+        'devices_removed': ['vm1 10.0.1.4'],
+    }
+
+
+def test_diff_lists_prefix_changes(tmp_path):
+    old_data = inventory([])
+    new_data = inventory([])
+    new_data['vnets'][0]['address_space'] = ['10.0.0.0/16', '10.1.0.0/16']
+    new_data['vnets'][0]['subnets'][0]['address_prefix'] = '10.0.2.0/24'
+
+    result = snapshot.diff(write(tmp_path / 'old.ndjson', old_data), write(tmp_path / 'new.ndjson', new_data))
+
+    assert result['prefixes_added'] == ['10.0.2.0/24', '10.1.0.0/16']
+    assert result['prefixes_removed'] == ['10.0.1.0/24']
+
+
+def test_shard_path_keeps_the_extension():
+    assert snapshot.shard_path('snaps/inventory-20260101.ndjson.gz', (1, 4)) == \
+        'snaps/inventory-20260101.shard1-of-4.ndjson.gz'
+    assert snapshot.shard_path('inventory.ndjson', (0, 2)) == 'inventory.shard0-of-2.ndjson'
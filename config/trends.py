@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Capacity history of every prefix and exhaustion forecast.
+
+Each sync appends one (prefix, timestamp, used, available) row per VNet
+address space and subnet to a SQLite file. Rows older than `raw_days` are
+downsampled to the last sample of each day and dropped after
+`retention_days`. The report fits a least-squares line of `used` over time
+for all prefixes at once (one aggregate query) and projects the date at which
+the available IPs run out.
+
+CLI:
+    python trends.py report trends.sqlite [--window-days 30] [--top 20]
+    python trends.py report trends.sqlite --top 20 --write-netbox   (NETBOX_URL / NETBOX_TOKEN)
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    prefix TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    used INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    PRIMARY KEY (prefix, ts)
+) WITHOUT ROWID
+"""
+
+def connect(path):
+    # Shard workers may record at the same time: wait for the write lock
+    db = sqlite3.connect(path, timeout=30)
+    db.execute(SCHEMA)
+    return db
+
+def usage_rows(all_network_data):
+    """(prefix, used, available) of every address space and subnet of a run"""
+    from capacity import vnet_usage
+
+    rows = {}
+    for subscription_data in all_network_data:
+        for vnet in subscription_data['vnets']:
+            spaces, subnets = vnet_usage(vnet)
+            for prefix, usage in {**spaces, **subnets}.items():
+                rows[prefix] = (prefix, usage['used'], usage['available'])
+    return list(rows.values())
+
+def record(path, all_network_data, raw_days=7, retention_days=365, now=None):
+    """Append the usage of one run, then apply the downsampling/retention policy"""
+    now = int(now or time.time())
+    rows = usage_rows(all_network_data)
+    db = connect(path)
+    with db:
+        db.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)",
+                       [(prefix, now, used, available) for prefix, used, available in rows])
+        db.execute("DELETE FROM samples WHERE ts < ?", (now - retention_days * DAY,))
+        # Older than raw_days: keep only the last sample of each prefix and day
+        db.execute("""
+            DELETE FROM samples WHERE ts < :cutoff AND ts NOT IN (
+                SELECT MAX(ts) FROM samples AS s
+                WHERE s.prefix = samples.prefix AND s.ts / :day = samples.ts / :day
+            )""", {'cutoff': now - raw_days * DAY, 'day': DAY})
+    db.close()
+    logger.info(f"Recorded capacity of {len(rows)} prefixes to {path}")
+    return len(rows)
+
+def forecast(path, window_days=30, now=None):
+    """
+    Growth (IPs/day) and projected exhaustion of every prefix over the last
+    window_days, from per-prefix regression sums computed in a single query.
+    Sorted by days left (prefixes that are not growing last).
+    """
+    now = int(now or time.time())
+    db = connect(path)
+    try:
+        rows = db.execute("""
+            WITH recent AS (
+                SELECT prefix, (ts - :start) / 86400.0 AS t, used, ts
+                FROM samples WHERE ts >= :start
+            )
+            SELECT prefix, COUNT(*), SUM(t), SUM(used), SUM(t * t), SUM(t * used), MAX(ts),
+                   (SELECT used FROM samples s WHERE s.prefix = recent.prefix ORDER BY ts DESC LIMIT 1),
+                   (SELECT available FROM samples s WHERE s.prefix = recent.prefix ORDER BY ts DESC LIMIT 1)
+            FROM recent GROUP BY prefix
+        """, {'start': now - window_days * DAY}).fetchall()
+    finally:
+        db.close()
+
+    results = []
+    for prefix, n, st, su, stt, stu, last_ts, used, available in rows:
+        denominator = n * stt - st * st
+        growth = (n * stu - st * su) / denominator if n > 1 and denominator else 0.0
+        days_left = available / growth if growth > 0 else None
+        results.append({
+            'prefix': prefix,
+            'samples': n,
+            'used': used,
+            'available': available,
+            'growth_per_day': round(growth, 3),
+            'days_left': round(days_left, 1) if days_left is not None else None,
+            'exhaustion_date': time.strftime('%Y-%m-%d', time.localtime(last_ts + days_left * DAY))
+                               if days_left is not None else None,
+        })
+    results.sort(key=lambda r: (r['days_left'] is None, r['days_left'] or 0, -r['used']))
+    return results
+
+def forecast_text(result):
+    return f"⏳ {result['exhaustion_date']} (+{result['growth_per_day']}/j, {result['days_left']} j)"
+
+def write_netbox(nb, at_risk, field_name):
+    """Bulk-write the forecast of the at-risk prefixes and clear it on the others"""
+    wanted = {r['prefix']: forecast_text(r) for r in at_risk}
+    updates = []
+    if wanted:
+        for prefix in nb.ipam.prefixes.filter(prefix=list(wanted)):
+            if (prefix.custom_fields or {}).get(field_name) != wanted[str(prefix.prefix)]:
+                updates.append({'id': prefix.id, 'custom_fields': {field_name: wanted[str(prefix.prefix)]}})
+    for prefix in nb.ipam.prefixes.filter(**{f"cf_{field_name}__empty": False}):
+        if str(prefix.prefix) not in wanted:
+            updates.append({'id': prefix.id, 'custom_fields': {field_name: None}})
+    if updates:
+        nb.ipam.prefixes.update(updates)
+    return len(updates)
+
+def main():
+    parser = argparse.ArgumentParser(description='Capacity trends recorded by azure-sync.py (trends.path)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    report_parser = sub.add_parser('report', help='Growth rate and projected exhaustion date per prefix')
+    report_parser.add_argument('db')
+    report_parser.add_argument('--window-days', type=int, default=30, help='Regression window (default: 30)')
+    report_parser.add_argument('--top', type=int, default=20, help='Number of at-risk prefixes (default: 20)')
+    report_parser.add_argument('--json', action='store_true', help='Print the full forecast as JSON')
+    report_parser.add_argument('--write-netbox', action='store_true',
+                               help='Write the top-N forecast to a prefix custom field (NETBOX_URL/NETBOX_TOKEN)')
+    report_parser.add_argument('--field', default='capacity_forecast', help='Custom field (default: capacity_forecast)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+    start = time.perf_counter()
+    results = forecast(args.db, args.window_days)
+    at_risk = [r for r in results if r['days_left'] is not None][:args.top]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'Prefix':<20} {'Used':>8} {'Avail':>8} {'IPs/day':>8} {'Days left':>10}  Exhaustion")
+        for r in at_risk:
+            print(f"{r['prefix']:<20} {r['used']:>8} {r['available']:>8} {r['growth_per_day']:>8} "
+                  f"{r['days_left']:>10}  {r['exhaustion_date']}")
+    print(f"({len(results)} prefixes, {len(at_risk)} growing, {time.perf_counter() - start:.2f}s)", file=sys.stderr)
+
+    if args.write_netbox:
+        import pynetbox
+
+        url, token = os.environ.get('NETBOX_URL'), os.environ.get('NETBOX_TOKEN')
+        if not url or not token:
+            print("NETBOX_URL and NETBOX_TOKEN must be set", file=sys.stderr)
+            sys.exit(2)
+        updated = write_netbox(pynetbox.api(url, token=token), at_risk, args.field)
+        print(f"Updated {updated} prefixes in Netbox", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
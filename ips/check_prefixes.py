@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# check_prefixes.py
+# Vérifie que chaque prefix NetBox a l'ID attendu (remplace la boucle curl + jq de scan/check.md).
+#
+# Fichier d'entrée: une ligne "prefix,expected_id" par prefix (lignes vides et # ignorées)
+#   10.2.0.0/15,150
+#   192.168.1.0/24,200
+#
+# Tous les prefixes sont résolus en quelques requêtes groupées (?prefix=a&prefix=b&...),
+# indexés en mémoire, puis le tableau, le log texte et le JSON sont écrits en une passe.
+#
+#   export NETBOX_URL="https://ton-netbox"
+#   export NETBOX_TOKEN="xxxxxxxxxxxxxxxx"
+#   python3 check_prefixes.py prefixes.csv [--workers 4] [--chunk-size 100]
+
+import os, sys, json, argparse, ipaddress, time
+from concurrent.futures import ThreadPoolExecutor
+import pynetbox
+
+GREEN = "\033[32m"
+RED = "\033[31m"
+YELLOW = "\033[33m"
+CYAN = "\033[36m"
+BOLD = "\033[1m"
+RESET = "\033[0m"
+
+def normalize(prefix):
+    try:
+        return str(ipaddress.ip_network(prefix, strict=False))
+    except ValueError:
+        return prefix
+
+def read_checks(path):
+    checks = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip().strip('"')
+            if not line or line.startswith("#"):
+                continue
+            prefix, sep, expected = line.partition(",")
+            if not sep:
+                print(f"[WARN] Ligne {lineno} ignorée (attendu 'prefix,expected_id'): {line}", file=sys.stderr)
+                continue
+            checks.append((prefix.strip(), expected.strip()))
+    return checks
+
+def fetch_ids(nb, prefixes, workers=4, chunk_size=100):
+    """{prefix: id du premier résultat} comme '.results[0].id' du checker bash"""
+    unique = sorted({normalize(p) for p in prefixes})
+    chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+
+    def query(chunk):
+        return [(p.prefix, p.id) for p in nb.ipam.prefixes.filter(prefix=chunk, brief=True)]
+
+    index = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # l'ordre NetBox (vrf, prefix) est conservé par requête: le premier match gagne
+        for results in pool.map(query, chunks):
+            for prefix, prefix_id in results:
+                index.setdefault(prefix, prefix_id)
+    return index, len(chunks)
+
+def evaluate(checks, index):
+    results = []
+    for prefix, expected in checks:
+        found = index.get(normalize(prefix))
+        if found is None:
+            status, result, found_id = "warning", "No result", "—"
+        elif str(found) == expected:
+            status, result, found_id = "ok", "OK", str(found)
+        else:
+            status, result, found_id = "error", "KO", str(found)
+        results.append({"prefix": prefix, "expected_id": expected, "found_id": found_id,
+                        "status": status, "result": result})
+    return results
+
+def print_table(results, color=True):
+    c = (lambda code: code) if color else (lambda code: "")
+    badges = {
+        "ok": f"✅ {c(GREEN)}OK{c(RESET)}",
+        "error": f"❌ {c(RED)}KO{c(RESET)}",
+        "warning": f"⚠️  {c(YELLOW)}No result{c(RESET)}",
+    }
+    lines = [f"\n{c(BOLD)}🔍 Checking NetBox prefixes...{c(RESET)}\n",
+             f"{c(BOLD)}{'Prefix':<20} {'Expected':<10} {'Found':<10} {'Result':<10}{c(RESET)}",
+             f"{'-' * 20} {'-' * 10} {'-' * 10} {'-' * 10}"]
+    for r in results:
+        lines.append(f"{r['prefix']:<20} {r['expected_id']:<10} {r['found_id']:<10} {badges[r['status']]}")
+    print("\n".join(lines))
+
+def write_log(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"NetBox Prefix ID Check - {time.strftime('%a %b %e %H:%M:%S %Y')}\n")
+        f.write("-------------------------------------\n")
+        for r in results:
+            f.write(f"{r['prefix']} | expected={r['expected_id']} | found={r['found_id']} | result={r['result']}\n")
+
+def write_json(path, results):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def main():
+    ap = argparse.ArgumentParser(description="Vérifie les IDs NetBox d'une liste de prefixes (requêtes groupées).")
+    ap.add_argument("checks", help="Fichier 'prefix,expected_id' (une ligne par prefix)")
+    ap.add_argument("--log", default="netbox_check.log", help="Log texte (défaut: netbox_check.log)")
+    ap.add_argument("--json", default="netbox_check.json", help="Rapport JSON (défaut: netbox_check.json)")
+    ap.add_argument("--workers", type=int, default=4, help="Requêtes NetBox en parallèle (défaut: 4)")
+    ap.add_argument("--chunk-size", type=int, default=100,
+                    help="Prefixes par requête, borne la longueur d'URL (défaut: 100)")
+    ap.add_argument("--no-color", action="store_true", help="Sortie terminal sans couleurs")
+    args = ap.parse_args()
+
+    NETBOX_URL = os.environ.get("NETBOX_URL")
+    NETBOX_TOKEN = os.environ.get("NETBOX_TOKEN")
+    if not NETBOX_URL or not NETBOX_TOKEN:
+        print("Erreur: définis NETBOX_URL et NETBOX_TOKEN dans l'environnement.", file=sys.stderr)
+        sys.exit(2)
+
+    checks = read_checks(args.checks)
+    if not checks:
+        print(f"Erreur: aucun prefix à vérifier dans {args.checks}", file=sys.stderr)
+        sys.exit(2)
+
+    nb = pynetbox.api(NETBOX_URL, token=NETBOX_TOKEN)
+    start = time.time()
+    index, requests = fetch_ids(nb, [prefix for prefix, _ in checks], args.workers, args.chunk_size)
+    results = evaluate(checks, index)
+
+    print_table(results, color=not args.no_color and sys.stdout.isatty())
+    write_log(args.log, results)
+    write_json(args.json, results)
+
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "error", "warning")}
+    c = CYAN if not args.no_color and sys.stdout.isatty() else ""
+    r = RESET if c else ""
+    print(f"\n{c}✨ Check complete.{r} ({len(results)} prefixes, {requests} requêtes, {time.time() - start:.1f}s: "
+          f"OK={counts['ok']} KO={counts['error']} No result={counts['warning']})")
+    print(f"📄 Text log saved to: {args.log}")
+    print(f"📊 JSON report saved to: {args.json}\n")
+
+if __name__ == "__main__":
+    main()
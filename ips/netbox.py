@@ -2,8 +2,14 @@
 # update_list_available_ips.py
 # Met à jour le CF "list_available_ips" (IPAM > Prefixes) à partir du CSV de azure-vnet-scan.sh.
 
-import os, sys, csv, argparse, ipaddress
-import pynetbox
+import os, sys, csv, argparse, importlib.util
+
+# Format du résumé défini une seule fois dans config/capacity.py (partagé avec azure-sync.py)
+_spec = importlib.util.spec_from_file_location(
+    "capacity", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "capacity.py"))
+capacity = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(capacity)
+make_summary = capacity.make_summary
 
 def to_int(s, default=0):
     try:
@@ -12,33 +18,6 @@ def to_int(s, default=0):
     except Exception:
         return default
 
-def fmt_int(n):
-    try:
-        n = int(n)
-    except Exception:
-        return "0"
-    return f"{n:,}".replace(",", " ")
-
-def avail_pct(prefix_cidr, ips_avail):
-    try:
-        net = ipaddress.ip_network(prefix_cidr, strict=False)
-    except Exception:
-        return None
-    if net.version == 6:
-        return None  # pas de % pour IPv6
-    usable = max(net.num_addresses - 5, 0)
-    if usable == 0:
-        return None
-    pct = max(0.0, min(100.0, (float(ips_avail) / float(usable)) * 100.0))
-    return round(pct, 1)
-
-def make_summary(prefix_cidr, nb_subnets, ips_used, ips_avail):
-    line = f"🧩 Subnets: {fmt_int(nb_subnets)} | 🔴 Utilisées: {fmt_int(ips_used)} | 🟢 Disponibles: {fmt_int(ips_avail)}"
-    pct = avail_pct(prefix_cidr, ips_avail)
-    if pct is not None:
-        line += f" | ⚖️ {pct}%"
-    return line
-
 def find_col(fieldnames, candidates):
     lower = { (fn or "").strip().lower(): fn for fn in fieldnames }
     for c in candidates:
@@ -54,6 +33,8 @@ def main():
     ap.add_argument("--dry-run", action="store_true", help="N'écrit rien dans NetBox; affiche ce qui serait fait.")
     args = ap.parse_args()
 
+    import pynetbox
+
     NETBOX_URL = os.environ.get("NETBOX_URL")
     NETBOX_TOKEN = os.environ.get("NETBOX_TOKEN")
     if not NETBOX_URL or not NETBOX_TOKEN: